@@ -406,12 +406,7 @@ class TeacherCreateStudentForm(UserCreationForm):
         if not user.username:
             from django.utils.text import slugify
             base_username = slugify(f"{user.first_name}_{user.last_name}")
-            unique_username = base_username
-            counter = 1
-            while User.objects.filter(username=unique_username).exists():
-                unique_username = f"{base_username}_{counter:03d}"
-                counter += 1
-            user.username = unique_username
+            user.username = User.generate_usernames([base_username], suffix='{base}_{num:03d}')[0]
         
         if commit:
             user.save()
@@ -452,4 +447,22 @@ class TeacherEditStudentForm(forms.ModelForm):
         username = self.cleaned_data.get('username')
         if username and User.objects.filter(username=username).exclude(pk=self.instance.pk).exists():
             raise forms.ValidationError('A user with this username already exists.')
-        return username
\ No newline at end of file
+        return username
+
+
+class StudentImportForm(forms.Form):
+    """Roster upload for teachers importing many students at once"""
+    roster = forms.FileField(
+        label='Student roster',
+        help_text='CSV or XLSX with columns first_name, last_name, email, password '
+                  '(optional: username, phone_number, date_of_birth, address)',
+        widget=forms.ClearableFileInput(attrs={'class': 'form-control', 'accept': '.csv,.xlsx'}),
+    )
+
+    def clean_roster(self):
+        roster = self.cleaned_data['roster']
+        if not roster.name.lower().endswith(('.csv', '.xlsx')):
+            raise forms.ValidationError('Upload a .csv or .xlsx file.')
+        if roster.size > settings.MAX_UPLOAD_SIZE:
+            raise forms.ValidationError('The roster file is too large.')
+        return roster
@@ -0,0 +1,73 @@
+"""
+Management command to import a teacher's students from a CSV/XLSX roster
+Usage: python manage.py import_students ROSTER --teacher EMAIL [--workers N] [--dry-run]
+
+Columns: first_name, last_name, email, password (optional: username,
+phone_number, date_of_birth, address). Nothing is created if any row fails
+validation.
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from accounts.models import User
+from accounts.services import StudentImportService
+
+
+class Command(BaseCommand):
+    help = 'Bulk-create student accounts for a teacher from a CSV or XLSX roster'
+
+    def add_arguments(self, parser):
+        parser.add_argument('roster', help='Path to a .csv or .xlsx roster')
+        parser.add_argument(
+            '--teacher',
+            required=True,
+            help='Email of the teacher who will manage the students',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.STUDENT_IMPORT_WORKERS,
+            help=f'Password hashing processes (default: {settings.STUDENT_IMPORT_WORKERS})',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Rows per bulk insert (default: 500)',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Validate the roster without creating anyone',
+        )
+
+    def handle(self, *args, **options):
+        try:
+            teacher = User.objects.get(email=options['teacher'], rank='teacher')
+        except User.DoesNotExist:
+            raise CommandError(f"No teacher with email {options['teacher']}")
+
+        try:
+            with open(options['roster'], 'rb') as roster:
+                rows = StudentImportService.read_rows(roster, options['roster'])
+        except (OSError, ValueError, UnicodeDecodeError) as e:
+            raise CommandError(f"Could not read {options['roster']}: {e}")
+
+        self.stdout.write(f"\n📋 Read {len(rows)} row(s) for {teacher.get_full_name()}\n")
+        stats = StudentImportService.import_students(
+            teacher,
+            rows,
+            workers=options['workers'],
+            batch_size=options['batch_size'],
+            dry_run=options['dry_run'],
+        )
+
+        for row, message in stats['errors']:
+            self.stdout.write(self.style.ERROR(f"   Row {row}: {message}"))
+        if stats['errors']:
+            raise CommandError(f"{len(stats['errors'])} problem(s) found; no students were imported")
+        if options['dry_run']:
+            self.stdout.write(self.style.WARNING(f"🔍 DRY RUN: {len(rows)} row(s) are valid"))
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Imported {stats['created']} student(s) in {stats['elapsed']:.2f}s"
+        ))
@@ -1,11 +1,17 @@
 """
 Management command to sync student registration_amount_required with system config
-Usage: python manage.py sync_registration_amounts
+Usage: python manage.py sync_registration_amounts [--dry-run] [--status STATUS] [--batch-size N]
+
+Statuses are recomputed in SQL with the same rules as
+User.update_registration_status (UserQuerySet.recompute_registration_status),
+one bulk UPDATE per batch of students.
 """
 from django.core.management.base import BaseCommand
-from django.db.models import Q
+from django.db import transaction
+from django.db.models import Count, Value
+from django.utils import timezone
 from decimal import Decimal
-from accounts.models import User
+from accounts.models import User, registration_status_expressions
 from payments.models import SystemConfiguration
 
 
@@ -23,96 +29,87 @@ class Command(BaseCommand):
             type=str,
             help='Only update students with specific status (e.g., pending_payment, partial_payment)',
         )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Students updated per UPDATE statement (default: 1000)',
+        )
 
     def handle(self, *args, **options):
         dry_run = options['dry_run']
         status_filter = options.get('status')
-        
+        batch_size = options['batch_size']
+
         # Get current system config
         system_config = SystemConfiguration.get_config()
         registration_fee = system_config.registration_fee if system_config else Decimal('500.00')
-        
+
         self.stdout.write(f"\n📋 Current system registration fee: ₱{registration_fee}\n")
-        
-        # Get students (exclude admins)
-        students = User.objects.filter(rank='scout')
-        
+
+        # Get students (exclude admins) whose registration_amount_required differs from system config
+        students = User.objects.filter(rank='scout').exclude(registration_amount_required=registration_fee)
+
         if status_filter:
             students = students.filter(registration_status=status_filter)
             self.stdout.write(f"🔍 Filtering by status: {status_filter}\n")
-        
-        # Filter students whose registration_amount_required differs from system config
-        students_to_update = []
-        for student in students:
-            if student.registration_amount_required != registration_fee:
-                students_to_update.append(student)
-        
-        if not students_to_update:
+
+        now = timezone.now()
+        new_status = registration_status_expressions(now, required=Value(registration_fee))['registration_status']
+        transitions = list(
+            students.annotate(new_status=new_status)
+            .values('registration_status', 'new_status')
+            .annotate(count=Count('id'))
+            .order_by('registration_status', 'new_status')
+        )
+        total = sum(row['count'] for row in transitions)
+
+        if not total:
             self.stdout.write(self.style.SUCCESS('✅ All students already have correct registration amount!'))
             return
-        
-        self.stdout.write(f"\n📊 Found {len(students_to_update)} students to update:\n")
-        
-        updated_count = 0
-        status_changed_count = 0
-        
-        for student in students_to_update:
-            old_amount = student.registration_amount_required
-            old_status = student.registration_status
-            
-            self.stdout.write(
-                f"\n👤 {student.get_full_name()} ({student.email})"
-            )
-            self.stdout.write(
-                f"   Current: Required=₱{old_amount}, Paid=₱{student.registration_total_paid}, Status={old_status}"
-            )
-            
-            if not dry_run:
-                # Update registration amount
-                student.registration_amount_required = registration_fee
-                student.save()
-                
-                # Recalculate status
-                student.update_registration_status()
-                student.refresh_from_db()
-                
-                new_status = student.registration_status
-                
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f"   Updated: Required=₱{registration_fee}, Paid=₱{student.registration_total_paid}, Status={new_status}"
-                    )
-                )
-                
-                updated_count += 1
-                if old_status != new_status:
-                    status_changed_count += 1
-                    self.stdout.write(
-                        self.style.WARNING(f"   ⚠️  Status changed: {old_status} → {new_status}")
-                    )
-            else:
-                self.stdout.write(
-                    self.style.WARNING(
-                        f"   Would update to: Required=₱{registration_fee}"
-                    )
-                )
-        
+
+        self.stdout.write(f"\n📊 Found {total} students to update:\n")
+        for row in transitions:
+            line = f"   {row['registration_status']} → {row['new_status']}: {row['count']}"
+            if row['registration_status'] != row['new_status']:
+                line = self.style.WARNING(line)
+            self.stdout.write(line)
+
         if dry_run:
             self.stdout.write(
                 self.style.WARNING(
-                    f"\n🔍 DRY RUN: Would update {len(students_to_update)} students"
+                    f"\n🔍 DRY RUN: Would update {total} students to Required=₱{registration_fee}"
                 )
             )
             self.stdout.write("Run without --dry-run to apply changes\n")
-        else:
+            return
+
+        updated_count = 0
+        last_pk = 0
+        while True:
+            batch = list(
+                students.filter(pk__gt=last_pk).order_by('pk').values_list('pk', flat=True)[:batch_size]
+            )
+            if not batch:
+                break
+            with transaction.atomic():
+                updated_count += User.objects.filter(pk__in=batch).recompute_registration_status(
+                    now, registration_amount_required=registration_fee,
+                )
+            last_pk = batch[-1]
+            self.stdout.write(f"   ⏳ {updated_count}/{total} students updated")
+
+        status_changed_count = sum(
+            row['count'] for row in transitions if row['registration_status'] != row['new_status']
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\n✅ Successfully updated {updated_count} students"
+            )
+        )
+        if status_changed_count > 0:
             self.stdout.write(
                 self.style.SUCCESS(
-                    f"\n✅ Successfully updated {updated_count} students"
+                    f"✅ {status_changed_count} students had their status updated"
                 )
             )
-            if status_changed_count > 0:
-                self.stdout.write(
-                    self.style.SUCCESS(
-                        f"✅ {status_changed_count} students had their status updated"
-                    )
-                )
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:09
+
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F
+
+
+def backfill_expires_at(apps, schema_editor):
+    """Give pending PayMongo checkouts created before expiry tracking a deadline"""
+    RegistrationPayment = apps.get_model('accounts', 'RegistrationPayment')
+    RegistrationPayment.objects.filter(
+        status='pending', expires_at__isnull=True, paymongo_source_id__isnull=False
+    ).update(
+        expires_at=ExpressionWrapper(F('created_at') + timedelta(hours=1), output_field=models.DateTimeField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0018_user_role'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='registrationpayment',
+            name='expires_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Payment Expiration'),
+        ),
+        migrations.AddIndex(
+            model_name='registrationpayment',
+            index=models.Index(fields=['status', 'expires_at'], name='accounts_re_status_6cdf24_idx'),
+        ),
+        migrations.RunPython(backfill_expires_at, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,30 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:16
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('accounts', '0021_user_accounts_us_registr_ea2a46_idx'),
+        ('auth', '0012_alter_user_first_name_max_length'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='registrationpayment',
+            index=models.Index(fields=['paymongo_source_id'], name='accounts_re_paymong_c57e73_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='registrationpayment',
+            index=models.Index(fields=['paymongo_payment_id'], name='accounts_re_paymong_957e7e_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['rank', 'registration_status'], name='accounts_us_rank_618364_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='user',
+            index=models.Index(fields=['managed_by', 'registration_status'], name='accounts_us_managed_65a818_idx'),
+        ),
+    ]
@@ -1,5 +1,8 @@
-from django.contrib.auth.models import AbstractUser
-from django.db import models
+from django.contrib.auth.models import AbstractUser, UserManager as AuthUserManager
+from django.db import IntegrityError, models, transaction
+from django.db.models import Case, F, Value, When
+from django.db.models.functions import Coalesce
+from django.db.models.lookups import Exact, GreaterThan, GreaterThanOrEqual
 from django.utils.translation import gettext_lazy as _
 from django.utils.text import slugify
 from phonenumber_field.modelfields import PhoneNumberField
@@ -26,6 +29,9 @@ class RegistrationPayment(models.Model):
         ('rejected', 'Rejected'),
     ]
     
+    # Notes on the pending payment opened when a membership lapses
+    RENEWAL_NOTES = 'Membership renewal'
+
     PAYMENT_METHOD_CHOICES = [
         ('paymongo_gcash', 'GCash via PayMongo'),
         ('paymongo_maya', 'Maya via PayMongo'),
@@ -44,6 +50,7 @@ class RegistrationPayment(models.Model):
     paymongo_payment_id = models.CharField(max_length=100, null=True, blank=True, verbose_name="PayMongo Payment ID")
     paymongo_checkout_url = models.URLField(max_length=500, null=True, blank=True, verbose_name="PayMongo Checkout URL")
     payment_method = models.CharField(max_length=20, choices=PAYMENT_METHOD_CHOICES, default='paymongo_gcash', verbose_name="Payment Method")
+    expires_at = models.DateTimeField(null=True, blank=True, verbose_name="Payment Expiration")
     
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
     rejection_reason = models.TextField(blank=True, verbose_name="Rejection Reason")
@@ -57,11 +64,98 @@ class RegistrationPayment(models.Model):
         ordering = ['-created_at']
         indexes = [
             models.Index(fields=["user", "status", "created_at"]),
+            models.Index(fields=["status", "expires_at"]),
+            # Looked up by the PayMongo webhook on every call
+            models.Index(fields=["paymongo_source_id"]),
+            models.Index(fields=["paymongo_payment_id"]),
         ]
 
     def __str__(self):
         return f"{self.user.get_full_name()} - Registration Payment - ₱{self.amount} ({self.get_status_display()})"
 
+    def save(self, *args, **kwargs):
+        # PayMongo checkout links lapse; give every new one a deadline for the expiry sweep
+        if self.expires_at is None and self.status == 'pending' and self.paymongo_source_id:
+            from datetime import timedelta
+            from django.conf import settings
+            from django.utils import timezone
+            self.expires_at = timezone.now() + timedelta(minutes=settings.PAYMONGO_SOURCE_LIFETIME_MINUTES)
+        super().save(*args, **kwargs)
+
+def registration_status_expressions(now, required=None, paid=None):
+    """
+    SQL counterpart of User.apply_registration_status: UPDATE/annotate
+    expressions for each of User.REGISTRATION_STATUS_FIELDS.
+
+    Args:
+        now: Timestamp used for registration_date and membership_expiry
+        required: Expression for the required amount (default: the column)
+        paid: Expression for the paid total (default: the column)
+    """
+    from dateutil.relativedelta import relativedelta
+    required = F('registration_amount_required') if required is None else required
+    paid = F('registration_total_paid') if paid is None else paid
+    free = Exact(required, Value(Decimal('0.00')))
+    fully_paid = GreaterThanOrEqual(paid, required)
+    return {
+        'registration_status': Case(
+            When(free, then=Value('active')),
+            When(fully_paid, then=Value('payment_verified')),
+            When(GreaterThan(paid, Value(Decimal('0.00'))), then=Value('partial_payment')),
+            default=Value('pending_payment'),
+        ),
+        'is_active': Case(
+            When(free, then=Value(True)),
+            When(fully_paid, then=Value(True)),
+            default=Value(False),
+        ),
+        'registration_date': Case(
+            When(free, then=F('registration_date')),
+            When(fully_paid, then=Coalesce(F('registration_date'), Value(now))),
+            default=F('registration_date'),
+        ),
+        # Paying two or more years' worth extends membership by two years
+        'membership_expiry': Case(
+            When(free, then=F('membership_expiry')),
+            When(GreaterThanOrEqual(paid, required * 2), then=Value(now + relativedelta(years=2))),
+            When(fully_paid, then=Value(now + relativedelta(years=1))),
+            default=F('membership_expiry'),
+        ),
+    }
+
+
+class UserQuerySet(models.QuerySet):
+    def recompute_registration_status(self, now=None, **updates):
+        """
+        Apply the registration status rules to every user in the queryset
+        with a single UPDATE.
+
+        registration_amount_required and registration_total_paid may be
+        passed in updates (as values or expressions); the status is then
+        computed from the new amounts, as if they had been saved first.
+
+        Returns:
+            Number of users updated
+        """
+        from django.utils import timezone
+        now = now or timezone.now()
+        amounts = {}
+        for name in ('registration_amount_required', 'registration_total_paid'):
+            if name in updates:
+                value = updates[name]
+                amounts[name] = value if hasattr(value, 'resolve_expression') else Value(value)
+        expressions = registration_status_expressions(
+            now,
+            required=amounts.get('registration_amount_required'),
+            paid=amounts.get('registration_total_paid'),
+        )
+        return self.update(**updates, **expressions)
+
+
+class UserManager(AuthUserManager.from_queryset(UserQuerySet)):
+    pass
+
+
 class User(AbstractUser):
     # Override the username field from AbstractUser to make it not unique and nullable
     username = models.CharField(_("username"), max_length=150, unique=True, null=True, blank=True)
@@ -69,6 +163,8 @@ class User(AbstractUser):
     # Set email as unique and the USERNAME_FIELD
     email = models.EmailField(_("email address"), unique=True)
 
+    objects = UserManager()
+
     USERNAME_FIELD = 'email'
     REQUIRED_FIELDS = ['username', 'first_name', 'last_name'] # Fields prompted for when creating a superuser
 
@@ -178,6 +274,17 @@ class User(AbstractUser):
 
     def update_registration_status(self):
         """Update registration status and set registration_date/expiry when fully paid"""
+        self.apply_registration_status()
+        self.save()
+
+    # Fields apply_registration_status may change, for bulk_update callers
+    REGISTRATION_STATUS_FIELDS = [
+        'registration_status', 'is_active', 'registration_date', 'membership_expiry',
+    ]
+
+    def apply_registration_status(self):
+        """Set registration status, activation and expiry from the paid total without saving"""
+        # registration_status_expressions applies the same rules in SQL; keep them in step
         from django.utils import timezone
         from dateutil.relativedelta import relativedelta
         if self.registration_amount_required == 0:
@@ -196,18 +303,44 @@ class User(AbstractUser):
         else:
             self.registration_status = 'pending_payment'
             self.is_active = False
-        self.save()
 
-    def save(self, *args, **kwargs):
-        if not self.username:
-            base_username = slugify(self.email.split('@')[0])
-            unique_username = base_username
+    @classmethod
+    def generate_usernames(cls, bases, suffix='{base}{num}', reserved=()):
+        """
+        Pick a free username for each base with one query for every existing
+        username sharing a prefix with them; the next free suffix is found
+        in Python. Results are distinct from each other too, so bulk paths
+        can use them directly.
+        
+        Args:
+            bases: Slugified username bases (may repeat)
+            suffix: Format for taken bases, e.g. '{base}_{num:03d}'
+            reserved: Usernames to avoid that are not saved yet
+        
+        Returns:
+            List of usernames in the order of bases
+        """
+        bases = [base or 'user' for base in bases]
+        if not bases:
+            return []
+        prefixes = models.Q()
+        for base in set(bases):
+            prefixes |= models.Q(username__startswith=base)
+        taken = set(cls.objects.filter(prefixes).values_list('username', flat=True))
+        taken.update(reserved)
+        
+        usernames = []
+        for base in bases:
+            candidate = base
             num = 1
-            while User.objects.filter(username=unique_username).exists():
-                unique_username = f"{base_username}{num}"
+            while candidate in taken:
+                candidate = suffix.format(base=base, num=num)
                 num += 1
-            self.username = unique_username
-        
+            taken.add(candidate)
+            usernames.append(candidate)
+        return usernames
+
+    def save(self, *args, **kwargs):
         # Sync role with rank for backward compatibility
         self.role = self.rank
         
@@ -217,7 +350,22 @@ class User(AbstractUser):
             self.is_active = True
             self.registration_status = 'active'
         
-        super().save(*args, **kwargs)
+        if self.username:
+            super().save(*args, **kwargs)
+            return
+        
+        # A concurrent signup may claim the same generated username; pick again
+        base_username = slugify(self.email.split('@')[0])
+        for attempt in range(3):
+            self.username = User.generate_usernames([base_username])[0]
+            try:
+                with transaction.atomic():
+                    super().save(*args, **kwargs)
+                return
+            except IntegrityError:
+                if attempt == 2 or not User.objects.filter(username=self.username).exists():
+                    self.username = None
+                    raise
 
     def __str__(self):
         return f"{self.get_full_name()} ({self.get_rank_display()})"
@@ -225,6 +373,13 @@ class User(AbstractUser):
     class Meta:
         verbose_name = _('user')
         verbose_name_plural = _('users')
+        indexes = [
+            # Membership renewal sweep: range scans on expiry per status
+            models.Index(fields=['registration_status', 'membership_expiry']),
+            # Scout lists filtered by status, and teachers' student lists
+            models.Index(fields=['rank', 'registration_status']),
+            models.Index(fields=['managed_by', 'registration_status']),
+        ]
         permissions = [
             ("can_manage_scouts", "Can manage scouts"),
             ("can_manage_troop_leaders", "Can manage troop leaders"),
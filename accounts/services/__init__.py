@@ -0,0 +1,10 @@
+"""Accounts services package"""
+from .membership_renewal import MembershipRenewalService
+from .registration_fee import RegistrationFeeService
+from .student_import import StudentImportService
+
+__all__ = [
+    'MembershipRenewalService',
+    'RegistrationFeeService',
+    'StudentImportService',
+]
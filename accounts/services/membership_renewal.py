@@ -0,0 +1,120 @@
+"""
+Membership expiry sweep and renewal.
+Members whose membership_expiry falls on one of the reminder offsets get a
+renewal notice, and members whose membership has lapsed are moved back to
+pending_payment with a fresh pending RegistrationPayment for the current
+fee. Both are range queries on membership_expiry served by the
+(registration_status, membership_expiry) index; lapsed members are flipped
+with one UPDATE per batch and their renewal payments and notifications are
+created in bulk.
+"""
+import logging
+import time
+from datetime import timedelta
+from decimal import Decimal
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class MembershipRenewalService:
+    """Remind members before their membership lapses and open renewals once it has"""
+
+    @staticmethod
+    def send_expiry_reminders(now=None, days=None):
+        """
+        Notify members whose membership expires exactly N days from now (to
+        the day) for each N in days, so a daily run reminds each member once
+        per offset.
+
+        Returns:
+            Number of reminders queued
+        """
+        from accounts.models import User
+        from notifications.services import send_realtime_notifications
+
+        now = now or timezone.now()
+        days = settings.MEMBERSHIP_RENEWAL_REMINDER_DAYS if days is None else days
+        if not days:
+            return 0
+
+        windows = Q()
+        for offset in days:
+            windows |= Q(
+                membership_expiry__gt=now + timedelta(days=offset - 1),
+                membership_expiry__lte=now + timedelta(days=offset),
+            )
+        members = User.objects.filter(windows, registration_status='payment_verified').values_list(
+            'id', 'membership_expiry'
+        )
+        notifications = [
+            (
+                user_id,
+                f"Your membership expires on {timezone.localtime(expiry):%B %d, %Y}. "
+                "Renew your registration to stay an active member.",
+                'registration',
+            )
+            for user_id, expiry in members
+        ]
+        if notifications:
+            transaction.on_commit(lambda: send_realtime_notifications(notifications))
+        return len(notifications)
+
+    @staticmethod
+    def expire_memberships(now=None, batch_size=None):
+        """
+        Move every verified member whose membership has lapsed back to
+        pending_payment for the current registration fee, with a pending
+        renewal RegistrationPayment and a notice each (or straight to active
+        when the fee is zero). The paid total restarts at zero for the new
+        term; is_active is left alone so members can still log in to pay.
+
+        Returns:
+            dict with expired count and elapsed seconds
+        """
+        from accounts.models import RegistrationPayment, User
+        from notifications.services import send_realtime_notifications
+        from payments.models import SystemConfiguration
+
+        now = now or timezone.now()
+        batch_size = batch_size or settings.MEMBERSHIP_SWEEP_BATCH_SIZE
+        started = time.perf_counter()
+        system_config = SystemConfiguration.get_config()
+        registration_fee = system_config.registration_fee if system_config else Decimal('500.00')
+        lapsed = User.objects.filter(registration_status='payment_verified', membership_expiry__lte=now)
+
+        expired = 0
+        while True:
+            with transaction.atomic():
+                user_ids = list(
+                    lapsed.select_for_update(skip_locked=True).order_by('pk').values_list('pk', flat=True)[:batch_size]
+                )
+                if not user_ids:
+                    break
+                User.objects.filter(pk__in=user_ids).update(
+                    registration_status='pending_payment' if registration_fee > 0 else 'active',
+                    registration_amount_required=registration_fee,
+                    registration_total_paid=Decimal('0.00'),
+                )
+                if registration_fee > 0:
+                    RegistrationPayment.objects.bulk_create([
+                        RegistrationPayment(
+                            user_id=user_id,
+                            amount=registration_fee,
+                            status='pending',
+                            notes=RegistrationPayment.RENEWAL_NOTES,
+                        )
+                        for user_id in user_ids
+                    ])
+                    message = f"Your membership has expired. Pay the ₱{registration_fee} registration fee to renew it."
+                    notifications = [(user_id, message, 'registration') for user_id in user_ids]
+                    transaction.on_commit(lambda notifications=notifications: send_realtime_notifications(notifications))
+            expired += len(user_ids)
+
+        stats = {'expired': expired, 'elapsed': time.perf_counter() - started}
+        if expired:
+            logger.info(f"Expired {expired} membership(s) and opened renewal payments")
+        return stats
@@ -0,0 +1,87 @@
+"""
+Registration fee changes.
+When an admin changes the registration fee, scouts who still owe are
+repriced in one UPDATE with the same rules as User.update_registration_status,
+and their open RegistrationPayment rows follow in the same transaction:
+PayMongo checkouts created for the old amount cannot be changed, so they are
+expired (the payment page offers a fresh one), and unpaid placeholders are
+repriced to the new fee. Scouts whose status changed, or whose checkout was
+cancelled, are notified in one batch after commit.
+"""
+import logging
+from django.db import transaction
+from django.db.models import F, Q, Value
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class RegistrationFeeService:
+    """Apply a new registration fee to scouts with outstanding payments"""
+
+    OWING_STATUSES = ('pending_payment', 'partial_payment')
+
+    @staticmethod
+    def apply_fee_change(registration_fee, now=None):
+        """
+        Reprice every scout who still owes, and their open payments, for
+        registration_fee. Verified members keep their status.
+
+        Returns:
+            dict with repriced scouts, voided checkouts and repriced payments
+        """
+        from accounts.models import RegistrationPayment, User, registration_status_expressions
+        from notifications.services import send_realtime_notifications
+
+        now = now or timezone.now()
+        status_labels = dict(User.REGISTRATION_STATUS_CHOICES)
+        with transaction.atomic():
+            scouts = User.objects.select_for_update().filter(
+                rank='scout', registration_status__in=RegistrationFeeService.OWING_STATUSES
+            )
+            scout_ids = list(scouts.values_list('id', flat=True))
+            if not scout_ids:
+                return {'scouts': 0, 'voided': 0, 'payments': 0}
+
+            new_status = registration_status_expressions(now, required=Value(registration_fee))['registration_status']
+            changed = dict(
+                scouts.annotate(new_status=new_status)
+                .exclude(registration_status=F('new_status'))
+                .values_list('id', 'new_status')
+            )
+            repriced = User.objects.filter(id__in=scout_ids).recompute_registration_status(
+                now, registration_amount_required=registration_fee,
+            )
+
+            # Receipts uploaded by hand are real payments awaiting review; leave their amounts alone
+            open_payments = RegistrationPayment.objects.filter(
+                user_id__in=scout_ids, status='pending', paymongo_payment_id__isnull=True
+            ).exclude(payment_method='manual')
+            checkouts = open_payments.filter(paymongo_source_id__isnull=False)
+            cancelled_ids = set(checkouts.values_list('user_id', flat=True))
+            voided = checkouts.update(status='expired', updated_at=now)
+            # Placeholders of scouts the new fee settled are no longer owed
+            voided += open_payments.exclude(
+                user__registration_status__in=RegistrationFeeService.OWING_STATUSES
+            ).update(status='expired', updated_at=now)
+            payments = open_payments.filter(
+                ~Q(amount=registration_fee),
+                user__registration_status__in=RegistrationFeeService.OWING_STATUSES,
+            ).update(amount=registration_fee, updated_at=now)
+
+            notifications = []
+            for user_id in set(changed) | cancelled_ids:
+                message = f"The registration fee is now ₱{registration_fee}."
+                if user_id in changed:
+                    message += f" Your registration status is now {status_labels[changed[user_id]]}."
+                if user_id in cancelled_ids and changed.get(user_id) in (None, *RegistrationFeeService.OWING_STATUSES):
+                    message += " Your previous payment link was cancelled; open your registration payment page to pay the new amount."
+                notifications.append((user_id, message, 'registration'))
+            if notifications:
+                transaction.on_commit(lambda: send_realtime_notifications(notifications))
+
+        logger.info(
+            f"Registration fee ₱{registration_fee} applied to {repriced} scout(s); "
+            f"voided {voided} checkout(s), repriced {payments} payment(s)"
+        )
+        return {'scouts': repriced, 'voided': voided, 'payments': payments}
@@ -0,0 +1,248 @@
+"""
+Bulk student import for teachers.
+A CSV or XLSX roster is validated as a whole (one query for emails and
+usernames already taken), missing usernames are resolved with one prefix
+query per batch instead of an exists() loop per student, passwords are
+hashed in a process pool for large command-line imports since PBKDF2
+dominates the cost (web uploads are capped and hash inline), and the users,
+their pending RegistrationPayments and audit log rows are bulk-created in
+one transaction. An import with any invalid row creates nothing.
+"""
+import csv
+import io
+import logging
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from decimal import Decimal
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.password_validation import validate_password
+from django.core.exceptions import ValidationError
+from django.core.validators import validate_email
+from django.db import transaction
+from django.db.models import Q
+from django.utils.text import slugify
+
+logger = logging.getLogger(__name__)
+
+REQUIRED_COLUMNS = ('first_name', 'last_name', 'email', 'password')
+OPTIONAL_COLUMNS = ('username', 'phone_number', 'date_of_birth', 'address')
+
+
+def _hash_password(password):
+    """Module-level so it can be shipped to worker processes"""
+    return make_password(password)
+
+
+class StudentImportService:
+    """Validate and bulk-create teacher-managed student accounts"""
+
+    @staticmethod
+    def read_rows(uploaded_file, filename=None):
+        """
+        Read a CSV or XLSX roster into a list of dicts keyed by lower-cased
+        column name. XLSX is read with openpyxl (in requirements.txt).
+        """
+        filename = (filename or getattr(uploaded_file, 'name', '') or '').lower()
+        if filename.endswith('.xlsx'):
+            try:
+                from openpyxl import load_workbook
+            except ImportError:
+                raise ValueError('XLSX import requires the openpyxl package; upload a CSV file instead.')
+            sheet = load_workbook(uploaded_file, read_only=True, data_only=True).active
+            rows = sheet.iter_rows(values_only=True)
+            header = [str(cell or '').strip().lower() for cell in next(rows, ())]
+            return [
+                {key: value for key, value in zip(header, row) if key}
+                for row in rows if any(cell not in (None, '') for cell in row)
+            ]
+
+        content = uploaded_file.read()
+        if isinstance(content, bytes):
+            content = content.decode('utf-8-sig')
+        reader = csv.DictReader(io.StringIO(content))
+        reader.fieldnames = [name.strip().lower() for name in reader.fieldnames or []]
+        return [row for row in reader if any((value or '').strip() for value in row.values() if isinstance(value, str))]
+
+    @staticmethod
+    def validate(rows):
+        """
+        Clean every row and check it against the rest of the file and the
+        database.
+
+        Returns:
+            (cleaned rows, list of (row number, message)); row numbers count
+            the header as row 1
+        """
+        from accounts.models import User
+
+        user_fields = {name: User._meta.get_field(name) for name in ('phone_number', 'date_of_birth')}
+        errors = []
+        cleaned = []
+        if rows:
+            missing = [column for column in REQUIRED_COLUMNS if column not in rows[0]]
+            if missing:
+                return [], [(1, f"Missing column(s): {', '.join(missing)}")]
+
+        for number, row in enumerate(rows, start=2):
+            values = {
+                column: str(row.get(column) if row.get(column) is not None else '').strip()
+                for column in REQUIRED_COLUMNS + OPTIONAL_COLUMNS
+            }
+            values['email'] = User.objects.normalize_email(values['email'])
+            row_errors = [f"{column} is required" for column in REQUIRED_COLUMNS if not values[column]]
+            if values['email']:
+                try:
+                    validate_email(values['email'])
+                except ValidationError:
+                    row_errors.append(f"invalid email {values['email']}")
+            if values['password']:
+                try:
+                    validate_password(values['password'])
+                except ValidationError as e:
+                    row_errors.extend(e.messages)
+            for name, field in user_fields.items():
+                raw = row.get(name)
+                if raw in (None, ''):
+                    values[name] = None if name == 'date_of_birth' else ''
+                    continue
+                try:
+                    values[name] = field.clean(raw, None)
+                except ValidationError as e:
+                    row_errors.append(f"{name}: {' '.join(e.messages)}")
+            if row_errors:
+                errors.append((number, '; '.join(row_errors)))
+            cleaned.append((number, values))
+
+        # Duplicates within the file, then against existing accounts
+        for column in ('email', 'username'):
+            seen = {}
+            for number, values in cleaned:
+                key = values[column].lower()
+                if key and key in seen:
+                    errors.append((number, f"{column} {values[column]} repeats row {seen[key]}"))
+                seen.setdefault(key, number)
+        emails = [values['email'] for _, values in cleaned if values['email']]
+        usernames = [values['username'] for _, values in cleaned if values['username']]
+        taken = User.objects.filter(Q(email__in=emails) | Q(username__in=usernames)).values_list('email', 'username')
+        taken_emails = {email for email, _ in taken}
+        taken_usernames = {username for _, username in taken}
+        for number, values in cleaned:
+            if values['email'] in taken_emails:
+                errors.append((number, f"a user with email {values['email']} already exists"))
+            if values['username'] and values['username'] in taken_usernames:
+                errors.append((number, f"a user with username {values['username']} already exists"))
+
+        errors.sort()
+        return [values for _, values in cleaned], errors
+
+    @staticmethod
+    def assign_usernames(rows):
+        """
+        Fill in blank usernames the way TeacherCreateStudentForm does
+        (first_last, then first_last_001, ...), with one prefix query for
+        the whole batch.
+        """
+        from accounts.models import User
+
+        pending = [values for values in rows if not values['username']]
+        bases = [
+            slugify(f"{values['first_name']}_{values['last_name']}") or slugify(values['email'].split('@')[0])
+            for values in pending
+        ]
+        explicit = [values['username'] for values in rows if values['username']]
+        usernames = User.generate_usernames(bases, suffix='{base}_{num:03d}', reserved=explicit)
+        for values, username in zip(pending, usernames):
+            values['username'] = username
+        return rows
+
+    @staticmethod
+    def hash_passwords(passwords, workers=1):
+        """
+        Hash passwords, across worker processes when workers > 1.
+        Workers are spawned, not forked, so they never inherit the caller's
+        threads or database connections; only the management command uses them.
+        """
+        if workers <= 1 or len(passwords) < 2:
+            return [_hash_password(password) for password in passwords]
+        context = multiprocessing.get_context('spawn')
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as executor:
+            return list(executor.map(_hash_password, passwords, chunksize=max(1, len(passwords) // (workers * 4))))
+
+    @staticmethod
+    def import_students(teacher, rows, workers=1, batch_size=500, dry_run=False):
+        """
+        Create student accounts managed by teacher, each with a pending
+        registration payment for the current registration fee.
+
+        Args:
+            teacher: Teacher User the students are assigned to
+            rows: Rows from read_rows
+            workers: Processes used for password hashing (1 = inline)
+            batch_size: Rows per bulk INSERT
+            dry_run: Validate only
+
+        Returns:
+            dict with created count, errors [(row number, message)] and
+            elapsed seconds
+        """
+        from accounts.models import RegistrationPayment, User
+        from analytics.models import AuditLog
+        from payments.models import SystemConfiguration
+
+        started = time.perf_counter()
+        cleaned, errors = StudentImportService.validate(rows)
+        stats = {'created': 0, 'errors': errors, 'elapsed': 0.0}
+        if errors or dry_run or not cleaned:
+            stats['elapsed'] = time.perf_counter() - started
+            return stats
+
+        system_config = SystemConfiguration.get_config()
+        registration_fee = system_config.registration_fee if system_config else Decimal('500.00')
+        passwords = StudentImportService.hash_passwords([values['password'] for values in cleaned], workers)
+
+        with transaction.atomic():
+            for start in range(0, len(cleaned), batch_size):
+                batch = StudentImportService.assign_usernames(cleaned[start:start + batch_size])
+                User.objects.bulk_create([
+                    User(
+                        username=values['username'],
+                        email=values['email'],
+                        password=password,
+                        first_name=values['first_name'],
+                        last_name=values['last_name'],
+                        phone_number=values['phone_number'],
+                        date_of_birth=values['date_of_birth'],
+                        address=values['address'],
+                        rank='scout',
+                        role='scout',  # User.save() keeps role in sync with rank
+                        managed_by=teacher,
+                        is_active=True,
+                        registration_status='pending_payment',
+                        registration_amount_required=registration_fee,
+                    )
+                    for values, password in zip(batch, passwords[start:start + batch_size])
+                ])
+                students = list(
+                    User.objects.filter(email__in=[values['email'] for values in batch]).values_list('id', 'username')
+                )
+                RegistrationPayment.objects.bulk_create([
+                    RegistrationPayment(
+                        user_id=student_id,
+                        amount=registration_fee,
+                        payment_method='paymongo_gcash',
+                        status='pending',
+                        notes=f"Created by teacher {teacher.get_full_name()} (bulk import)",
+                    )
+                    for student_id, _ in students
+                ])
+                # bulk_create skips the post_save signal that writes this audit entry
+                AuditLog.objects.bulk_create([
+                    AuditLog(user_id=student_id, action='user_registered', details=f"New user {username} registered.")
+                    for student_id, username in students
+                ])
+                stats['created'] += len(students)
+
+        stats['elapsed'] = time.perf_counter() - started
+        logger.info(f"Imported {stats['created']} students for teacher {teacher.email} in {stats['elapsed']:.2f}s")
+        return stats
@@ -86,3 +86,340 @@ class PhoneValidationTests(TestCase):
 		user.refresh_from_db()
 		self.assertEqual(str(user.phone_number), '+639181234567')
 		self.assertEqual(str(user.emergency_phone), '+639181234567')
+
+
+class StudentImportTests(TestCase):
+	def setUp(self):
+		self.teacher = User.objects.create_user(
+			username='teacher', email='teacher@example.com', password='StrongPass123!',
+			first_name='Tina', last_name='Teacher', rank='teacher', is_active=True,
+			registration_status='active',
+		)
+		User.objects.create_user(
+			username='juan_dela-cruz', email='existing@example.com', password='StrongPass123!', rank='scout'
+		)
+
+	def roster(self, *lines):
+		from django.core.files.uploadedfile import SimpleUploadedFile
+		content = '\n'.join(('first_name,last_name,email,password,username,date_of_birth',) + lines)
+		return SimpleUploadedFile('roster.csv', content.encode('utf-8'), content_type='text/csv')
+
+	def test_xlsx_roster_upload(self):
+		from datetime import date
+		from io import BytesIO
+		from django.core.files.uploadedfile import SimpleUploadedFile
+		from openpyxl import Workbook
+		workbook = Workbook()
+		sheet = workbook.active
+		sheet.append(['First_Name', 'Last_Name', 'Email', 'Password', 'Username', 'Date_of_Birth'])
+		sheet.append(['Lea', 'Tan', 'lea@example.com', 'StrongPass123!', None, date(2012, 3, 4)])
+		sheet.append([None, None, None, None, None, None])
+		sheet.append(['Ana', 'Cruz', 'ana@example.com', 'StrongPass123!', 'acruz', None])
+		buffer = BytesIO()
+		workbook.save(buffer)
+		roster = SimpleUploadedFile(
+			'roster.xlsx', buffer.getvalue(),
+			content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet',
+		)
+
+		self.client.login(email='teacher@example.com', password='StrongPass123!')
+		resp = self.client.post(reverse('accounts:teacher_import_students'), {'roster': roster})
+
+		self.assertRedirects(resp, reverse('accounts:teacher_student_list'), fetch_redirect_response=False)
+		students = User.objects.filter(managed_by=self.teacher).order_by('email')
+		self.assertEqual([s.email for s in students], ['ana@example.com', 'lea@example.com'])
+		self.assertEqual(str(students[1].date_of_birth), '2012-03-04')
+		self.assertEqual(students[0].username, 'acruz')
+
+	def test_import_creates_students_with_pending_payments(self):
+		from accounts.models import RegistrationPayment
+		from accounts.services import StudentImportService
+		from analytics.models import AuditLog
+		rows = StudentImportService.read_rows(self.roster(
+			'Juan,Dela Cruz,juan@example.com,StrongPass123!,,2012-03-04',
+			'Juan,Dela Cruz,juan2@example.com,StrongPass123!,,',
+			'Maria,Santos,maria@example.com,StrongPass123!,msantos,',
+		))
+
+		stats = StudentImportService.import_students(self.teacher, rows)
+
+		self.assertEqual((stats['created'], stats['errors']), (3, []))
+		students = User.objects.filter(managed_by=self.teacher).order_by('id')
+		self.assertEqual(
+			[s.username for s in students], ['juan_dela-cruz_001', 'juan_dela-cruz_002', 'msantos']
+		)
+		juan = students[0]
+		self.assertTrue(juan.check_password('StrongPass123!'))
+		self.assertEqual((juan.rank, juan.role, juan.registration_status), ('scout', 'scout', 'pending_payment'))
+		self.assertEqual(str(juan.date_of_birth), '2012-03-04')
+		self.assertEqual(RegistrationPayment.objects.filter(user__managed_by=self.teacher, status='pending').count(), 3)
+		self.assertEqual(AuditLog.objects.filter(action='user_registered', user__managed_by=self.teacher).count(), 3)
+
+	def test_invalid_roster_creates_nothing(self):
+		from accounts.services import StudentImportService
+		rows = StudentImportService.read_rows(self.roster(
+			'Ana,Reyes,ana@example.com,StrongPass123!,,',
+			'Ana,Reyes,ANA@example.com,StrongPass123!,,',
+			'Ben,Cruz,existing@example.com,StrongPass123!,,',
+			'Cai,Lim,cai@example.com,short,,not-a-date',
+		))
+
+		stats = StudentImportService.import_students(self.teacher, rows)
+
+		self.assertEqual(stats['created'], 0)
+		self.assertEqual([row for row, _ in stats['errors']], [3, 4, 5])
+		self.assertIn('already exists', dict(stats['errors'])[4])
+		self.assertFalse(User.objects.filter(managed_by=self.teacher).exists())
+
+	def test_password_hashing_in_worker_processes(self):
+		from django.contrib.auth.hashers import check_password
+		from accounts.services import StudentImportService
+		hashes = StudentImportService.hash_passwords(['StrongPass123!', 'OtherPass456!'], workers=2)
+		self.assertTrue(check_password('StrongPass123!', hashes[0]))
+		self.assertTrue(check_password('OtherPass456!', hashes[1]))
+
+	def test_teacher_uploads_roster(self):
+		from unittest.mock import patch
+		self.client.login(email='teacher@example.com', password='StrongPass123!')
+		with patch('accounts.services.student_import.ProcessPoolExecutor') as pool:
+			resp = self.client.post(
+				reverse('accounts:teacher_import_students'),
+				{'roster': self.roster(
+					'Lea,Tan,lea@example.com,StrongPass123!,,',
+					'Ana,Cruz,ana@example.com,StrongPass123!,,',
+				)},
+			)
+		# The web request never forks the server process
+		pool.assert_not_called()
+		self.assertRedirects(resp, reverse('accounts:teacher_student_list'), fetch_redirect_response=False)
+		self.assertTrue(User.objects.filter(email='lea@example.com', managed_by=self.teacher).exists())
+
+
+class UsernameGenerationTests(TestCase):
+	def test_next_free_suffix_in_one_query(self):
+		for username in ('juan', 'juan1', 'juan2', 'juanito'):
+			User.objects.create_user(username=username, email=f'{username}@other.com', password='StrongPass123!')
+		with self.assertNumQueries(1):
+			usernames = User.generate_usernames(['juan', 'juan', 'maria'])
+		self.assertEqual(usernames, ['juan3', 'juan4', 'maria'])
+
+	def test_save_generates_username_from_email(self):
+		User.objects.create_user(username='juan', email='juan@other.com', password='StrongPass123!')
+		user = User(email='juan@example.com')
+		user.save()
+		self.assertEqual(user.username, 'juan1')
+
+	def test_save_retries_when_generated_username_is_claimed(self):
+		from unittest.mock import patch
+		User.objects.create_user(username='pedro', email='pedro@other.com', password='StrongPass123!')
+		# Simulate a concurrent signup taking the name between the lookup and the insert
+		with patch.object(User, 'generate_usernames', side_effect=[['pedro'], ['pedro1']]) as generate:
+			user = User(email='pedro@example.com')
+			user.save()
+		self.assertEqual(user.username, 'pedro1')
+		self.assertEqual(generate.call_count, 2)
+
+
+class BadgeManageTests(TestCase):
+	def setUp(self):
+		from accounts.models import Badge, UserBadge
+		User.objects.create_user(
+			username='admin', email='admin@example.com', password='StrongPass123!', rank='admin'
+		)
+		self.scouts = [
+			User.objects.create_user(
+				username=f'scout{i}', email=f'scout{i}@example.com', password='StrongPass123!',
+				first_name='Scout', last_name=f'{i}', rank='scout'
+			)
+			for i in range(3)
+		]
+		self.badge = Badge.objects.create(name='First Aid')
+		self.existing = UserBadge.objects.create(user=self.scouts[0], badge=self.badge, percent_complete=40)
+		self.url = reverse('accounts:badge_manage', kwargs={'pk': self.badge.pk})
+		self.client.login(email='admin@example.com', password='StrongPass123!')
+
+	def test_get_does_not_create_rows(self):
+		from accounts.models import UserBadge
+		resp = self.client.get(self.url)
+		self.assertEqual(resp.status_code, 200)
+		self.assertEqual([ub.percent_complete for ub in resp.context['user_badges']], [40, 0, 0])
+		self.assertEqual(UserBadge.objects.count(), 1)
+
+	def test_post_writes_only_changed_rows(self):
+		from accounts.models import UserBadge
+		payload = {
+			f'scout_{self.scouts[0].id}_percent': '100',
+			f'scout_{self.scouts[0].id}_awarded': 'on',
+			f'scout_{self.scouts[0].id}_date_awarded': '2025-06-01',
+			f'scout_{self.scouts[1].id}_percent': '25',
+			f'scout_{self.scouts[2].id}_percent': '0',
+		}
+		resp = self.client.post(self.url, payload)
+		self.assertRedirects(resp, f'{self.url}?page=1', fetch_redirect_response=False)
+		self.existing.refresh_from_db()
+		self.assertTrue(self.existing.awarded)
+		self.assertEqual((self.existing.percent_complete, str(self.existing.date_awarded)), (100, '2025-06-01'))
+		self.assertEqual(UserBadge.objects.get(user=self.scouts[1]).percent_complete, 25)
+		# Untouched scouts still have no row
+		self.assertFalse(UserBadge.objects.filter(user=self.scouts[2]).exists())
+
+	def test_post_leaves_rows_missing_from_the_form(self):
+		from accounts.models import UserBadge
+		# A form rendered before scouts[0] landed on this page does not include its row
+		resp = self.client.post(self.url, {f'scout_{self.scouts[1].id}_percent': '25'})
+		self.assertEqual(resp.status_code, 302)
+		self.existing.refresh_from_db()
+		self.assertEqual(self.existing.percent_complete, 40)
+		self.assertEqual(UserBadge.objects.get(user=self.scouts[1]).percent_complete, 25)
+
+
+class SyncRegistrationAmountsTests(TestCase):
+	def setUp(self):
+		from decimal import Decimal
+		from payments.models import SystemConfiguration
+		config = SystemConfiguration.get_config()
+		config.registration_fee = Decimal('300.00')
+		config.save()
+		self.scouts = {}
+		for name, paid in [('unpaid', '0'), ('partial', '100'), ('paid', '300'), ('double', '600')]:
+			self.scouts[name] = User.objects.create_user(
+				username=name, email=f'{name}@example.com', password='StrongPass123!', rank='scout',
+				registration_amount_required=Decimal('500.00'), registration_total_paid=Decimal(paid),
+			)
+		self.admin = User.objects.create_user(
+			username='admin', email='admin@example.com', password='StrongPass123!', rank='admin',
+			registration_amount_required=Decimal('500.00'),
+		)
+
+	def test_matches_per_user_status_rules(self):
+		from io import StringIO
+		from decimal import Decimal
+		from django.core.management import call_command
+		call_command('sync_registration_amounts', '--batch-size', '3', stdout=StringIO())
+		for user in self.scouts.values():
+			user.refresh_from_db()
+			self.assertEqual(user.registration_amount_required, Decimal('300.00'))
+		expected = {
+			'unpaid': ('pending_payment', False),
+			'partial': ('partial_payment', False),
+			'paid': ('payment_verified', True),
+			'double': ('payment_verified', True),
+		}
+		for name, (status, active) in expected.items():
+			self.assertEqual(self.scouts[name].registration_status, status, name)
+			self.assertEqual(self.scouts[name].is_active, active, name)
+		self.assertIsNotNone(self.scouts['paid'].registration_date)
+		years = lambda user: user.membership_expiry.year - user.registration_date.year
+		self.assertEqual(years(self.scouts['paid']), 1)
+		self.assertEqual(years(self.scouts['double']), 2)
+		self.admin.refresh_from_db()
+		self.assertEqual(self.admin.registration_amount_required, Decimal('500.00'))
+
+	def test_dry_run_changes_nothing(self):
+		from io import StringIO
+		from django.core.management import call_command
+		out = StringIO()
+		call_command('sync_registration_amounts', '--dry-run', stdout=out)
+		self.assertIn('Would update 4 students', out.getvalue())
+		self.assertFalse(User.objects.filter(registration_amount_required=300).exists())
+
+
+class RecomputeRegistrationStatusTests(TestCase):
+	def test_matches_apply_registration_status(self):
+		from decimal import Decimal
+		from django.utils import timezone
+		cases = [('0', '0'), ('0', '50'), ('500', '0'), ('500', '200'), ('500', '500'), ('500', '999'), ('500', '1500')]
+		users = []
+		for i, (required, paid) in enumerate(cases):
+			users.append(User.objects.create_user(
+				username=f'member{i}', email=f'member{i}@example.com', password='StrongPass123!', rank='scout',
+				registration_amount_required=Decimal(required), registration_total_paid=Decimal(paid),
+			))
+		now = timezone.now()
+		self.assertEqual(User.objects.filter(rank='scout').recompute_registration_status(now), len(cases))
+		for user in users:
+			expected = User.objects.get(pk=user.pk)
+			expected.registration_date = None
+			expected.membership_expiry = None
+			expected.apply_registration_status()
+			user.refresh_from_db()
+			self.assertEqual(user.registration_status, expected.registration_status, user.username)
+			self.assertEqual(user.is_active, expected.is_active, user.username)
+			self.assertEqual(user.membership_expiry is None, expected.membership_expiry is None, user.username)
+			if user.membership_expiry:
+				self.assertEqual(user.membership_expiry.year, expected.membership_expiry.year, user.username)
+
+	def test_uses_new_amounts_passed_in(self):
+		from decimal import Decimal
+		from django.db.models import F
+		user = User.objects.create_user(
+			username='member', email='member@example.com', password='StrongPass123!', rank='scout',
+			registration_amount_required=Decimal('500.00'), registration_total_paid=Decimal('200.00'),
+		)
+		User.objects.filter(pk=user.pk).recompute_registration_status(
+			registration_total_paid=F('registration_total_paid') + Decimal('100.00'),
+			registration_amount_required=Decimal('300.00'),
+		)
+		user.refresh_from_db()
+		self.assertEqual(user.registration_total_paid, Decimal('300.00'))
+		self.assertEqual(user.registration_status, 'payment_verified')
+		self.assertTrue(user.is_active)
+		self.assertIsNotNone(user.registration_date)
+
+
+class MembershipRenewalTests(TestCase):
+	def setUp(self):
+		from datetime import timedelta
+		from decimal import Decimal
+		from django.utils import timezone
+		self.now = timezone.now()
+		self.members = {}
+		for name, days in [('lapsed', -1), ('week', 6.5), ('later', 20)]:
+			self.members[name] = User.objects.create_user(
+				username=name, email=f'{name}@example.com', password='StrongPass123!', rank='scout', is_active=True,
+				registration_status='payment_verified', registration_amount_required=Decimal('500.00'),
+				registration_total_paid=Decimal('500.00'), membership_expiry=self.now + timedelta(days=days),
+			)
+
+	def test_lapsed_members_get_renewal_payment(self):
+		from decimal import Decimal
+		from accounts.models import RegistrationPayment
+		from accounts.services import MembershipRenewalService
+		with self.captureOnCommitCallbacks(execute=True):
+			stats = MembershipRenewalService.expire_memberships(now=self.now, batch_size=1)
+		self.assertEqual(stats['expired'], 1)
+		lapsed = User.objects.get(pk=self.members['lapsed'].pk)
+		self.assertEqual(lapsed.registration_status, 'pending_payment')
+		self.assertEqual(lapsed.registration_total_paid, Decimal('0.00'))
+		self.assertTrue(lapsed.is_active)
+		renewal = RegistrationPayment.objects.get(user=lapsed)
+		self.assertEqual((renewal.status, renewal.amount), ('pending', Decimal('500.00')))
+		self.assertEqual(lapsed.notifications.count(), 1)
+		self.assertEqual(User.objects.filter(registration_status='payment_verified').count(), 2)
+		# A second sweep finds nothing left to expire
+		self.assertEqual(MembershipRenewalService.expire_memberships(now=self.now)['expired'], 0)
+
+	def test_payment_page_does_not_restore_lapsed_membership(self):
+		from datetime import timedelta
+		from decimal import Decimal
+		from accounts.models import RegistrationPayment
+		from accounts.services import MembershipRenewalService
+		lapsed = self.members['lapsed']
+		old = RegistrationPayment.objects.create(user=lapsed, amount=Decimal('500.00'), status='verified')
+		RegistrationPayment.objects.filter(pk=old.pk).update(created_at=self.now - timedelta(days=366))
+		MembershipRenewalService.expire_memberships(now=self.now)
+		self.client.login(email='lapsed@example.com', password='StrongPass123!')
+		resp = self.client.get(reverse('accounts:registration_payment', kwargs={'user_id': lapsed.pk}))
+		self.assertEqual(resp.status_code, 200)
+		lapsed.refresh_from_db()
+		self.assertEqual(lapsed.registration_status, 'pending_payment')
+		self.assertEqual(lapsed.registration_total_paid, Decimal('0.00'))
+		self.assertLess(lapsed.membership_expiry, self.now)
+
+	def test_reminders_only_on_offset_days(self):
+		from accounts.services import MembershipRenewalService
+		with self.captureOnCommitCallbacks(execute=True):
+			sent = MembershipRenewalService.send_expiry_reminders(now=self.now, days=[7, 30])
+		self.assertEqual(sent, 1)
+		self.assertEqual(self.members['week'].notifications.count(), 1)
+		self.assertEqual(self.members['later'].notifications.count(), 0)
@@ -21,6 +21,7 @@ urlpatterns = [
     # Teacher student management URLs
     path('teacher/students/', views.teacher_student_list, name='teacher_student_list'),
     path('teacher/students/create/', views.teacher_create_student, name='teacher_create_student'),
+    path('teacher/students/import/', views.teacher_import_students, name='teacher_import_students'),
     path('teacher/students/<int:student_id>/', views.teacher_student_detail, name='teacher_student_detail'),
     path('teacher/students/<int:student_id>/edit/', views.teacher_edit_student, name='teacher_edit_student'),
     path('teacher/students/<int:student_id>/delete/', views.teacher_delete_student, name='teacher_delete_student'),
@@ -3,7 +3,7 @@ from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib import messages
 from .forms import (
     UserRegisterForm, UserEditForm, CustomLoginForm, RoleManagementForm, GroupForm,
-    TeacherCreateStudentForm, TeacherEditStudentForm
+    TeacherCreateStudentForm, TeacherEditStudentForm, StudentImportForm
 )
 from .models import User, Group, Badge, UserBadge
 from django.http import HttpResponseForbidden
@@ -17,7 +17,7 @@ from django.utils import timezone
 from django.contrib.auth.views import LoginView, LogoutView
 from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from decimal import Decimal
 from datetime import date
 from events.models import Attendance
@@ -456,6 +456,47 @@ Boy Scout System Team
     
     return render(request, 'accounts/teacher/create_student.html', {'form': form})
 
+@login_required
+def teacher_import_students(request):
+    """Teacher creates many student accounts from a CSV/XLSX roster"""
+    if not request.user.is_teacher():
+        messages.error(request, 'Only teachers can create student accounts.')
+        return redirect('home')
+    
+    from django.conf import settings
+    from .services import StudentImportService
+    
+    errors = []
+    if request.method == 'POST':
+        form = StudentImportForm(request.POST, request.FILES)
+        if form.is_valid():
+            try:
+                rows = StudentImportService.read_rows(form.cleaned_data['roster'])
+            except (ValueError, UnicodeDecodeError) as e:
+                rows = None
+                form.add_error('roster', f'Could not read the roster: {e}')
+            
+            if rows is not None and len(rows) > settings.STUDENT_IMPORT_MAX_ROWS:
+                form.add_error('roster', f'A roster may have at most {settings.STUDENT_IMPORT_MAX_ROWS} students.')
+            elif rows is not None:
+                # Hashed inline: the row cap bounds the work, and forking the server process is unsafe
+                stats = StudentImportService.import_students(request.user, rows)
+                errors = stats['errors']
+                if not errors and stats['created']:
+                    messages.success(
+                        request,
+                        f"Imported {stats['created']} student(s). Use Pay All Pending to pay their registration fees."
+                    )
+                    return redirect('accounts:teacher_student_list')
+                if not errors:
+                    messages.warning(request, 'The roster has no students in it.')
+                else:
+                    messages.error(request, f'No students were imported: {len(errors)} problem(s) found in the roster.')
+    else:
+        form = StudentImportForm()
+    
+    return render(request, 'accounts/teacher/import_students.html', {'form': form, 'errors': errors})
+
 @login_required
 def teacher_student_list(request):
     """List all students managed by this teacher"""
@@ -770,7 +811,7 @@ def teacher_bulk_payment_status(request):
         return redirect('accounts:teacher_student_list')
     
     from .models import RegistrationPayment
-    from events.paymongo_service import PayMongoService
+    from events.services.paymongo_webhook import PayMongoWebhookService
     
     # Get all payments
     payments = RegistrationPayment.objects.filter(id__in=payment_ids)
@@ -779,57 +820,20 @@ def teacher_bulk_payment_status(request):
         messages.error(request, 'Payment records not found.')
         return redirect('accounts:teacher_student_list')
     
-    # Get the first payment to check PayMongo source status
-    first_payment = payments.first()
-    
-    if first_payment.paymongo_source_id:
-        paymongo = PayMongoService()
-        source_data = paymongo.get_source(first_payment.paymongo_source_id)
+    # The payments share one PayMongo source; the webhook worker verifies them together
+    if not payments.exclude(status='verified').exists():
+        # Clear session
+        del request.session['bulk_payment_ids']
         
-        if source_data and 'data' in source_data:
-            source_status = source_data['data']['attributes']['status']
-            
-            # If source is chargeable, create payment
-            if source_status == 'chargeable':
-                description = f"Bulk Registration Payment - {len(payments)} students by {request.user.get_full_name()}"
-                payment_response = paymongo.create_payment(
-                    source_id=first_payment.paymongo_source_id,
-                    amount=sum(p.amount for p in payments),
-                    description=description
-                )
-                
-                if payment_response and payment_response.get('data'):
-                    payment_id = payment_response['data']['id']
-                    payment_status = payment_response['data']['attributes']['status']
-                    
-                    # If paid, verify all payments
-                    if payment_status == 'paid':
-                        for payment in payments:
-                            payment.paymongo_payment_id = payment_id
-                            payment.status = 'verified'
-                            payment.verification_date = timezone.now()
-                            payment.save()
-                            
-                            # Update student status
-                            student = payment.user
-                            student.registration_total_paid += payment.amount
-                            student.update_registration_status()  # Use proper status update
-                            
-                            # Send notification
-                            send_realtime_notification(
-                                user_id=student.id,
-                                message=f"Your registration payment has been verified! Your account is now active.",
-                                type='payment'
-                            )
-                        
-                        # Clear session
-                        del request.session['bulk_payment_ids']
-                        
-                        messages.success(
-                            request,
-                            f'Bulk payment verified! {len(payments)} students have been activated.'
-                        )
-                        return redirect('accounts:teacher_student_list')
+        messages.success(
+            request,
+            f'Bulk payment verified! {len(payments)} students have been activated.'
+        )
+        return redirect('accounts:teacher_student_list')
+    
+    first_payment = payments.first()
+    if first_payment.status in ('pending', 'processing'):
+        PayMongoWebhookService.schedule_poll(first_payment.paymongo_source_id)
     
     # If not verified yet, show status page
     context = {
@@ -950,7 +954,7 @@ def teacher_bulk_student_payment_status(request):
         return redirect('accounts:teacher_student_list')
     
     from .models import RegistrationPayment
-    from events.paymongo_service import PayMongoService
+    from events.services.paymongo_webhook import PayMongoWebhookService
     
     # Get all payments
     payments = RegistrationPayment.objects.filter(id__in=payment_ids)
@@ -959,61 +963,22 @@ def teacher_bulk_student_payment_status(request):
         messages.error(request, 'Payment records not found.')
         return redirect('accounts:teacher_student_list')
     
-    # Get the first payment to check PayMongo source status
-    first_payment = payments.first()
-    
-    if first_payment.paymongo_source_id:
-        paymongo = PayMongoService()
-        source_data = paymongo.get_source(first_payment.paymongo_source_id)
+    # The payments share one PayMongo source; the webhook worker verifies them together
+    if not payments.exclude(status='verified').exists():
+        # Clear session
+        del request.session['bulk_selected_payment_ids']
+        if 'bulk_selected_student_ids' in request.session:
+            del request.session['bulk_selected_student_ids']
         
-        if source_data and 'data' in source_data:
-            source_status = source_data['data']['attributes']['status']
-            
-            # If source is chargeable, create payment
-            if source_status == 'chargeable':
-                description = f"Bulk Registration Payment - {len(payments)} selected students by {request.user.get_full_name()}"
-                payment_response = paymongo.create_payment(
-                    source_id=first_payment.paymongo_source_id,
-                    amount=sum(p.amount for p in payments),
-                    description=description
-                )
-                
-                if payment_response and payment_response.get('data'):
-                    payment_id = payment_response['data']['id']
-                    payment_status = payment_response['data']['attributes']['status']
-                    
-                    # If paid, verify all payments
-                    if payment_status == 'paid':
-                        for payment in payments:
-                            payment.paymongo_payment_id = payment_id
-                            payment.status = 'verified'
-                            payment.verification_date = timezone.now()
-                            payment.save()
-                            
-                            # Update student status
-                            student = payment.user
-                            student.registration_total_paid = payment.amount  # Set to full amount
-                            student.registration_status = 'active'  # Set to active
-                            student.save()
-                            
-                            # Send notification
-                            from notifications.services import send_realtime_notification
-                            send_realtime_notification(
-                                user_id=student.id,
-                                message=f"Your registration payment has been verified! Your account is now active.",
-                                type='payment'
-                            )
-                        
-                        # Clear session
-                        del request.session['bulk_selected_payment_ids']
-                        if 'bulk_selected_student_ids' in request.session:
-                            del request.session['bulk_selected_student_ids']
-                        
-                        messages.success(
-                            request,
-                            f'Bulk payment verified! {len(payments)} students have been activated.'
-                        )
-                        return redirect('accounts:teacher_student_list')
+        messages.success(
+            request,
+            f'Bulk payment verified! {len(payments)} students have been activated.'
+        )
+        return redirect('accounts:teacher_student_list')
+    
+    first_payment = payments.first()
+    if first_payment.status in ('pending', 'processing'):
+        PayMongoWebhookService.schedule_poll(first_payment.paymongo_source_id)
     
     # If not verified yet, show status page
     context = {
@@ -1024,16 +989,32 @@ def teacher_bulk_student_payment_status(request):
     
     return render(request, 'accounts/teacher/bulk_payment_status.html', context)
 
-def register(request):
+async def register(request):
+    """Sign-up; the PayMongo source for the registration fee is awaited without blocking the worker"""
+    from asgiref.sync import sync_to_async
+    from events.paymongo_service import run_checkout
+    return await run_checkout(await sync_to_async(_register)(request))
+
+
+def _register(request):
     from django.db import models
     from payments.models import Payment, SystemConfiguration
     from django.utils import timezone
-    from events.paymongo_service import PayMongoService
+    from events.paymongo_service import PendingCheckout
     try:
         from dateutil.relativedelta import relativedelta
     except ImportError:
         relativedelta = None
     
+    def render_form(form):
+        # Get the registration fee from system configuration
+        system_config = SystemConfiguration.get_config()
+        
+        return render(request, 'accounts/register.html', {
+            'form': form,
+            'registration_fee': system_config.registration_fee if system_config else Decimal('500.00')
+        })
+    
     if request.method == 'POST':
         form = UserRegisterForm(request.POST, request.FILES)
         if form.is_valid():
@@ -1074,26 +1055,11 @@ def register(request):
             
             # Create PayMongo payment
             from .models import RegistrationPayment
-            paymongo = PayMongoService()
             
-            try:
-                # Create PayMongo source with registration details
-                # Build redirect URL with user ID
-                redirect_url = request.build_absolute_uri(f'/accounts/registration-payment/{user.id}/')
-                
-                source_data = paymongo.create_source(
-                    amount=registration_fee,
-                    type='gcash',
-                    redirect_success=redirect_url,
-                    redirect_failed=redirect_url,
-                    metadata={
-                        'user_email': user.email,
-                        'user_name': user.get_full_name(),
-                        'description': f"Registration Fee - {user.get_full_name()}",
-                        'payment_type': 'registration',
-                    }
-                )
-                
+            # Build redirect URL with user ID
+            redirect_url = request.build_absolute_uri(f'/accounts/registration-payment/{user.id}/')
+            
+            def finish(source_data):
                 if not source_data:
                     messages.error(request, 'Failed to create PayMongo payment. Please check server logs or try again.')
                     return redirect('accounts:register')
@@ -1124,28 +1090,42 @@ def register(request):
                         f'Registration successful! Please complete your payment of ₱{registration_fee}. Click the "Pay Now" button on the next page.'
                     )
                     return redirect('accounts:registration_payment', user_id=user.id)
-                else:
-                    # PayMongo failed, show error
-                    logger.error(f"PayMongo source creation failed for user {user.email}. Source data: {source_data}")
-                    user.delete()  # Clean up user account
-                    messages.error(request, 'Failed to create PayMongo payment. Please check your PayMongo API keys or try again later.')
-                    
-            except Exception as e:
+                
+                # PayMongo failed, show error
+                logger.error(f"PayMongo source creation failed for user {user.email}. Source data: {source_data}")
+                user.delete()  # Clean up user account
+                messages.error(request, 'Failed to create PayMongo payment. Please check your PayMongo API keys or try again later.')
+                return render_form(form)
+            
+            def on_error(e):
                 # Error creating payment
-                logger.error(f"Exception creating PayMongo payment for registration: {str(e)}", exc_info=True)
+                logger.error(f"Exception creating PayMongo payment for registration: {str(e)}", exc_info=e)
                 user.delete()  # Clean up user account
                 messages.error(request, f'Error creating payment: {str(e)}. Please try again.')
+                return render_form(form)
+            
+            # Create PayMongo source with registration details (awaited by register)
+            return PendingCheckout(
+                source_kwargs={
+                    'amount': registration_fee,
+                    'type': 'gcash',
+                    'redirect_success': redirect_url,
+                    'redirect_failed': redirect_url,
+                    'metadata': {
+                        'user_email': user.email,
+                        'user_name': user.get_full_name(),
+                        'description': f"Registration Fee - {user.get_full_name()}",
+                        'payment_type': 'registration',
+                    },
+                },
+                finish=finish,
+                on_error=on_error,
+            )
                 
     else:
         form = UserRegisterForm()
     
-    # Get the registration fee from system configuration
-    system_config = SystemConfiguration.get_config()
-    
-    return render(request, 'accounts/register.html', {
-        'form': form,
-        'registration_fee': system_config.registration_fee if system_config else Decimal('500.00')
-    })
+    return render_form(form)
 
 def admin_required(view_func):
     def wrapper(request, *args, **kwargs):
@@ -1666,29 +1646,70 @@ def badge_list(request):
     badges = Badge.objects.all().order_by('name')
     return render(request, 'accounts/badge_list.html', {'badges': badges})
 
+BADGE_MANAGE_PAGE_SIZE = 50
+
 @admin_required
 def badge_manage(request, pk):
+    from django.db import transaction
+    from django.utils.dateparse import parse_date
+    
     badge = Badge.objects.get(pk=pk)
-    scouts = User.objects.filter(rank='scout').order_by('last_name', 'first_name')
-    # Get or create UserBadge for each scout
-    user_badges = [UserBadge.objects.get_or_create(user=scout, badge=badge)[0] for scout in scouts]
+    # Left-join each scout's UserBadge for this badge; scouts without one get an unsaved row
+    scouts = User.objects.filter(rank='scout').order_by('last_name', 'first_name', 'id').annotate(
+        current=models.FilteredRelation('user_badges', condition=models.Q(user_badges__badge=badge)),
+        user_badge_id=models.F('current__id'),
+        user_badge_percent=models.F('current__percent_complete'),
+        user_badge_awarded=models.F('current__awarded'),
+        user_badge_date=models.F('current__date_awarded'),
+        user_badge_notes=models.F('current__notes'),
+    )
+    page_obj = Paginator(scouts, BADGE_MANAGE_PAGE_SIZE).get_page(request.GET.get('page'))
+    user_badges = [
+        UserBadge(
+            id=scout.user_badge_id,
+            user=scout,
+            badge=badge,
+            percent_complete=scout.user_badge_percent or 0,
+            awarded=bool(scout.user_badge_awarded),
+            date_awarded=scout.user_badge_date,
+            notes=scout.user_badge_notes or '',
+        )
+        for scout in page_obj
+    ]
     if request.method == 'POST':
+        fields = ['awarded', 'percent_complete', 'notes', 'date_awarded']
+        to_create = []
+        to_update = []
         for user_badge in user_badges:
             prefix = f'scout_{user_badge.user.id}_'
-            awarded = request.POST.get(prefix + 'awarded') == 'on'
+            # Only rows rendered in the submitted form are diffed; a scout who
+            # joined this page since it was loaded must not be wiped
+            if prefix + 'percent' not in request.POST:
+                continue
             percent = request.POST.get(prefix + 'percent', '0')
-            notes = request.POST.get(prefix + 'notes', '')
-            date_awarded = request.POST.get(prefix + 'date_awarded', '')
-            user_badge.awarded = awarded
-            user_badge.percent_complete = int(percent) if percent.isdigit() else 0
-            user_badge.notes = notes
-            user_badge.date_awarded = date_awarded if date_awarded else None
-            user_badge.save()
-        messages.success(request, 'Badge assignments and progress updated.')
-        return redirect('accounts:badge_manage', pk=badge.pk)
+            submitted = {
+                'awarded': request.POST.get(prefix + 'awarded') == 'on',
+                'percent_complete': int(percent) if percent.isdigit() else 0,
+                'notes': request.POST.get(prefix + 'notes', ''),
+                'date_awarded': parse_date(request.POST.get(prefix + 'date_awarded', '') or '') or None,
+            }
+            if all(getattr(user_badge, field) == value for field, value in submitted.items()):
+                continue
+            for field, value in submitted.items():
+                setattr(user_badge, field, value)
+            (to_update if user_badge.pk else to_create).append(user_badge)
+        with transaction.atomic():
+            UserBadge.objects.bulk_create(to_create)
+            UserBadge.objects.bulk_update(to_update, fields)
+        messages.success(
+            request,
+            f'Badge assignments and progress updated ({len(to_create)} added, {len(to_update)} changed).'
+        )
+        return redirect(f"{reverse('accounts:badge_manage', kwargs={'pk': badge.pk})}?page={page_obj.number}")
     return render(request, 'accounts/badge_manage.html', {
         'badge': badge,
         'user_badges': user_badges,
+        'page_obj': page_obj,
     })
 
 def registration_payment(request, user_id):
@@ -1770,8 +1791,14 @@ def registration_payment(request, user_id):
     # Get payment history for this user
     payments = user.registration_payments.all().order_by('-created_at')
     
-    # Check if there are verified payments but user status not updated
-    verified_payments = payments.filter(status='verified')
+    # Check if there are verified payments but user status not updated.
+    # Only payments from the current membership term count: a renewal
+    # starts a new term, so anything before the latest one is spent.
+    term_payments = payments
+    last_renewal = payments.filter(notes=RegistrationPayment.RENEWAL_NOTES).order_by('-created_at').first()
+    if last_renewal:
+        term_payments = payments.filter(created_at__gte=last_renewal.created_at)
+    verified_payments = term_payments.filter(status='verified')
     if verified_payments.exists() and user.registration_status == 'pending_payment':
         # Calculate total verified payments
         total_verified = sum(p.amount for p in verified_payments)
@@ -1783,82 +1810,12 @@ def registration_payment(request, user_id):
             user.save()
             print(f"✅ Updated user {user.email} status from verified payments: ₱{total_verified}")
     
-    # Check if there's a pending payment and verify its status with PayMongo
-    # This allows immediate status update when user returns from PayMongo checkout
-    pending_payment = payments.filter(status='pending').first()
-    if pending_payment and pending_payment.paymongo_source_id:
-        paymongo = PayMongoService()
-        source_data = paymongo.get_source(pending_payment.paymongo_source_id)
-        
-        if source_data and 'data' in source_data:
-            source_status = source_data['data']['attributes']['status']
-            
-            # If source is chargeable, create payment immediately
-            if source_status == 'chargeable':
-                print(f"🔍 Source is chargeable for user {user.email}, creating payment...")
-                
-                # Create payment via PayMongo
-                description = f"Registration Fee - {user.get_full_name()}"
-                payment_response = paymongo.create_payment(
-                    source_id=pending_payment.paymongo_source_id,
-                    amount=pending_payment.amount,
-                    description=description
-                )
-                
-                if payment_response and payment_response.get('data'):
-                    payment_id = payment_response['data']['id']
-                    payment_status = payment_response['data']['attributes']['status']
-                    
-                    # Update RegistrationPayment with payment ID
-                    pending_payment.paymongo_payment_id = payment_id
-                    pending_payment.status = 'processing'
-                    pending_payment.save()
-                    
-                    # If payment is already paid, mark as verified immediately
-                    if payment_status == 'paid':
-                        print(f"✅ Payment already paid, marking as verified...")
-                        pending_payment.status = 'verified'
-                        pending_payment.verification_date = timezone.now()
-                        pending_payment.save()
-                        
-                        # Reload user from database to ensure fresh data
-                        user.refresh_from_db()
-                        
-                        # Update user registration total paid
-                        user.registration_total_paid += pending_payment.amount
-                        
-                        # Debug logging before status update
-                        print(f"🔍 BEFORE update_registration_status:")
-                        print(f"   User: {user.email}")
-                        print(f"   Total Paid: ₱{user.registration_total_paid}")
-                        print(f"   Required: ₱{user.registration_amount_required}")
-                        print(f"   Current Status: {user.registration_status}")
-                        
-                        user.update_registration_status()  # This will calculate and set correct status
-                        
-                        # Reload to get the saved status
-                        user.refresh_from_db()
-                        
-                        print(f"✅ AFTER update_registration_status:")
-                        print(f"   Total Paid: ₱{user.registration_total_paid}")
-                        print(f"   Required: ₱{user.registration_amount_required}")
-                        print(f"   New Status: {user.registration_status}")
-                        print(f"   Is Active: {user.is_active}")
-                        
-                        # Check if a teacher paid for their student
-                        if request.user.is_authenticated and request.user.is_teacher() and user.managed_by == request.user:
-                            messages.success(
-                                request, 
-                                f'Payment verified! Student {user.get_full_name()} account is now active.'
-                            )
-                            # Redirect teacher to their student list
-                            return redirect('accounts:teacher_student_list')
-                        else:
-                            # Student paid for themselves or anonymous user
-                            messages.success(request, 'Payment verified! Your account is now active. Please login to continue.')
-                        
-                        # Refresh payments to show updated status
-                        payments = user.registration_payments.all().order_by('-created_at')
+    # A payment still open at PayMongo is settled by the webhook worker; poll
+    # PayMongo in the background in case its webhook is late
+    open_payment = payments.filter(status__in=('pending', 'processing')).first()
+    if open_payment and open_payment.paymongo_source_id:
+        from events.services.paymongo_webhook import PayMongoWebhookService
+        PayMongoWebhookService.schedule_poll(open_payment.paymongo_source_id)
     
     return render(request, 'accounts/registration_payment.html', {
         'user': user,
@@ -45,4 +45,7 @@ class AuditLog(models.Model):
         return f'{self.timestamp} - {self.action} by {self.user}'
 
     class Meta:
-        ordering = ['-timestamp'] 
\ No newline at end of file
+        ordering = ['-timestamp']
+        indexes = [
+            models.Index(fields=['timestamp']),
+        ]
\ No newline at end of file
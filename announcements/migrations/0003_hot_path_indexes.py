@@ -0,0 +1,23 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('announcements', '0002_announcement_is_published'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(fields=['is_published', 'date_posted'], name='announcemen_is_publ_9a6198_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='announcement',
+            index=models.Index(fields=['date_posted'], name='announcemen_date_po_caa0ec_idx'),
+        ),
+    ]
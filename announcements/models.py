@@ -9,5 +9,12 @@ class Announcement(models.Model):
     read_by = models.ManyToManyField(User, related_name='read_announcements', blank=True)
     is_published = models.BooleanField(default=True, help_text="If false, announcement is hidden from regular users.")
 
+    class Meta:
+        indexes = [
+            # Announcement lists: published ones (or all, for admins) newest first
+            models.Index(fields=['is_published', 'date_posted']),
+            models.Index(fields=['date_posted']),
+        ]
+
     def __str__(self):
         return self.title
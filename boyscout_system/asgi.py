@@ -12,6 +12,7 @@ from django.core.asgi import get_asgi_application
 from channels.routing import ProtocolTypeRouter, URLRouter
 from channels.auth import AuthMiddlewareStack
 import notifications.routing
+import events.routing
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'boyscout_system.settings')
 
@@ -22,6 +23,7 @@ application = ProtocolTypeRouter({
     "websocket": AuthMiddlewareStack(
         URLRouter(
             notifications.routing.websocket_urlpatterns
+            + events.routing.websocket_urlpatterns
         )
     ),
 })
@@ -173,6 +173,8 @@ EMAIL_USE_TLS = os.environ.get('EMAIL_USE_TLS', 'True').lower() == 'true'
 EMAIL_HOST_USER = os.environ.get('EMAIL_HOST_USER', '')
 EMAIL_HOST_PASSWORD = os.environ.get('EMAIL_HOST_PASSWORD', '')
 DEFAULT_FROM_EMAIL = os.environ.get('DEFAULT_FROM_EMAIL', EMAIL_HOST_USER or 'ScoutConnect <noreply@example.com>')
+# Payment reminders reuse one mail connection, sending this many messages per batch
+REMINDER_BATCH_SIZE = int(os.environ.get('REMINDER_BATCH_SIZE', '100'))
 
 # For GCP SendGrid
 # EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
@@ -201,6 +203,27 @@ PAYMONGO_WEBHOOK_SECRET = os.environ.get('PAYMONGO_WEBHOOK_SECRET', '')
 # Enable webhook signature verification
 PAYMONGO_VERIFY_WEBHOOK = os.environ.get('PAYMONGO_VERIFY_WEBHOOK', 'True').lower() == 'true'
 
+# Webhook events are stored in an inbox and applied by a worker. By default a
+# background thread drains the inbox after each webhook; set this to False when
+# running `manage.py process_paymongo_webhooks` as a separate worker instead.
+PAYMONGO_WEBHOOK_DRAIN_IN_THREAD = os.environ.get('PAYMONGO_WEBHOOK_DRAIN_IN_THREAD', 'True').lower() == 'true'
+PAYMONGO_WEBHOOK_MAX_ATTEMPTS = int(os.environ.get('PAYMONGO_WEBHOOK_MAX_ATTEMPTS', '5'))
+# Payment status pages read local payment state; if the webhook is late they
+# poll PayMongo in the background, at most once per source per interval.
+PAYMONGO_SOURCE_POLL_INTERVAL = int(os.environ.get('PAYMONGO_SOURCE_POLL_INTERVAL', '15'))
+# Pending PayMongo checkouts older than this are expired by `manage.py expire_pending_payments`
+PAYMONGO_SOURCE_LIFETIME_MINUTES = int(os.environ.get('PAYMONGO_SOURCE_LIFETIME_MINUTES', '60'))
+
+# PayMongo HTTP client: one pooled keep-alive session per process. Idempotent
+# GETs are retried with exponential backoff; POSTs are only retried when the
+# connection could not be made, so a source or payment is never created twice.
+PAYMONGO_API_BASE = os.environ.get('PAYMONGO_API_BASE', 'https://api.paymongo.com/v1')
+PAYMONGO_CONNECT_TIMEOUT = float(os.environ.get('PAYMONGO_CONNECT_TIMEOUT', '3.05'))
+PAYMONGO_READ_TIMEOUT = float(os.environ.get('PAYMONGO_READ_TIMEOUT', '20'))
+PAYMONGO_POOL_SIZE = int(os.environ.get('PAYMONGO_POOL_SIZE', '10'))
+PAYMONGO_GET_RETRIES = int(os.environ.get('PAYMONGO_GET_RETRIES', '3'))
+PAYMONGO_RETRY_BACKOFF = float(os.environ.get('PAYMONGO_RETRY_BACKOFF', '0.5'))
+
 # Site URL for PayMongo redirects
 SITE_URL = os.environ.get('SITE_URL', 'https://scoutconnect.pythonanywhere.com')
 
@@ -209,6 +232,34 @@ SITE_URL = os.environ.get('SITE_URL', 'https://scoutconnect.pythonanywhere.com')
 # VONAGE_API_SECRET = 'your-api-secret'
 # VONAGE_FROM_NUMBER = '+1234567890'
 
+# Worker processes used for bulk certificate rendering
+CERTIFICATE_GENERATION_WORKERS = int(os.environ.get('CERTIFICATE_GENERATION_WORKERS', '2'))
+# Certificates for a stopped attendance session are issued off the request: by
+# default on a background thread, and always by the scheduler's
+# issue_attendance_certificates job. Set this to False to leave it to the job.
+ATTENDANCE_CERTIFICATES_IN_THREAD = os.environ.get('ATTENDANCE_CERTIFICATES_IN_THREAD', 'True').lower() == 'true'
+
+# Certificates are rendered on first download into a size-bounded disk cache
+CERTIFICATE_CACHE_DIR = os.environ.get('CERTIFICATE_CACHE_DIR', os.path.join(BASE_DIR, 'certificate_cache'))
+CERTIFICATE_CACHE_MAX_BYTES = int(os.environ.get('CERTIFICATE_CACHE_MAX_BYTES', str(512 * 1024 * 1024)))
+
+# In-process job scheduler (python manage.py run_scheduler). A node holding a
+# job's lock longer than SCHEDULER_LOCK_TTL seconds is presumed dead.
+SCHEDULER_LOCK_TTL = int(os.environ.get('SCHEDULER_LOCK_TTL', '600'))
+SCHEDULER_HISTORY_DAYS = int(os.environ.get('SCHEDULER_HISTORY_DAYS', '30'))
+# Per-job cron overrides, e.g. {'payment_reminders': '30 8 * * *'}; None disables a job
+SCHEDULER_SCHEDULES = {}
+
+# Teacher roster imports: password hashing processes (import_students command
+# only; web uploads hash inline) and the row cap for web uploads
+STUDENT_IMPORT_WORKERS = int(os.environ.get('STUDENT_IMPORT_WORKERS', '2'))
+STUDENT_IMPORT_MAX_ROWS = int(os.environ.get('STUDENT_IMPORT_MAX_ROWS', '500'))
+
+# Membership renewal job: reminder offsets in days before membership_expiry,
+# and members moved to a renewal per UPDATE once their membership lapses
+MEMBERSHIP_RENEWAL_REMINDER_DAYS = [30, 7, 1]
+MEMBERSHIP_SWEEP_BATCH_SIZE = int(os.environ.get('MEMBERSHIP_SWEEP_BATCH_SIZE', '500'))
+
 # File upload settings
 MAX_UPLOAD_SIZE = 5 * 1024 * 1024  # 5MB
 ALLOWED_IMAGE_TYPES = ['image/jpeg', 'image/png', 'image/gif']
@@ -220,12 +271,24 @@ X_FRAME_OPTIONS = 'DENY'
 CSRF_COOKIE_SECURE = os.environ.get('CSRF_COOKIE_SECURE', 'True').lower() == 'true'
 SESSION_COOKIE_SECURE = os.environ.get('SESSION_COOKIE_SECURE', 'True').lower() == 'true'
 
-# Cache settings
-CACHES = {
-    'default': {
-        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+# Cache settings. The scheduler (run_scheduler) runs in its own process, so
+# in production set REDIS_URL: cached attendance state and websocket pushes
+# from its jobs only reach the web workers through a shared cache and
+# channel layer.
+REDIS_URL = os.environ.get('REDIS_URL', '')
+if REDIS_URL:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        }
     }
-}
 
 # File storage settings
 DEFAULT_FILE_STORAGE = 'django.core.files.storage.FileSystemStorage'
@@ -235,11 +298,20 @@ FILE_UPLOAD_DIRECTORY_PERMISSIONS = 0o755
 
 # Channels
 ASGI_APPLICATION = 'boyscout_system.asgi.application'
-CHANNEL_LAYERS = {
-    'default': {
-        'BACKEND': 'channels.layers.InMemoryChannelLayer',
-    },
-}
+if REDIS_URL:
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels_redis.core.RedisChannelLayer',
+            'CONFIG': {'hosts': [REDIS_URL]},
+        },
+    }
+else:
+    # Single-process development only: group_send never leaves this process
+    CHANNEL_LAYERS = {
+        'default': {
+            'BACKEND': 'channels.layers.InMemoryChannelLayer',
+        },
+    }
 
 # Phone number field
 PHONENUMBER_DEFAULT_REGION = os.environ.get('PHONENUMBER_DEFAULT_REGION', 'PH')
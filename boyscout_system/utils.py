@@ -1,7 +1,10 @@
 from io import BytesIO
 from django.template.loader import get_template
-from django.http import HttpResponse
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils import timezone
 import logging
+import os
+import zipfile
 
 logger = logging.getLogger(__name__)
 
@@ -29,4 +32,115 @@ def render_to_pdf(template_src, context_dict={}):
         return None
     except Exception as e:
         logger.error(f"Error generating PDF: {str(e)}")
-        return None 
\ No newline at end of file
+        return None 
+
+
+# Formats that are already compressed; deflating them again only burns CPU
+PRECOMPRESSED_EXTENSIONS = {'.png', '.jpg', '.jpeg', '.gif', '.pdf', '.zip'}
+
+
+class _ZipStreamBuffer:
+    """Write-only sink that hands ZipFile output back to a generator"""
+
+    def __init__(self):
+        self._chunks = []
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        data = b''.join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+def stream_zip(entries, chunk_size=64 * 1024):
+    """
+    Build a ZIP archive incrementally for StreamingHttpResponse.
+
+    Each entry is a (filename, opener) pair where opener() returns a binary file
+    object; files are opened one at a time and copied in chunk_size pieces, so
+    memory stays at roughly one chunk regardless of archive size. Already
+    compressed formats (PNG, JPEG, PDF...) are stored rather than deflated.
+    Entries whose opener raises are logged and skipped.
+    """
+    buffer = _ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w', allowZip64=True) as zip_file:
+        for filename, opener in entries:
+            try:
+                source = opener()
+            except Exception as e:
+                logger.error(f"Error adding {filename} to ZIP: {e}")
+                continue
+
+            try:
+                zip_info = zipfile.ZipInfo(filename, date_time=timezone.localtime().timetuple()[:6])
+                zip_info.external_attr = 0o644 << 16
+                if os.path.splitext(filename)[1].lower() in PRECOMPRESSED_EXTENSIONS:
+                    zip_info.compress_type = zipfile.ZIP_STORED
+                else:
+                    zip_info.compress_type = zipfile.ZIP_DEFLATED
+                with zip_file.open(zip_info, 'w') as entry:
+                    while True:
+                        chunk = source.read(chunk_size)
+                        if not chunk:
+                            break
+                        entry.write(chunk)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+            finally:
+                source.close()
+
+            data = buffer.drain()
+            if data:
+                yield data
+
+    data = buffer.drain()
+    if data:
+        yield data
+
+
+def iterate_async(iterator):
+    """
+    Async iterator over a sync one. Each item is produced in the request's
+    sync thread (where its database connection lives) via sync_to_async, so
+    under ASGI the response is sent as it is generated instead of being
+    collected into a list first.
+    """
+    from asgiref.sync import sync_to_async
+
+    done = object()
+    advance = sync_to_async(next, thread_sensitive=True)
+
+    async def generate():
+        try:
+            while True:
+                item = await advance(iterator, done)
+                if item is done:
+                    break
+                yield item
+        finally:
+            # Client went away mid-stream: release files and cursors
+            close = getattr(iterator, 'close', None)
+            if close:
+                await sync_to_async(close, thread_sensitive=True)()
+
+    return generate()
+
+
+def streaming_response(request, streaming_content, **kwargs):
+    """
+    StreamingHttpResponse that stays incremental under both handlers: Django
+    buffers sync iterators whole when serving ASGI, so those requests get an
+    async iterator instead.
+    """
+    from django.core.handlers.asgi import ASGIRequest
+
+    if isinstance(request, ASGIRequest):
+        streaming_content = iterate_async(iter(streaming_content))
+    return StreamingHttpResponse(streaming_content, **kwargs)
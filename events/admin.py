@@ -1,5 +1,7 @@
-from django.contrib import admin
-from .models import Event, EventRegistration, EventPayment, Attendance, EventPhoto, AttendanceSession, CertificateTemplate, EventCertificate
+from django.conf import settings
+from django.contrib import admin, messages
+from .models import Event, EventRegistration, EventPayment, Attendance, EventPhoto, AttendanceSession, CertificateTemplate, EventCertificate, PayMongoWebhookEvent, PaymentAllocation
+from .services.certificate_service import CertificateService
 
 @admin.register(Event)
 class EventAdmin(admin.ModelAdmin):
@@ -7,6 +9,23 @@ class EventAdmin(admin.ModelAdmin):
     list_filter = ['date', 'created_at', 'payment_amount']
     search_fields = ['title', 'description', 'location']
     date_hierarchy = 'date'
+    actions = ['generate_missing_certificates']
+
+    @admin.action(description='Generate missing certificates for present attendees')
+    def generate_missing_certificates(self, request, queryset):
+        for event in queryset:
+            stats = CertificateService.generate_event_certificates(
+                event,
+                workers=settings.CERTIFICATE_GENERATION_WORKERS,
+                regenerate=True,
+            )
+            level = messages.WARNING if stats['failed'] else messages.SUCCESS
+            self.message_user(
+                request,
+                f"{event.title}: generated {stats['generated']}, regenerated {stats['regenerated']}, "
+                f"failed {stats['failed']} in {stats['elapsed']:.1f}s ({stats['rate']:.1f}/s)",
+                level,
+            )
 
 @admin.register(EventRegistration)
 class EventRegistrationAdmin(admin.ModelAdmin):
@@ -19,12 +38,19 @@ class EventRegistrationAdmin(admin.ModelAdmin):
         return f"₱{obj.amount_remaining}"
     amount_remaining.short_description = 'Remaining'
 
+class PaymentAllocationInline(admin.TabularInline):
+    model = PaymentAllocation
+    extra = 0
+    raw_id_fields = ['registration']
+    readonly_fields = ['created_at']
+
 @admin.register(EventPayment)
 class EventPaymentAdmin(admin.ModelAdmin):
     list_display = ['registration', 'amount', 'status', 'created_at', 'verified_by']
     list_filter = ['status', 'created_at', 'registration__event']
     search_fields = ['registration__user__first_name', 'registration__user__last_name', 'registration__event__title']
     readonly_fields = ['created_at', 'updated_at']
+    inlines = [PaymentAllocationInline]
 
 @admin.register(Attendance)
 class AttendanceAdmin(admin.ModelAdmin):
@@ -82,3 +108,16 @@ class EventCertificateAdmin(admin.ModelAdmin):
     search_fields = ['certificate_number', 'user__first_name', 'user__last_name', 'event__title']
     readonly_fields = ['certificate_number', 'generated_at']
 
+
+@admin.register(PayMongoWebhookEvent)
+class PayMongoWebhookEventAdmin(admin.ModelAdmin):
+    list_display = ['event_id', 'event_type', 'status', 'attempts', 'received_at', 'processed_at']
+    list_filter = ['status', 'event_type', 'received_at']
+    search_fields = ['event_id']
+    readonly_fields = ['event_id', 'event_type', 'payload', 'attempts', 'last_error', 'received_at', 'processed_at']
+    actions = ['retry_events']
+
+    @admin.action(description='Retry selected webhook events')
+    def retry_events(self, request, queryset):
+        updated = queryset.filter(status='failed').update(status='pending', attempts=0)
+        self.message_user(request, f"{updated} failed webhook event(s) queued for retry", messages.SUCCESS)
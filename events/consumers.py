@@ -0,0 +1,60 @@
+import json
+from channels.generic.websocket import AsyncWebsocketConsumer
+from channels.db import database_sync_to_async
+
+from .services.attendance_state import AttendanceStateService
+
+
+class AttendanceConsumer(AsyncWebsocketConsumer):
+    """Pushes attendance session state (and the live count for admins) for one event"""
+
+    async def connect(self):
+        user = self.scope["user"]
+        if user.is_anonymous:
+            await self.close()
+            return
+
+        self.event_id = int(self.scope["url_route"]["kwargs"]["event_id"])
+        self.is_admin = user.is_admin()
+        self.groups_joined = [AttendanceStateService.group_name(self.event_id)]
+        if self.is_admin:
+            self.groups_joined.append(AttendanceStateService.admin_group_name(self.event_id))
+        for group in self.groups_joined:
+            await self.channel_layer.group_add(group, self.channel_name)
+        await self.accept()
+
+        # Initial snapshot so the page does not need to poll
+        await self.send_state(await self.get_snapshot())
+
+    async def disconnect(self, close_code):
+        for group in getattr(self, 'groups_joined', []):
+            await self.channel_layer.group_discard(group, self.channel_name)
+
+    async def receive(self, text_data):
+        # Clients only listen
+        pass
+
+    async def attendance_session(self, event):
+        await self.send_state(event)
+
+    async def attendance_count(self, event):
+        await self.send(text_data=json.dumps({
+            'kind': 'count',
+            'attendance_count': event['attendance_count'],
+        }))
+
+    async def send_state(self, event):
+        payload = {'kind': 'session', 'is_active': event['is_active'], 'expires_at': event.get('expires_at')}
+        if self.is_admin:
+            payload['attendance_count'] = event['attendance_count']
+        await self.send(text_data=json.dumps(payload))
+
+    @database_sync_to_async
+    def get_snapshot(self):
+        state = AttendanceStateService.get_session_state(self.event_id)
+        is_open = AttendanceStateService.session_is_open(state)
+        return {
+            'is_active': is_open,
+            'expires_at': state['expires_at'].isoformat() if is_open and state['expires_at'] else None,
+            'attendance_count': AttendanceStateService.get_count(self.event_id) if self.is_admin else 0,
+        }
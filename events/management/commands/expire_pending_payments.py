@@ -0,0 +1,35 @@
+"""
+Management command to expire PayMongo checkouts that were never paid
+Usage: python manage.py expire_pending_payments [--interval SECONDS]
+
+Run it from cron every few minutes, or with --interval as a small long-lived loop.
+"""
+import time
+from django.core.management.base import BaseCommand
+from events.services.payment_expiry import PaymentExpiryService
+
+
+class Command(BaseCommand):
+    help = 'Expire pending event and registration payments past their expires_at'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running and sweep every N seconds (0 = sweep once and exit)',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            stats = PaymentExpiryService.expire_overdue()
+            if stats['event_payments'] or stats['registration_payments'] or not interval:
+                self.stdout.write(self.style.SUCCESS(
+                    f"✅ Expired {stats['event_payments']} event payment(s) and "
+                    f"{stats['registration_payments']} registration payment(s), "
+                    f"reset {stats['registrations']} registration(s) in {stats['elapsed']:.2f}s"
+                ))
+            if not interval:
+                return
+            time.sleep(interval)
@@ -0,0 +1,74 @@
+"""
+Management command to issue missing attendance certificates for an event
+Usage: python manage.py generate_event_certificates <event_id> [--regenerate] [--prerender --workers N]
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from events.models import Event
+from events.services.certificate_service import CertificateService
+
+
+class Command(BaseCommand):
+    help = 'Generate certificates for all present attendees of an event who do not have one yet'
+
+    def add_arguments(self, parser):
+        parser.add_argument('event_ids', nargs='+', type=int, help='Event ID(s)')
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=settings.CERTIFICATE_GENERATION_WORKERS,
+            help='Number of rendering worker processes for --prerender (1 = render inline)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=50,
+            help='Certificates created per batch',
+        )
+        parser.add_argument(
+            '--regenerate',
+            action='store_true',
+            help='Drop stored certificate files created before the current certificate template '
+                 'so they re-render over it on next download',
+        )
+        parser.add_argument(
+            '--prerender',
+            action='store_true',
+            help='Render new certificates into the certificate cache now instead of on first download',
+        )
+        parser.add_argument(
+            '--no-notify',
+            action='store_true',
+            help='Do not send in-app notifications for new certificates',
+        )
+
+    def handle(self, *args, **options):
+        events = Event.objects.filter(id__in=options['event_ids'])
+        missing = set(options['event_ids']) - set(events.values_list('id', flat=True))
+        if missing:
+            raise CommandError(f"Event(s) not found: {', '.join(str(i) for i in sorted(missing))}")
+
+        for event in events:
+            self.stdout.write(f"\n📜 {event.title} (ID {event.id})")
+            if options['regenerate'] and not CertificateService.get_template_layout(event):
+                self.stdout.write(self.style.WARNING('   No certificate template uploaded - nothing to regenerate'))
+
+            def report(stats):
+                done = stats['generated'] + stats['skipped']
+                self.stdout.write(f"   {done}/{stats['total']} processed ({stats['rate']:.1f}/s)")
+
+            stats = CertificateService.generate_event_certificates(
+                event,
+                workers=max(1, options['workers']),
+                batch_size=max(1, options['batch_size']),
+                regenerate=options['regenerate'],
+                prerender=options['prerender'],
+                notify=not options['no_notify'],
+                progress=report,
+            )
+
+            self.stdout.write(self.style.SUCCESS(
+                f"✅ Generated {stats['generated']}, regenerated {stats['regenerated']}, "
+                f"prerendered {stats['rendered']}, skipped {stats['skipped']}, failed {stats['failed']} "
+                f"in {stats['elapsed']:.1f}s ({stats['rate']:.1f} certificates/s)"
+            ))
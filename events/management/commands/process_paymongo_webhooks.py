@@ -0,0 +1,41 @@
+"""
+Management command to apply queued PayMongo webhook events
+Usage: python manage.py process_paymongo_webhooks [--interval SECONDS] [--limit N]
+
+Run it as a worker with --interval when PAYMONGO_WEBHOOK_DRAIN_IN_THREAD is
+False, or once from cron to pick up events left pending by a restart.
+"""
+import time
+from django.core.management.base import BaseCommand
+from events.services.paymongo_webhook import PayMongoWebhookService
+
+
+class Command(BaseCommand):
+    help = 'Apply pending PayMongo webhook events from the webhook inbox'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running and poll every N seconds (0 = drain once and exit)',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=100,
+            help='Maximum number of events to apply per pass',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            stats = PayMongoWebhookService.process_pending(limit=options['limit'])
+            if any(stats.values()) or not interval:
+                self.stdout.write(self.style.SUCCESS(
+                    f"✅ Processed {stats['processed']}, ignored {stats['ignored']}, "
+                    f"failed {stats['failed']} webhook event(s)"
+                ))
+            if not interval:
+                return
+            time.sleep(interval)
@@ -0,0 +1,31 @@
+"""
+Management command to close attendance sessions past their auto-stop time
+Usage: python manage.py stop_expired_attendance_sessions [--interval SECONDS]
+
+Run it from cron every minute, or with --interval as a small long-lived loop.
+"""
+import time
+from django.core.management.base import BaseCommand
+from events.services.attendance_state import AttendanceStateService
+
+
+class Command(BaseCommand):
+    help = 'Stop active attendance sessions whose auto_stop_minutes have elapsed'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=int,
+            default=0,
+            help='Keep running and check every N seconds (0 = check once and exit)',
+        )
+
+    def handle(self, *args, **options):
+        interval = options['interval']
+        while True:
+            stopped = AttendanceStateService.stop_expired_sessions()
+            if stopped or not interval:
+                self.stdout.write(self.style.SUCCESS(f"✅ Stopped {stopped} expired attendance session(s)"))
+            if not interval:
+                return
+            time.sleep(interval)
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:13
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0014_attendancesession_certificatetemplate_and_more'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='eventcertificate',
+            name='certificate_file',
+            field=models.ImageField(blank=True, help_text='Stored certificate PNG (empty = rendered on demand)', upload_to='event_certificates/'),
+        ),
+    ]
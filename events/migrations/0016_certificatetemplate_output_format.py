@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-19 16:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0015_alter_eventcertificate_certificate_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='certificatetemplate',
+            name='output_format',
+            field=models.CharField(choices=[('png', 'PNG image'), ('pdf', 'PDF (vector text)')], default='png', help_text='File format of issued certificates', max_length=3),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:09
+
+from django.conf import settings
+from datetime import timedelta
+
+from django.db import migrations, models
+from django.db.models import ExpressionWrapper, F
+
+
+def backfill_expires_at(apps, schema_editor):
+    """Give pending PayMongo checkouts created before expiry tracking a deadline"""
+    EventPayment = apps.get_model('events', 'EventPayment')
+    EventPayment.objects.filter(
+        status='pending', expires_at__isnull=True, paymongo_source_id__isnull=False
+    ).update(
+        expires_at=ExpressionWrapper(F('created_at') + timedelta(hours=1), output_field=models.DateTimeField())
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0017_paymongowebhookevent'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='eventpayment',
+            index=models.Index(fields=['status', 'expires_at'], name='events_even_status_2bafee_idx'),
+        ),
+        migrations.RunPython(backfill_expires_at, migrations.RunPython.noop),
+    ]
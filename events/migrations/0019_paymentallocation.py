@@ -0,0 +1,27 @@
+# Generated by Django 5.2.18 on 2026-10-19 17:32
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0018_eventpayment_status_expires_at_index'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PaymentAllocation',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.DecimalField(decimal_places=2, max_digits=10, verbose_name='Allocated Amount')),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('payment', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='allocations', to='events.eventpayment')),
+                ('registration', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='payment_allocations', to='events.eventregistration')),
+            ],
+            options={
+                'constraints': [models.UniqueConstraint(fields=('payment', 'registration'), name='unique_payment_allocation')],
+            },
+        ),
+    ]
@@ -0,0 +1,35 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:16
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0019_paymentallocation'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['event', 'status'], name='events_atte_event_i_e8472a_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='attendance',
+            index=models.Index(fields=['user', 'status'], name='events_atte_user_id_c6ca96_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='event',
+            index=models.Index(fields=['date', 'time'], name='events_even_date_3a55f7_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventregistration',
+            index=models.Index(fields=['user', 'payment_status'], name='events_even_user_id_5b8438_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='eventregistration',
+            index=models.Index(fields=['payment_status', 'registered_at'], name='events_even_payment_a0a1ae_idx'),
+        ),
+    ]
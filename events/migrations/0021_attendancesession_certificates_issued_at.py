@@ -0,0 +1,28 @@
+# Generated by Django 5.2.18 on 2026-10-19 18:40
+
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_stopped_sessions_issued(apps, schema_editor):
+    # Sessions stopped before this field existed issued their certificates inline
+    AttendanceSession = apps.get_model('events', 'AttendanceSession')
+    AttendanceSession.objects.filter(is_active=False, stopped_at__isnull=False).update(
+        certificates_issued_at=F('stopped_at')
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('events', '0020_hot_path_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='attendancesession',
+            name='certificates_issued_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.RunPython(mark_stopped_sessions_issued, migrations.RunPython.noop),
+    ]
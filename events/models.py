@@ -1,7 +1,9 @@
+from django.conf import settings
 from django.db import models
 from django.utils import timezone
 from accounts.models import User
 from decimal import Decimal
+from datetime import timedelta
 
 def get_current_time():
     return timezone.now().time()
@@ -19,6 +21,12 @@ class Event(models.Model):
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
 
+    class Meta:
+        indexes = [
+            # Upcoming event lists: date__gte=today ordered by date, time
+            models.Index(fields=['date', 'time']),
+        ]
+
     def __str__(self):
         return self.title
 
@@ -55,6 +63,10 @@ class Attendance(models.Model):
     class Meta:
         unique_together = ('event', 'user')
         ordering = ['event', 'user']
+        indexes = [
+            models.Index(fields=['event', 'status']),
+            models.Index(fields=['user', 'status']),
+        ]
 
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.event.title} ({self.status})"
@@ -105,11 +117,18 @@ class EventPayment(models.Model):
             models.Index(fields=["registration", "status", "created_at"]),
             models.Index(fields=["paymongo_source_id"]),
             models.Index(fields=["paymongo_payment_id"]),
+            models.Index(fields=["status", "expires_at"]),
         ]
 
     def __str__(self):
         return f"{self.registration.user.get_full_name()} - {self.registration.event.title} - ₱{self.amount} ({self.get_status_display()})"
     
+    def save(self, *args, **kwargs):
+        # PayMongo checkout links lapse; give every new one a deadline for the expiry sweep
+        if self.expires_at is None and self.status == 'pending' and self.paymongo_source_id:
+            self.expires_at = timezone.now() + timedelta(minutes=settings.PAYMONGO_SOURCE_LIFETIME_MINUTES)
+        super().save(*args, **kwargs)
+    
     def mark_as_expired(self):
         """Mark payment as expired"""
         self.is_expired = True
@@ -148,6 +167,10 @@ class EventRegistration(models.Model):
     class Meta:
         unique_together = ('event', 'user')
         ordering = ['-registered_at']
+        indexes = [
+            models.Index(fields=['user', 'payment_status']),
+            models.Index(fields=['payment_status', 'registered_at']),
+        ]
 
     def __str__(self):
         return f"{self.user.get_full_name()} - {self.event.title} ({self.rsvp})"
@@ -162,6 +185,12 @@ class EventRegistration(models.Model):
         """Check if registration is fully paid"""
         return self.total_paid >= self.amount_required
 
+    @property
+    def check_in_token(self):
+        """Signed token encoded in this registration's check-in QR code"""
+        from events.services.check_in_token import CheckInTokenService
+        return CheckInTokenService.make_token(self)
+
     def update_payment_status(self):
         """Update payment status based on total paid vs required"""
         if self.amount_required == 0:
@@ -184,6 +213,35 @@ class EventRegistration(models.Model):
                 self.payment_status = 'not_required'
                 self.amount_required = Decimal('0.00')
         super().save(*args, **kwargs)
+        # A payment status change may revoke a cached check-in eligibility
+        from events.services.attendance_state import AttendanceStateService
+        AttendanceStateService.forget_eligible(self.event_id)
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        from events.services.attendance_state import AttendanceStateService
+        AttendanceStateService.forget_eligible(self.event_id)
+        return result
+
+
+class PaymentAllocation(models.Model):
+    """
+    Share of one PayMongo payment credited to one event registration.
+    A teacher's bulk checkout is a single EventPayment; its allocations say
+    which registrations it pays for, so verification can credit them all.
+    """
+    payment = models.ForeignKey(EventPayment, on_delete=models.CASCADE, related_name='allocations')
+    registration = models.ForeignKey(EventRegistration, on_delete=models.CASCADE, related_name='payment_allocations')
+    amount = models.DecimalField(max_digits=10, decimal_places=2, verbose_name="Allocated Amount")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['payment', 'registration'], name='unique_payment_allocation'),
+        ]
+
+    def __str__(self):
+        return f"{self.payment_id} → registration {self.registration_id}: ₱{self.amount}"
 
 
 class AttendanceSession(models.Model):
@@ -194,6 +252,8 @@ class AttendanceSession(models.Model):
     started_by = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True, related_name='started_attendance_sessions')
     stopped_at = models.DateTimeField(null=True, blank=True)
     auto_stop_minutes = models.IntegerField(default=0, help_text="Auto-stop after X minutes (0 = manual only)")
+    # Set once certificates for the last stop were issued (or claimed by a worker)
+    certificates_issued_at = models.DateTimeField(null=True, blank=True)
     
     class Meta:
         ordering = ['-started_at']
@@ -202,12 +262,26 @@ class AttendanceSession(models.Model):
         status = "Active" if self.is_active else "Inactive"
         return f"{self.event.title} - Attendance Session ({status})"
     
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        # Drop the cached state mark_my_attendance reads
+        from events.services.attendance_state import AttendanceStateService
+        AttendanceStateService.forget_session(self.event_id)
+    
+    @property
+    def expires_at(self):
+        """When the session auto-stops, or None for manual-only sessions"""
+        if not self.auto_stop_minutes or not self.started_at:
+            return None
+        return self.started_at + timedelta(minutes=self.auto_stop_minutes)
+    
     def start(self, admin_user):
         """Start the attendance session"""
         self.is_active = True
         self.started_at = timezone.now()
         self.started_by = admin_user
         self.stopped_at = None
+        self.certificates_issued_at = None
         self.save()
     
     def stop(self):
@@ -246,6 +320,12 @@ class CertificateTemplate(models.Model):
     cert_number_font_size = models.IntegerField(default=20, help_text="Font size for certificate number")
     cert_number_color = models.CharField(max_length=7, default="#666666", help_text="Hex color for cert number")
     
+    OUTPUT_FORMAT_CHOICES = [
+        ('png', 'PNG image'),
+        ('pdf', 'PDF (vector text)'),
+    ]
+    output_format = models.CharField(max_length=3, choices=OUTPUT_FORMAT_CHOICES, default='png', help_text="File format of issued certificates")
+    
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     
@@ -262,7 +342,7 @@ class EventCertificate(models.Model):
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name='certificates')
     attendance = models.OneToOneField(Attendance, on_delete=models.CASCADE, related_name='certificate', null=True, blank=True)
     certificate_number = models.CharField(max_length=50, unique=True, help_text="Unique certificate identifier")
-    certificate_file = models.ImageField(upload_to='event_certificates/', help_text="Generated certificate PNG")
+    certificate_file = models.ImageField(upload_to='event_certificates/', blank=True, help_text="Stored certificate PNG (empty = rendered on demand)")
     generated_at = models.DateTimeField(auto_now_add=True)
     
     class Meta:
@@ -277,3 +357,34 @@ class EventCertificate(models.Model):
         """Generate unique certificate number"""
         timestamp = timezone.now().strftime("%Y%m%d%H%M%S")
         return f"CERT-{event_id}-{user_id}-{timestamp}"
+
+
+class PayMongoWebhookEvent(models.Model):
+    """
+    Inbox of received PayMongo webhook events, keyed by PayMongo's event id.
+    The webhook only stores the event; a worker applies it exactly once.
+    """
+    STATUS_CHOICES = [
+        ('pending', 'Pending'),
+        ('processed', 'Processed'),
+        ('ignored', 'Ignored'),
+        ('failed', 'Failed'),
+    ]
+    
+    event_id = models.CharField(max_length=100, unique=True, help_text="PayMongo event id (evt_...)")
+    event_type = models.CharField(max_length=50)
+    payload = models.JSONField()
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    attempts = models.PositiveIntegerField(default=0)
+    last_error = models.TextField(blank=True)
+    received_at = models.DateTimeField(auto_now_add=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    
+    class Meta:
+        ordering = ['received_at']
+        indexes = [
+            models.Index(fields=['status', 'received_at']),
+        ]
+    
+    def __str__(self):
+        return f"{self.event_type} {self.event_id} ({self.get_status_display()})"
@@ -7,28 +7,201 @@ import base64
 import hashlib
 import hmac
 import json
+import logging
+import threading
+import time
+from functools import lru_cache
 from django.conf import settings
 from datetime import datetime, timedelta
 from decimal import Decimal
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 
+logger = logging.getLogger(__name__)
 
-class PayMongoService:
+# One keep-alive session per process, shared by every PayMongoService
+_session = None
+_session_lock = threading.Lock()
+
+# Per-endpoint call metrics: {'GET sources': {'calls', 'errors', 'total_ms', 'max_ms'}}
+_metrics = {}
+_metrics_lock = threading.Lock()
+
+
+def get_session():
+    """Pooled requests session for PayMongo, created on first use"""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                retry = Retry(
+                    total=settings.PAYMONGO_GET_RETRIES,
+                    backoff_factor=settings.PAYMONGO_RETRY_BACKOFF,
+                    status_forcelist=(429, 500, 502, 503, 504),
+                    # Read errors and error statuses are only retried for GETs;
+                    # connect errors are retried for any method (nothing was sent)
+                    allowed_methods=frozenset({'GET'}),
+                    raise_on_status=False,
+                )
+                adapter = HTTPAdapter(
+                    pool_connections=1,
+                    pool_maxsize=settings.PAYMONGO_POOL_SIZE,
+                    max_retries=retry,
+                )
+                session = requests.Session()
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                _session = session
+    return _session
+
+
+def reset_session():
+    """Close the shared session so the next call builds one from current settings"""
+    global _session
+    with _session_lock:
+        if _session is not None:
+            _session.close()
+        _session = None
+
+
+def get_metrics():
+    """Snapshot of per-endpoint PayMongo call counts and latencies"""
+    with _metrics_lock:
+        return {endpoint: dict(stats) for endpoint, stats in _metrics.items()}
+
+
+def reset_metrics():
+    with _metrics_lock:
+        _metrics.clear()
+
+
+def _record(endpoint, elapsed_ms, error):
+    with _metrics_lock:
+        stats = _metrics.setdefault(endpoint, {'calls': 0, 'errors': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+        stats['calls'] += 1
+        stats['errors'] += int(error)
+        stats['total_ms'] += elapsed_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+
+
+@lru_cache(maxsize=4)
+def _auth_header(secret_key):
+    encoded = base64.b64encode(f"{secret_key}:".encode()).decode()
+    return {
+        'Authorization': f'Basic {encoded}',
+        'Content-Type': 'application/json'
+    }
+
+
+class BasePayMongoService:
+    """
+    Configuration, request bodies and result handling shared by the sync
+    and async PayMongo clients; each client does its own I/O.
+    """
     BASE_URL = "https://api.paymongo.com/v1"
     
     def __init__(self):
         self.secret_key = settings.PAYMONGO_SECRET_KEY
         self.public_key = settings.PAYMONGO_PUBLIC_KEY
         self.webhook_secret = settings.PAYMONGO_WEBHOOK_SECRET
+        self.base_url = getattr(settings, 'PAYMONGO_API_BASE', self.BASE_URL).rstrip('/')
     
     def _get_auth_header(self):
-        """Generate Basic Auth header for PayMongo API"""
-        credentials = f"{self.secret_key}:"
-        encoded = base64.b64encode(credentials.encode()).decode()
+        """Basic Auth header for PayMongo API (encoded once per secret key)"""
+        return _auth_header(self.secret_key)
+    
+    @staticmethod
+    def _source_payload(amount, type, redirect_success, redirect_failed, metadata):
+        """Request body for creating a source"""
+        # Convert amount to centavos (PayMongo uses smallest currency unit)
+        return {
+            "data": {
+                "attributes": {
+                    "type": type,  # gcash, grab_pay, or paymaya
+                    "amount": int(amount * 100),
+                    "currency": "PHP",
+                    "redirect": {
+                        "success": redirect_success,
+                        "failed": redirect_failed
+                    },
+                    "metadata": metadata or {}
+                }
+            }
+        }
+    
+    @staticmethod
+    def _source_result(result):
+        # PayMongo returns data in {'data': {...}} format
+        # Return the data object directly for easier access
+        if 'data' in result:
+            return result['data']
+        return result
+    
+    @staticmethod
+    def _source_error(status_code, body, fallback):
+        """Error dict returned by create_source, with PayMongo's error detail when present"""
+        error_detail = fallback or "Unknown error"
+        try:
+            error_json = json.loads(body)
+            if error_json.get('errors'):
+                error_detail = error_json['errors'][0].get('detail', error_detail)
+        except (ValueError, AttributeError):
+            error_detail = body or error_detail
+        print(f"PayMongo error detail: {error_detail}")
+        return {'error': True, 'message': error_detail, 'status_code': status_code}
+    
+    @staticmethod
+    def _payment_payload(source_id, amount, description):
+        """Request body for creating a payment from a source"""
         return {
-            'Authorization': f'Basic {encoded}',
-            'Content-Type': 'application/json'
+            "data": {
+                "attributes": {
+                    "amount": int(amount * 100) if amount else None,  # Convert to centavos or use source amount
+                    "source": {
+                        "id": source_id,
+                        "type": "source"
+                    },
+                    "currency": "PHP",
+                    "description": description
+                }
+            }
         }
     
+    @staticmethod
+    def _payment_headers(idempotency_key):
+        """Extra headers for creating a payment"""
+        return {'Idempotency-Key': idempotency_key} if idempotency_key else {}
+
+
+class PayMongoService(BasePayMongoService):
+    """Blocking PayMongo client on the shared keep-alive session"""
+    
+    def _request(self, method, resource, path, **kwargs):
+        """
+        Send a request through the shared session, recording its latency
+        under "METHOD resource". Extra headers are sent along with the auth
+        header. Raises requests exceptions like requests does.
+        """
+        endpoint = f"{method} {resource}"
+        headers = {**self._get_auth_header(), **kwargs.pop('headers', {})}
+        started = time.perf_counter()
+        error = True
+        try:
+            response = get_session().request(
+                method,
+                f"{self.base_url}/{path}",
+                headers=headers,
+                timeout=(settings.PAYMONGO_CONNECT_TIMEOUT, settings.PAYMONGO_READ_TIMEOUT),
+                **kwargs
+            )
+            response.raise_for_status()
+            error = False
+            return response
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            _record(endpoint, elapsed_ms, error)
+            logger.info(f"PayMongo {endpoint} took {elapsed_ms:.0f}ms{' (failed)' if error else ''}")
+    
     def create_source(self, amount, type='gcash', redirect_success=None, redirect_failed=None, metadata=None):
         """
         Create a PayMongo Source for QR code payment
@@ -43,64 +216,22 @@ class PayMongoService:
         Returns:
             dict: PayMongo source response or None if failed
         """
-        # Convert amount to centavos (PayMongo uses smallest currency unit)
-        amount_centavos = int(amount * 100)
-        
-        # Source expires in 1 hour
-        expires_at = int((datetime.now() + timedelta(hours=1)).timestamp())
-        
-        # Extract user info from metadata if provided
-        user_email = metadata.get('user_email', '') if metadata else ''
-        registration_id = metadata.get('registration_id', '') if metadata else ''
-        
-        payload = {
-            "data": {
-                "attributes": {
-                    "type": type,  # gcash, grab_pay, or paymaya
-                    "amount": amount_centavos,
-                    "currency": "PHP",
-                    "redirect": {
-                        "success": redirect_success,
-                        "failed": redirect_failed
-                    },
-                    "metadata": metadata or {}
-                }
-            }
-        }
+        payload = self._source_payload(amount, type, redirect_success, redirect_failed, metadata)
         
         try:
-            response = requests.post(
-                f"{self.BASE_URL}/sources",
-                headers=self._get_auth_header(),
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
-            result = response.json()
-            
-            # PayMongo returns data in {'data': {...}} format
-            # Return the data object directly for easier access
-            if 'data' in result:
-                return result['data']
-            return result
+            response = self._request('POST', 'sources', 'sources', json=payload)
+            return self._source_result(response.json())
             
         except requests.exceptions.RequestException as e:
             print(f"PayMongo create_source error: {e}")
-            error_detail = "Unknown error"
-            if hasattr(e, 'response') and e.response is not None:
+            if getattr(e, 'response', None) is not None:
                 print(f"Response status: {e.response.status_code}")
                 print(f"Response body: {e.response.text}")
-                try:
-                    error_json = e.response.json()
-                    if 'errors' in error_json and len(error_json['errors']) > 0:
-                        error_detail = error_json['errors'][0].get('detail', str(e))
-                    print(f"PayMongo error detail: {error_detail}")
-                except:
-                    error_detail = e.response.text if e.response.text else str(e)
+                return self._source_error(e.response.status_code, e.response.text, str(e))
             # Return error dict instead of None for better error handling
-            return {'error': True, 'message': error_detail, 'status_code': e.response.status_code if hasattr(e, 'response') else 500}
+            return self._source_error(500, '', str(e))
     
-    def create_payment(self, source_id, amount=None, description="Payment"):
+    def create_payment(self, source_id, amount=None, description="Payment", idempotency_key=None):
         """
         Create a Payment from a chargeable Source
         Called when source.chargeable webhook is received
@@ -109,32 +240,17 @@ class PayMongoService:
             source_id (str): PayMongo source ID
             amount (Decimal): Payment amount (optional, uses source amount if not provided)
             description (str): Payment description
+            idempotency_key (str): Sent as Idempotency-Key so a retried call
+                returns the payment already created instead of charging again
         
         Returns:
             dict: PayMongo payment response or None if failed
         """
-        payload = {
-            "data": {
-                "attributes": {
-                    "amount": int(amount * 100) if amount else None,  # Convert to centavos or use source amount
-                    "source": {
-                        "id": source_id,
-                        "type": "source"
-                    },
-                    "currency": "PHP",
-                    "description": description
-                }
-            }
-        }
+        payload = self._payment_payload(source_id, amount, description)
+        headers = self._payment_headers(idempotency_key)
         
         try:
-            response = requests.post(
-                f"{self.BASE_URL}/payments",
-                headers=self._get_auth_header(),
-                json=payload,
-                timeout=30
-            )
-            response.raise_for_status()
+            response = self._request('POST', 'payments', 'payments', json=payload, headers=headers)
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"PayMongo create_payment error: {e}")
@@ -191,12 +307,7 @@ class PayMongoService:
             dict: Source data or None
         """
         try:
-            response = requests.get(
-                f"{self.BASE_URL}/sources/{source_id}",
-                headers=self._get_auth_header(),
-                timeout=30
-            )
-            response.raise_for_status()
+            response = self._request('GET', 'sources', f"sources/{source_id}")
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"PayMongo get_source error: {e}")
@@ -213,13 +324,147 @@ class PayMongoService:
             dict: Payment data or None
         """
         try:
-            response = requests.get(
-                f"{self.BASE_URL}/payments/{payment_id}",
-                headers=self._get_auth_header(),
-                timeout=30
-            )
-            response.raise_for_status()
+            response = self._request('GET', 'payments', f"payments/{payment_id}")
             return response.json()
         except requests.exceptions.RequestException as e:
             print(f"PayMongo get_payment error: {e}")
             return None
+
+
+class AsyncPayMongoService(BasePayMongoService):
+    """
+    Non-blocking PayMongo client for async views, built on aiohttp.
+    Same requests, results and error dicts as PayMongoService (it shares
+    BasePayMongoService rather than subclassing it, so a PayMongoService is
+    never handed coroutines by mistake); idempotent
+    GETs are retried with the same backoff settings. Each call opens its own
+    aiohttp session: sessions are bound to an event loop, and Django runs
+    async views on a fresh loop per request outside ASGI.
+    """
+    
+    RETRY_STATUSES = (429, 500, 502, 503, 504)
+    
+    def _timeout(self):
+        import aiohttp
+        return aiohttp.ClientTimeout(
+            connect=settings.PAYMONGO_CONNECT_TIMEOUT,
+            sock_read=settings.PAYMONGO_READ_TIMEOUT,
+        )
+    
+    async def _request(self, method, resource, path, json=None, headers=None):
+        """
+        Send a request and return (status, body text), recording its latency
+        like the sync client. Raises aiohttp.ClientError / asyncio.TimeoutError
+        on connection problems after any retries.
+        """
+        import asyncio
+        import aiohttp
+        
+        endpoint = f"{method} {resource}"
+        attempts = settings.PAYMONGO_GET_RETRIES + 1 if method == 'GET' else 1
+        started = time.perf_counter()
+        error = True
+        try:
+            async with aiohttp.ClientSession(headers=self._get_auth_header(), timeout=self._timeout()) as session:
+                for attempt in range(attempts):
+                    if attempt:
+                        await asyncio.sleep(settings.PAYMONGO_RETRY_BACKOFF * (2 ** (attempt - 1)))
+                    try:
+                        async with session.request(
+                            method, f"{self.base_url}/{path}", json=json, headers=headers
+                        ) as response:
+                            status, body = response.status, await response.text()
+                    except (aiohttp.ClientError, asyncio.TimeoutError):
+                        if attempt == attempts - 1:
+                            raise
+                        continue
+                    if status not in self.RETRY_STATUSES or attempt == attempts - 1:
+                        break
+            error = status >= 400
+            return status, body
+        finally:
+            elapsed_ms = (time.perf_counter() - started) * 1000
+            _record(endpoint, elapsed_ms, error)
+            logger.info(f"PayMongo {endpoint} took {elapsed_ms:.0f}ms (async){' (failed)' if error else ''}")
+    
+    async def create_source(self, amount, type='gcash', redirect_success=None, redirect_failed=None, metadata=None):
+        """Async PayMongoService.create_source: source data dict, or an error dict"""
+        import asyncio
+        import aiohttp
+        
+        payload = self._source_payload(amount, type, redirect_success, redirect_failed, metadata)
+        try:
+            status, body = await self._request('POST', 'sources', 'sources', json=payload)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"PayMongo create_source error: {e!r}")
+            return self._source_error(500, '', repr(e))
+        if status >= 400:
+            logger.error(f"PayMongo create_source error: {status} {body}")
+            return self._source_error(status, body, f"HTTP {status}")
+        return self._source_result(json.loads(body))
+    
+    async def create_payment(self, source_id, amount=None, description="Payment", idempotency_key=None):
+        """Async PayMongoService.create_payment: payment response, or None if failed"""
+        return await self._get_json(
+            'POST', 'payments', 'payments', self._payment_payload(source_id, amount, description),
+            headers=self._payment_headers(idempotency_key),
+        )
+    
+    async def get_source(self, source_id):
+        """Async PayMongoService.get_source: source response, or None"""
+        return await self._get_json('GET', 'sources', f"sources/{source_id}")
+    
+    async def get_payment(self, payment_id):
+        """Async PayMongoService.get_payment: payment response, or None"""
+        return await self._get_json('GET', 'payments', f"payments/{payment_id}")
+    
+    async def _get_json(self, method, resource, path, payload=None, headers=None):
+        import asyncio
+        import aiohttp
+        
+        try:
+            status, body = await self._request(method, resource, path, json=payload, headers=headers)
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            logger.error(f"PayMongo {method} {resource} error: {e!r}")
+            return None
+        if status >= 400:
+            logger.error(f"PayMongo {method} {resource} error: {status} {body}")
+            return None
+        return json.loads(body)
+
+
+class PendingCheckout:
+    """
+    A checkout a sync view prepared but that still needs a PayMongo source.
+    The async view awaits the source with run_checkout, so the worker is not
+    blocked on the gateway, then hands the result to finish().
+    
+    Args:
+        source_kwargs (dict): Arguments for create_source
+        finish (callable): finish(source_response) -> HttpResponse, run sync
+        on_error (callable): on_error(exception) -> HttpResponse, run sync if
+            creating the source or finish() raises; re-raised when omitted
+    """
+    
+    def __init__(self, source_kwargs, finish, on_error=None):
+        self.source_kwargs = source_kwargs
+        self.finish = finish
+        self.on_error = on_error
+
+
+async def run_checkout(result):
+    """
+    Complete a PendingCheckout returned by a sync view body; any other
+    result (an HttpResponse) is passed through unchanged.
+    """
+    from asgiref.sync import sync_to_async
+    
+    if not isinstance(result, PendingCheckout):
+        return result
+    try:
+        source_response = await AsyncPayMongoService().create_source(**result.source_kwargs)
+        return await sync_to_async(result.finish)(source_response)
+    except Exception as e:
+        if result.on_error is None:
+            raise
+        return await sync_to_async(result.on_error)(e)
@@ -1,4 +1,16 @@
 """Events services package"""
 from .certificate_service import CertificateService
+from .certificate_cache import CertificateCache
+from .attendance_state import AttendanceStateService
+from .check_in_token import CheckInTokenService
+from .paymongo_webhook import PayMongoWebhookService
+from .payment_expiry import PaymentExpiryService
 
-__all__ = ['CertificateService']
+__all__ = [
+    'CertificateService',
+    'CertificateCache',
+    'AttendanceStateService',
+    'CheckInTokenService',
+    'PayMongoWebhookService',
+    'PaymentExpiryService',
+]
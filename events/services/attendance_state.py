@@ -0,0 +1,350 @@
+"""
+Live attendance session state.
+Session changes and check-ins are pushed to a per-event channels group so
+event pages update over a websocket instead of polling the database.
+The attendance count is kept as an in-memory counter in the cache and is
+only seeded from the database when missing; session state (active flag and
+auto-stop deadline) is cached the same way so check-ins need no session query.
+Invalidation only reaches other web workers through a shared cache, so with
+a process-local cache session state and registrants are kept for a few
+seconds only.
+"""
+import logging
+import threading
+from asgiref.sync import async_to_sync
+from channels.layers import get_channel_layer
+from django.conf import settings
+from django.core.cache import cache
+from django.db import close_old_connections
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class AttendanceStateService:
+    """Per-event attendance broadcast groups and live counters"""
+
+    COUNT_KEY = 'attendance_count:{event_id}'
+    SESSION_KEY = 'attendance_session:{event_id}'
+    ELIGIBLE_KEY = 'attendance_eligible:{event_id}'
+    ELIGIBLE_PAYMENT_STATUSES = ('not_required', 'paid')
+    # Re-seed from the database now and then so edits made elsewhere heal
+    COUNT_TIMEOUT = 60 * 60
+    # Session state lifetime when each worker has its own cache and never sees another's invalidation
+    LOCAL_STATE_TIMEOUT = 5
+    _certificate_lock = threading.Lock()
+
+    @staticmethod
+    def group_name(event_id):
+        """Channels group every viewer of the event page joins"""
+        return f'event_{event_id}_attendance'
+
+    @staticmethod
+    def admin_group_name(event_id):
+        """Channels group for admins, who also receive the live count"""
+        return f'event_{event_id}_attendance_admin'
+
+    @staticmethod
+    def state_timeout():
+        """Cache lifetime of session state and registrants for the configured cache backend"""
+        if settings.CACHES['default']['BACKEND'].endswith('LocMemCache'):
+            return AttendanceStateService.LOCAL_STATE_TIMEOUT
+        return AttendanceStateService.COUNT_TIMEOUT
+
+    @staticmethod
+    def get_count(event_id):
+        """Current attendance count, seeded from the database on a cache miss"""
+        key = AttendanceStateService.COUNT_KEY.format(event_id=event_id)
+        count = cache.get(key)
+        if count is None:
+            from events.models import Attendance
+            count = Attendance.objects.filter(event_id=event_id).count()
+            # add() keeps a counter another process seeded first
+            cache.add(key, count, timeout=AttendanceStateService.COUNT_TIMEOUT)
+            count = cache.get(key, count)
+        return count
+
+    @staticmethod
+    def record_check_in(event_id):
+        """Increment the live count after an attendance row was created and push it to admins"""
+        key = AttendanceStateService.COUNT_KEY.format(event_id=event_id)
+        try:
+            count = cache.incr(key)
+        except ValueError:
+            # Not seeded yet: the seed query already includes the new row
+            count = AttendanceStateService.get_count(event_id)
+        AttendanceStateService._send(
+            AttendanceStateService.admin_group_name(event_id),
+            {'type': 'attendance.count', 'attendance_count': count},
+        )
+        return count
+
+    @staticmethod
+    def reset_count(event_id):
+        """Drop the counter after bulk attendance edits and push the recount"""
+        cache.delete(AttendanceStateService.COUNT_KEY.format(event_id=event_id))
+        count = AttendanceStateService.get_count(event_id)
+        AttendanceStateService._send(
+            AttendanceStateService.admin_group_name(event_id),
+            {'type': 'attendance.count', 'attendance_count': count},
+        )
+        return count
+
+    @staticmethod
+    def get_session_state(event_id):
+        """
+        Cached session state for an event, loaded with one query on a miss.
+        
+        Returns:
+            dict with is_active and expires_at (None for manual-only sessions)
+        """
+        key = AttendanceStateService.SESSION_KEY.format(event_id=event_id)
+        state = cache.get(key)
+        if state is None:
+            from events.models import AttendanceSession
+            session = AttendanceSession.objects.filter(event_id=event_id).first()
+            state = {
+                'is_active': bool(session and session.is_active),
+                'expires_at': session.expires_at if session else None,
+            }
+            cache.set(key, state, timeout=AttendanceStateService.state_timeout())
+        return state
+    
+    @staticmethod
+    def session_is_open(state, now=None):
+        """Whether a cached session state accepts check-ins right now"""
+        if not state['is_active']:
+            return False
+        expires_at = state['expires_at']
+        return expires_at is None or (now or timezone.now()) < expires_at
+    
+    @staticmethod
+    def forget_session(event_id):
+        """Drop cached session state after the session row changed"""
+        cache.delete_many([
+            AttendanceStateService.SESSION_KEY.format(event_id=event_id),
+            AttendanceStateService.ELIGIBLE_KEY.format(event_id=event_id),
+        ])
+    
+    @staticmethod
+    def forget_eligible(event_id):
+        """Drop the cached registrant set after a registration changed or was deleted"""
+        cache.delete(AttendanceStateService.ELIGIBLE_KEY.format(event_id=event_id))
+    
+    @staticmethod
+    def get_eligible_user_ids(event_id):
+        """IDs of registrants allowed to check in, loaded once per session and cached"""
+        key = AttendanceStateService.ELIGIBLE_KEY.format(event_id=event_id)
+        user_ids = cache.get(key)
+        if user_ids is None:
+            from events.models import EventRegistration
+            user_ids = frozenset(
+                EventRegistration.objects.filter(
+                    event_id=event_id,
+                    payment_status__in=AttendanceStateService.ELIGIBLE_PAYMENT_STATUSES,
+                ).values_list('user_id', flat=True)
+            )
+            cache.set(key, user_ids, timeout=AttendanceStateService.state_timeout())
+        return user_ids
+    
+    @staticmethod
+    def check_eligibility(event_id, user_id):
+        """
+        Whether a user may check in to an event.
+        Cached registrants pass without a query; anyone else (e.g. paid after
+        the session started) is looked up directly.
+        
+        Returns:
+            'eligible', 'not_registered' or 'payment_required'
+        """
+        if user_id in AttendanceStateService.get_eligible_user_ids(event_id):
+            return 'eligible'
+        
+        from events.models import EventRegistration
+        payment_status = EventRegistration.objects.filter(
+            event_id=event_id, user_id=user_id
+        ).values_list('payment_status', flat=True).first()
+        if payment_status is None:
+            return 'not_registered'
+        if payment_status not in AttendanceStateService.ELIGIBLE_PAYMENT_STATUSES:
+            return 'payment_required'
+        return 'eligible'
+    
+    @staticmethod
+    def record_check_ins(event_id, user_ids, marked_by):
+        """
+        Record many check-ins at once: one query for existing rows and one
+        bulk INSERT for the rest.
+        
+        Returns:
+            Set of user IDs newly marked present
+        """
+        from events.models import Attendance
+        
+        user_ids = set(user_ids)
+        if not user_ids:
+            return set()
+        existing = set(
+            Attendance.objects.filter(event_id=event_id, user_id__in=user_ids).values_list('user_id', flat=True)
+        )
+        new_ids = user_ids - existing
+        # ignore_conflicts covers a concurrent single check-in racing this batch
+        Attendance.objects.bulk_create(
+            [
+                Attendance(event_id=event_id, user_id=user_id, status='present', marked_by=marked_by)
+                for user_id in new_ids
+            ],
+            ignore_conflicts=True,
+        )
+        if new_ids:
+            AttendanceStateService.reset_count(event_id)
+        return new_ids
+    
+    @staticmethod
+    def issue_certificates(event):
+        """
+        Issue the certificates deferred from check-in once a session closes.
+        Failures are logged; they never block closing the session.
+        """
+        from .certificate_service import CertificateService
+        try:
+            return CertificateService.generate_event_certificates(event)
+        except Exception as e:
+            logger.error(f"Certificate generation after attendance session failed for event {event.id}: {e}")
+            return None
+    
+    @staticmethod
+    def issue_pending_certificates(now=None):
+        """
+        Issue certificates for every stopped session that has not had them
+        yet. Each session is claimed with a conditional UPDATE so concurrent
+        workers never issue the same event twice; a failed run releases its
+        claim so the next one retries.
+        
+        Returns:
+            Number of sessions whose certificates were issued
+        """
+        from events.models import AttendanceSession
+        
+        now = now or timezone.now()
+        pending = AttendanceSession.objects.filter(
+            is_active=False, stopped_at__isnull=False, certificates_issued_at__isnull=True
+        ).select_related('event')
+        issued = 0
+        for session in pending:
+            if not AttendanceSession.objects.filter(id=session.id, certificates_issued_at__isnull=True).update(
+                certificates_issued_at=now
+            ):
+                continue  # Claimed by another worker
+            if AttendanceStateService.issue_certificates(session.event) is None:
+                AttendanceSession.objects.filter(id=session.id).update(certificates_issued_at=None)
+                continue
+            issued += 1
+        return issued
+    
+    @staticmethod
+    def queue_certificates(event_id, now=None):
+        """
+        Mark an event's certificates as due for the next issue run, e.g.
+        after check-ins recorded while no session is open. A closed session
+        is flagged again; an event that never had one gets a stopped session
+        to carry the flag. An active session issues them when it closes.
+        """
+        from django.db.models import Value
+        from django.db.models.functions import Coalesce
+        from events.models import AttendanceSession
+        
+        now = now or timezone.now()
+        session, created = AttendanceSession.objects.get_or_create(event_id=event_id, defaults={'stopped_at': now})
+        if not created:
+            AttendanceSession.objects.filter(id=session.id, is_active=False).update(
+                certificates_issued_at=None, stopped_at=Coalesce('stopped_at', Value(now)),
+            )
+    
+    @staticmethod
+    def issue_certificates_in_background():
+        """
+        Issue pending certificates on a background thread so stopping a
+        session returns at once, unless ATTENDANCE_CERTIFICATES_IN_THREAD
+        leaves it to the scheduler job. At most one thread runs per process;
+        it keeps going while sessions stopped meanwhile are still pending.
+        """
+        if not getattr(settings, 'ATTENDANCE_CERTIFICATES_IN_THREAD', True):
+            return None
+        if not AttendanceStateService._certificate_lock.acquire(blocking=False):
+            return None
+        
+        def issue():
+            try:
+                while AttendanceStateService.issue_pending_certificates():
+                    pass
+            except Exception as e:
+                logger.error(f"Background certificate issue failed: {e}", exc_info=True)
+            finally:
+                close_old_connections()
+                AttendanceStateService._certificate_lock.release()
+        
+        thread = threading.Thread(target=issue, name='attendance-certificates', daemon=True)
+        thread.start()
+        return thread
+    
+    @staticmethod
+    def stop_expired_sessions(now=None):
+        """
+        Close every active session whose auto-stop time has passed and
+        broadcast the change for each event, then issue the certificates of
+        stopped sessions. Each session is closed with a conditional UPDATE,
+        so when two sweeps overlap only the one that actually flipped a
+        session broadcasts it.
+        
+        Returns:
+            Number of sessions stopped
+        """
+        from events.models import AttendanceSession
+        
+        now = now or timezone.now()
+        # Only sessions that are active with an auto-stop are candidates; few at any time
+        candidates = AttendanceSession.objects.filter(
+            is_active=True, auto_stop_minutes__gt=0, started_at__isnull=False
+        ).select_related('event')
+        expired = [session for session in candidates if session.expires_at <= now]
+        if not expired:
+            return 0
+        
+        stopped = 0
+        for session in expired:
+            if not AttendanceSession.objects.filter(id=session.id, is_active=True).update(
+                is_active=False, stopped_at=now
+            ):
+                continue  # Stopped by someone else since it was selected
+            stopped += 1
+            session.is_active = False
+            session.stopped_at = now
+            AttendanceStateService.forget_session(session.event_id)
+            AttendanceStateService.broadcast_session(session)
+        
+        if stopped:
+            AttendanceStateService.issue_pending_certificates(now)
+        logger.info(f"Auto-stopped {stopped} expired attendance session(s)")
+        return stopped
+    
+    @staticmethod
+    def broadcast_session(session):
+        """Push a session start/stop to everyone viewing the event"""
+        AttendanceStateService._send(
+            AttendanceStateService.group_name(session.event_id),
+            {
+                'type': 'attendance.session',
+                'is_active': session.is_active,
+                'expires_at': session.expires_at.isoformat() if session.is_active and session.expires_at else None,
+                'attendance_count': AttendanceStateService.get_count(session.event_id),
+            },
+        )
+
+    @staticmethod
+    def _send(group, message):
+        # Broadcasting is best effort: a down channel layer must not fail the request
+        try:
+            async_to_sync(get_channel_layer().group_send)(group, message)
+        except Exception as e:
+            logger.warning(f"Attendance broadcast to {group} failed: {e}")
@@ -0,0 +1,145 @@
+"""
+Content-addressed disk cache for rendered certificates.
+Files are named by the hash of everything that affects the rendered output,
+so a changed template or name simply produces a new key and stale entries
+age out through size-bounded LRU eviction. Writes only add to a running size
+estimate per cache directory; the directory is walked when the estimate
+crosses the bound, and every RESCAN_EVERY writes to pick up files written by
+other processes.
+"""
+import os
+import hashlib
+import json
+import logging
+import tempfile
+import threading
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+
+class CertificateCache:
+    """Size-bounded on-disk cache of rendered certificate files"""
+
+    RESCAN_EVERY = 256
+    # Running size estimate and write count per cache root, shared by every instance in the process
+    _sizes = {}
+    _writes = {}
+    _lock = threading.Lock()
+
+    def __init__(self, root=None, max_bytes=None):
+        self.root = str(root or settings.CERTIFICATE_CACHE_DIR)
+        self.max_bytes = max_bytes if max_bytes is not None else settings.CERTIFICATE_CACHE_MAX_BYTES
+
+    @staticmethod
+    def make_key(*parts):
+        """Hash the given JSON-serializable parts into a cache key"""
+        encoded = json.dumps(parts, sort_keys=True, default=str).encode('utf-8')
+        return hashlib.sha256(encoded).hexdigest()
+
+    def path_for(self, key, extension='png'):
+        """Path of a cache entry (sharded by the first two hex digits)"""
+        return os.path.join(self.root, key[:2], f'{key}.{extension}')
+
+    def open(self, key, extension='png'):
+        """
+        Open a cached entry for reading and mark it recently used.
+
+        Returns:
+            file object, or None on a cache miss
+        """
+        path = self.path_for(key, extension)
+        try:
+            handle = open(path, 'rb')
+        except FileNotFoundError:
+            return None
+        try:
+            os.utime(path)
+        except OSError:
+            pass
+        return handle
+
+    def put(self, key, data, extension='png'):
+        """
+        Store an entry atomically and evict old entries if over the size bound.
+
+        Returns:
+            Path of the stored entry
+        """
+        path = self.path_for(key, extension)
+        try:
+            replaced = os.stat(path).st_size
+        except FileNotFoundError:
+            replaced = 0
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as tmp_file:
+                tmp_file.write(data)
+            os.replace(tmp_path, path)
+        except Exception:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self._account(len(data) - replaced)
+        return path
+
+    def _account(self, delta):
+        """Add a write to the size estimate and evict when it may be over the bound"""
+        if not self.max_bytes:
+            return
+        with CertificateCache._lock:
+            size = CertificateCache._sizes.get(self.root)
+            if size is not None:
+                size += delta
+                CertificateCache._sizes[self.root] = size
+            writes = CertificateCache._writes.get(self.root, 0) + 1
+            CertificateCache._writes[self.root] = writes
+        if size is None or size > self.max_bytes or writes % self.RESCAN_EVERY == 0:
+            self.evict()
+
+    def evict(self):
+        """Remove least recently used entries until the cache is under 90% of max_bytes"""
+        if not self.max_bytes:
+            return 0
+        if not os.path.isdir(self.root):
+            self._measured(0)
+            return 0
+
+        entries = []
+        total = 0
+        for dirpath, dirnames, filenames in os.walk(self.root):
+            for filename in filenames:
+                if filename.endswith('.tmp'):
+                    continue
+                path = os.path.join(dirpath, filename)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, path))
+                total += stat.st_size
+
+        if total <= self.max_bytes:
+            self._measured(total)
+            return 0
+
+        target = self.max_bytes * 0.9
+        removed = 0
+        for mtime, size, path in sorted(entries):
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+            removed += 1
+
+        self._measured(total)
+        logger.info(f"Certificate cache evicted {removed} entries ({total} bytes remaining)")
+        return removed
+
+    def _measured(self, total):
+        with CertificateCache._lock:
+            CertificateCache._sizes[self.root] = total
@@ -1,14 +1,47 @@
 """
 Certificate generation service for event attendance certificates.
-Handles certificate image generation using PIL/Pillow.
+Handles certificate image generation using PIL/Pillow, and vector PDF
+output over the template using reportlab.
 """
 import os
+import time
+import logging
 from io import BytesIO
 from datetime import datetime
-from django.core.files.base import ContentFile
+from concurrent.futures import ProcessPoolExecutor
 from django.utils import timezone
 from PIL import Image, ImageDraw, ImageFont
 
+logger = logging.getLogger(__name__)
+
+
+def _render_certificate_png(job):
+    """
+    Render one certificate to PNG bytes.
+    Module-level so it can be shipped to worker processes; it only touches
+    PIL and never the database.
+    """
+    cert_image = CertificateService.render_certificate(
+        participant_name=job['participant_name'],
+        event_name=job['event_name'],
+        event_date=job['event_date'],
+        cert_number=job['cert_number'],
+        issued_on=job.get('issued_on'),
+        layout=job['layout'],
+    )
+    image_io = BytesIO()
+    cert_image.save(image_io, format='PNG', quality=95)
+    return image_io.getvalue()
+
+
+def _render_certificate_file(job):
+    """Render one certificate to bytes in the job's output format (PNG or PDF)"""
+    if job.get('output_format') == 'pdf':
+        pdf_io = BytesIO()
+        CertificateService.write_certificates_pdf([job], pdf_io)
+        return pdf_io.getvalue()
+    return _render_certificate_png(job)
+
 
 class CertificateService:
     """Service for generating event attendance certificates"""
@@ -24,11 +57,15 @@ class CertificateService:
     CERT_WIDTH = 1754
     CERT_HEIGHT = 1240
     
+    # Bump when the drawing code changes so cached renders are invalidated
+    RENDER_VERSION = 1
+    
     @staticmethod
     def generate_certificate(user, event, attendance):
         """
-        Generate a certificate for a user's event attendance.
-        Creates a simple, professional certificate without requiring a template.
+        Issue a certificate for a user's event attendance.
+        Only the record is created here; the image is rendered on first download
+        (see open_certificate).
         
         Args:
             user: User object
@@ -43,32 +80,437 @@ class CertificateService:
         # Generate unique certificate number
         cert_number = EventCertificate.generate_certificate_number(event.id, user.id)
         
-        # Create certificate image
-        cert_image = CertificateService._create_basic_certificate(
-            participant_name=user.get_full_name(),
-            event_name=event.title,
-            event_date=event.date,
-            cert_number=cert_number
-        )
-        
-        # Save certificate to file
-        image_io = BytesIO()
-        cert_image.save(image_io, format='PNG', quality=95)
-        image_file = ContentFile(image_io.getvalue(), name=f'certificate_{cert_number}.png')
-        
         # Create EventCertificate record
         certificate = EventCertificate.objects.create(
             user=user,
             event=event,
             attendance=attendance,
             certificate_number=cert_number,
-            certificate_file=image_file
         )
         
         return certificate
     
     @staticmethod
-    def _create_basic_certificate(participant_name, event_name, event_date, cert_number):
+    def open_certificate(certificate, layout=None, output_format=None):
+        """
+        Open a certificate file for reading, rendering it into the certificate
+        cache on first access.
+        
+        Certificates issued before on-demand rendering keep their stored PNG.
+        
+        Args:
+            certificate: EventCertificate object
+            layout: Template layout (looked up from the event when omitted)
+            output_format: 'png' or 'pdf' (defaults to the template's format)
+            
+        Returns:
+            Binary file object (caller closes it)
+        """
+        from .certificate_cache import CertificateCache
+        
+        if certificate.certificate_file and output_format != 'pdf':
+            certificate.certificate_file.open('rb')
+            return certificate.certificate_file
+        
+        job = CertificateService.certificate_render_job(certificate, layout, output_format)
+        key = CertificateService.certificate_cache_key(job)
+        cache = CertificateCache()
+        
+        handle = cache.open(key, job['output_format'])
+        if handle is None:
+            cache.put(key, _render_certificate_file(job), job['output_format'])
+            handle = cache.open(key, job['output_format'])
+        return handle
+    
+    @staticmethod
+    def certificate_format(certificate, layout=None, output_format=None):
+        """
+        File format open_certificate returns for the requested output_format
+        (the template's by default): 'png' or 'pdf'. A PDF request for an
+        event without a template still yields a PNG.
+        """
+        if certificate.certificate_file and output_format != 'pdf':
+            return 'png'
+        if layout is None:
+            layout = CertificateService.get_template_layout(certificate.event)
+        return CertificateService._resolve_format(layout, output_format)
+    
+    @staticmethod
+    def _resolve_format(layout, output_format=None):
+        """Vector PDF needs a template to draw on; everything else is PNG"""
+        output_format = output_format or (layout or {}).get('output_format', 'png')
+        return 'pdf' if output_format == 'pdf' and layout else 'png'
+    
+    @staticmethod
+    def certificate_render_job(certificate, layout=None, output_format=None):
+        """Plain, picklable rendering arguments for a certificate"""
+        event = certificate.event
+        if layout is None:
+            layout = CertificateService.get_template_layout(event)
+        return {
+            'participant_name': certificate.user.get_full_name(),
+            'event_name': event.title,
+            'event_date': event.date,
+            'cert_number': certificate.certificate_number,
+            'issued_on': timezone.localdate(certificate.generated_at),
+            'layout': layout,
+            'output_format': CertificateService._resolve_format(layout, output_format),
+        }
+    
+    @staticmethod
+    def certificate_cache_key(job):
+        """Content hash of everything that affects a rendered certificate"""
+        from .certificate_cache import CertificateCache
+        
+        layout = job['layout']
+        template_version = None
+        if layout:
+            template_version = (layout['template_path'], layout['updated_at'].isoformat())
+        return CertificateCache.make_key(
+            CertificateService.RENDER_VERSION,
+            job['output_format'],
+            template_version,
+            job['participant_name'],
+            job['event_name'],
+            job['event_date'].isoformat(),
+            job['cert_number'],
+            job['issued_on'].isoformat(),
+        )
+    
+    @staticmethod
+    def generate_event_certificates(event, workers=1, batch_size=200, regenerate=False, prerender=False,
+                                    notify=True, progress=None):
+        """
+        Issue certificates for every present attendee of an event who does not
+        have one yet.
+        
+        Safe to re-run: attendees that already have a certificate are skipped and
+        the EventCertificate (user, event) constraint drops concurrent duplicates,
+        so an interrupted run simply resumes where it stopped.
+        
+        Args:
+            event: Event object
+            workers: Number of rendering processes used for prerender (1 = inline)
+            batch_size: Certificates created (and prerendered) per round
+            regenerate: Drop stored files of certificates that predate the event's
+                current template so they re-render over it on next download
+            prerender: Warm the certificate cache instead of waiting for downloads
+            notify: Send a real-time notification for each new certificate
+            progress: Optional callable receiving the running stats dict after each batch
+            
+        Returns:
+            dict with generated, regenerated, rendered, skipped, failed, elapsed and rate
+        """
+        from django.db import connections
+        from events.models import Attendance, EventCertificate
+        from notifications.services import send_realtime_notification
+        from .certificate_cache import CertificateCache
+        
+        started = time.monotonic()
+        stats = {'generated': 0, 'regenerated': 0, 'rendered': 0, 'skipped': 0, 'failed': 0,
+                 'elapsed': 0.0, 'rate': 0.0}
+        layout = CertificateService.get_template_layout(event)
+        
+        def update_rate():
+            stats['elapsed'] = time.monotonic() - started
+            done = stats['generated'] + stats['regenerated']
+            stats['rate'] = done / stats['elapsed'] if stats['elapsed'] else 0.0
+        
+        # Stored (eagerly rendered) files made before the current template was saved
+        if regenerate and layout:
+            stale = EventCertificate.objects.filter(
+                event=event,
+                generated_at__lt=layout['updated_at'],
+            ).exclude(certificate_file='')
+            for certificate in stale.only('id', 'certificate_file'):
+                certificate.certificate_file.delete(save=False)
+            stats['regenerated'] = stale.update(certificate_file='')
+        
+        # New certificates: present attendees without a certificate for this event
+        certified_users = EventCertificate.objects.filter(event=event).values('user_id')
+        attendances = list(
+            Attendance.objects.filter(event=event, status='present')
+            .exclude(user_id__in=certified_users)
+            .values_list('id', 'user_id')
+            .order_by('id')
+        )
+        
+        executor = None
+        if prerender and workers > 1 and len(attendances) > 1:
+            # Forked workers must not inherit open database connections
+            for connection in connections.all():
+                if not connection.in_atomic_block:
+                    connection.close()
+            executor = ProcessPoolExecutor(max_workers=workers)
+        
+        try:
+            for start in range(0, len(attendances), batch_size):
+                batch = attendances[start:start + batch_size]
+                numbers = [
+                    EventCertificate.generate_certificate_number(event.id, user_id)
+                    for _, user_id in batch
+                ]
+                EventCertificate.objects.bulk_create(
+                    [
+                        EventCertificate(
+                            user_id=user_id,
+                            event=event,
+                            attendance_id=attendance_id,
+                            certificate_number=number,
+                        )
+                        for (attendance_id, user_id), number in zip(batch, numbers)
+                    ],
+                    ignore_conflicts=True,
+                )
+                created = list(
+                    EventCertificate.objects.filter(event=event, certificate_number__in=numbers)
+                    .select_related('user', 'event')
+                )
+                stats['generated'] += len(created)
+                stats['skipped'] += len(batch) - len(created)
+                
+                if prerender and created:
+                    cache = CertificateCache()
+                    jobs = [CertificateService.certificate_render_job(c, layout) for c in created]
+                    if executor:
+                        rendered = executor.map(_render_certificate_file, jobs)
+                    else:
+                        rendered = map(_render_certificate_file, jobs)
+                    for job, file_data in zip(jobs, rendered):
+                        try:
+                            cache.put(CertificateService.certificate_cache_key(job), file_data, job['output_format'])
+                            stats['rendered'] += 1
+                        except Exception as e:
+                            logger.error(f"Certificate prerender error ({job['cert_number']}): {e}")
+                            stats['failed'] += 1
+                
+                if notify:
+                    for certificate in created:
+                        send_realtime_notification(
+                            user_id=certificate.user_id,
+                            message=f"Your certificate for {event.title} has been generated! View it in My Certificates.",
+                            type='info'
+                        )
+                
+                update_rate()
+                if progress:
+                    progress(dict(stats, total=len(attendances)))
+        finally:
+            if executor:
+                executor.shutdown()
+        
+        update_rate()
+        return stats
+    
+    @staticmethod
+    def get_template_layout(event):
+        """
+        Snapshot an event's certificate template as plain, picklable values.
+        
+        Returns:
+            dict with the template image path and text positioning, or an empty
+            dict when the event has no usable template
+        """
+        from events.models import CertificateTemplate
+        
+        template = CertificateTemplate.objects.filter(event=event).first()
+        if not template or not template.template_image:
+            return {}
+        return CertificateService._layout_from_template(template)
+    
+    @staticmethod
+    def _layout_from_template(template):
+        """Convert a CertificateTemplate into the layout dict used for rendering"""
+        return {
+            'template_path': template.template_image.path,
+            'updated_at': template.updated_at,
+            'output_format': template.output_format,
+            'name': (template.name_x, template.name_y, template.name_font_size, template.name_color),
+            'event': (template.event_name_x, template.event_name_y, template.event_font_size, template.event_color),
+            'date': (template.date_x, template.date_y, template.date_font_size, template.date_color),
+            'cert_number': (template.cert_number_x, template.cert_number_y,
+                            template.cert_number_font_size, template.cert_number_color),
+        }
+    
+    @staticmethod
+    def write_event_pdf(event, fileobj):
+        """
+        Write every certificate of an event into one multi-page vector PDF.
+        The template image is embedded once and reused by every page.
+        
+        Args:
+            event: Event object (must have a certificate template)
+            fileobj: Binary file object to write to
+            
+        Returns:
+            Number of pages written
+        """
+        from events.models import EventCertificate
+        
+        layout = CertificateService.get_template_layout(event)
+        if not layout:
+            raise ValueError(f"No certificate template found for {event.title}")
+        
+        certificates = (
+            EventCertificate.objects.filter(event=event)
+            .select_related('user', 'event')
+            .order_by('user__last_name', 'user__first_name')
+        )
+        jobs = (
+            CertificateService.certificate_render_job(certificate, layout, 'pdf')
+            for certificate in certificates.iterator()
+        )
+        return CertificateService.write_certificates_pdf(jobs, fileobj)
+    
+    @staticmethod
+    def write_certificates_pdf(jobs, fileobj):
+        """
+        Draw certificates as PDF pages: the template image as background and
+        the participant details as vector text at the template positions.
+        Template pixel coordinates are mapped to points at 150 DPI.
+        
+        Args:
+            jobs: Iterable of render jobs (see certificate_render_job)
+            fileobj: Binary file object to write to
+            
+        Returns:
+            Number of pages written
+        """
+        from reportlab.lib.colors import HexColor
+        from reportlab.lib.utils import ImageReader
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfgen import canvas
+        
+        scale = 72.0 / 150
+        font_name = CertificateService._get_pdf_font()
+        pdf = canvas.Canvas(fileobj, pageCompression=1)
+        pdf.setTitle("Certificates of Attendance")
+        
+        image_sizes = {}
+        pages = 0
+        for job in jobs:
+            layout = job['layout']
+            template_path = layout['template_path']
+            if template_path not in image_sizes:
+                image_sizes[template_path] = ImageReader(template_path).getSize()
+            width_px, height_px = image_sizes[template_path]
+            page_width, page_height = width_px * scale, height_px * scale
+            
+            pdf.setPageSize((page_width, page_height))
+            pdf.drawImage(template_path, 0, 0, width=page_width, height=page_height)
+            
+            fields = [
+                (layout['name'], job['participant_name'], True),
+                (layout['event'], job['event_name'], True),
+                (layout['date'], job['event_date'].strftime("%B %d, %Y"), True),
+                (layout['cert_number'], f"Certificate No: {job['cert_number']}", False),
+            ]
+            for (x, y, font_size, color), text, centered in fields:
+                size = font_size * scale
+                ascent, descent = pdfmetrics.getAscentDescent(font_name, size)
+                pdf.setFont(font_name, size)
+                pdf.setFillColor(HexColor(color))
+                top = page_height - y * scale
+                if centered:
+                    # Same anchor as the PNG renderer: (x, y) is the middle of the text
+                    pdf.drawCentredString(x * scale, top - (ascent + descent) / 2, text)
+                else:
+                    # (x, y) is the top-left corner of the text
+                    pdf.drawString(x * scale, top - ascent, text)
+            
+            pdf.showPage()
+            pages += 1
+        
+        pdf.save()
+        return pages
+    
+    @staticmethod
+    def _get_pdf_font():
+        """Register the certificate TrueType font with reportlab, falling back to Helvetica"""
+        from reportlab.pdfbase import pdfmetrics
+        from reportlab.pdfbase.ttfonts import TTFont
+        
+        if 'CertificateFont' in pdfmetrics.getRegisteredFontNames():
+            return 'CertificateFont'
+        font_path = CertificateService._get_font_path()
+        try:
+            pdfmetrics.registerFont(TTFont('CertificateFont', font_path))
+            return 'CertificateFont'
+        except Exception:
+            return 'Helvetica'
+    
+    @staticmethod
+    def render_certificate(participant_name, event_name, event_date, cert_number, issued_on=None, layout=None):
+        """
+        Render a certificate image, over the event template when a layout is given.
+        
+        Returns:
+            PIL Image object
+        """
+        if layout:
+            return CertificateService._create_template_certificate(
+                layout, participant_name, event_name, event_date, cert_number
+            )
+        return CertificateService._create_basic_certificate(
+            participant_name=participant_name,
+            event_name=event_name,
+            event_date=event_date,
+            cert_number=cert_number,
+            issued_on=issued_on
+        )
+    
+    @staticmethod
+    def preview_certificate(template, preview_name, preview_event):
+        """
+        Render a certificate preview with dummy data using a template.
+        
+        Returns:
+            PIL Image object
+        """
+        return CertificateService._create_template_certificate(
+            CertificateService._layout_from_template(template),
+            participant_name=preview_name,
+            event_name=preview_event,
+            event_date=template.event.date,
+            cert_number="CERT-PREVIEW"
+        )
+    
+    @staticmethod
+    def _create_template_certificate(layout, participant_name, event_name, event_date, cert_number):
+        """
+        Draw participant name, event name, date and certificate number onto the
+        uploaded template image at the configured positions.
+        
+        Returns:
+            PIL Image object
+        """
+        img = Image.open(layout['template_path']).convert('RGB')
+        draw = ImageDraw.Draw(img)
+        font_path = CertificateService._get_font_path()
+        
+        fields = [
+            (layout['name'], participant_name, 'mm'),
+            (layout['event'], event_name, 'mm'),
+            (layout['date'], event_date.strftime("%B %d, %Y"), 'mm'),
+            (layout['cert_number'], f"Certificate No: {cert_number}", 'la'),
+        ]
+        for (x, y, font_size, color), text, anchor in fields:
+            try:
+                font = ImageFont.truetype(font_path, font_size)
+            except Exception:
+                font = ImageFont.load_default()
+            draw.text((x, y), text, font=font, fill=CertificateService._hex_to_rgb(color), anchor=anchor)
+        
+        return img
+    
+    @staticmethod
+    def _hex_to_rgb(hex_color):
+        """Convert a hex color string (e.g. '#1E3A8A') to an RGB tuple"""
+        hex_color = hex_color.lstrip('#')
+        return tuple(int(hex_color[i:i + 2], 16) for i in (0, 2, 4))
+    
+    @staticmethod
+    def _create_basic_certificate(participant_name, event_name, event_date, cert_number, issued_on=None):
         """
         Create a simple, professional certificate without requiring a template.
         
@@ -77,6 +519,7 @@ class CertificateService:
             event_name: Name of the event
             event_date: Date object
             cert_number: Unique certificate number
+            issued_on: Issue date (defaults to today)
             
         Returns:
             PIL Image object
@@ -194,7 +637,7 @@ class CertificateService:
                      cert_num_text, font=cert_num_font, fill='#9CA3AF')
             
             # Issue date (bottom left)
-            issue_date_text = f"Issued: {datetime.now().strftime('%B %d, %Y')}"
+            issue_date_text = f"Issued: {(issued_on or datetime.now()).strftime('%B %d, %Y')}"
             draw.text((100, CertificateService.CERT_HEIGHT - 100),
                      issue_date_text, font=cert_num_font, fill='#9CA3AF')
             
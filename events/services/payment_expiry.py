@@ -0,0 +1,77 @@
+"""
+Expiry sweep for abandoned PayMongo checkouts.
+Pending event and registration payments past their expires_at are expired
+with one UPDATE per table (served by the (status, expires_at) indexes), and
+the event registrations they left hanging get their payment_status reset so
+the next registration attempt starts a fresh checkout. Expiry is not final:
+a source.chargeable that arrives late still charges the payment and moves
+it on to processing (see PayMongoWebhookService._source_chargeable).
+"""
+import logging
+import time
+from django.db import transaction
+from django.db.models import Case, Exists, OuterRef, Q, Value, When
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentExpiryService:
+    """Expire overdue pending PayMongo payments in bulk"""
+
+    @staticmethod
+    def expire_overdue(now=None):
+        """
+        Expire every pending payment whose checkout has lapsed.
+
+        Returns:
+            dict with event_payments, registration_payments and
+            registrations (reset) counts, plus elapsed seconds
+        """
+        from accounts.models import RegistrationPayment
+        from events.models import EventPayment, EventRegistration
+
+        now = now or timezone.now()
+        started = time.perf_counter()
+
+        with transaction.atomic():
+            overdue = EventPayment.objects.filter(status='pending', expires_at__lte=now)
+            # Bulk checkouts cover every allocated registration, not just their own
+            registration_ids = list(
+                EventRegistration.objects.filter(
+                    Q(payments__in=overdue) | Q(payment_allocations__payment__in=overdue)
+                ).values_list('id', flat=True).distinct()
+            )
+            event_payments = overdue.update(status='expired', is_expired=True, updated_at=now)
+
+            registration_payments = RegistrationPayment.objects.filter(
+                status='pending', expires_at__lte=now
+            ).update(status='expired', updated_at=now)
+
+            # Registrations still waiting on another live checkout keep their status
+            live_payment = EventPayment.objects.filter(
+                Q(registration=OuterRef('pk')) | Q(allocations__registration=OuterRef('pk')),
+                status__in=('pending', 'processing'),
+            )
+            registrations = (
+                EventRegistration.objects.filter(id__in=registration_ids)
+                .exclude(payment_status__in=('paid', 'not_required'))
+                .exclude(Exists(live_payment))
+                .update(payment_status=Case(
+                    When(total_paid__gt=0, then=Value('partial')),
+                    default=Value('pending'),
+                ))
+            )
+
+        stats = {
+            'event_payments': event_payments,
+            'registration_payments': registration_payments,
+            'registrations': registrations,
+            'elapsed': time.perf_counter() - started,
+        }
+        if event_payments or registration_payments:
+            logger.info(
+                f"Expired {event_payments} event payment(s) and {registration_payments} "
+                f"registration payment(s); reset {registrations} registration(s)"
+            )
+        return stats
@@ -0,0 +1,581 @@
+"""
+PayMongo webhook inbox.
+The webhook view only verifies the signature and stores the event, keyed by
+PayMongo's event id, so retries of the same event are absorbed and PayMongo
+gets its 200 well within its timeout. A worker then applies each event
+exactly once: the inbox row and the affected payment row are locked for the
+duration of the update, and the inbox row is marked processed in the same
+transaction. Charging a chargeable source is the one gateway call a handler
+makes; it runs between two such transactions, never while rows are locked.
+Payment status pages never call PayMongo themselves: they read
+the payment rows this worker keeps up to date, and if a webhook is late a
+coalesced background poll feeds the source's state through the same inbox.
+"""
+import logging
+import threading
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, close_old_connections, transaction
+from django.db.models import Case, DecimalField, F, OuterRef, Q, Subquery, Value, When
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class WebhookIgnored(Exception):
+    """The event refers to nothing we know about; nothing to retry"""
+
+
+class PayMongoWebhookService:
+    """Store PayMongo webhook events and apply them exactly once"""
+
+    POLL_KEY = 'paymongo_source_poll:{source_id}'
+    _drain_lock = threading.Lock()
+    _drain_requested = threading.Event()
+
+    @staticmethod
+    def enqueue(payload):
+        """
+        Store a verified webhook payload in the inbox.
+
+        Args:
+            payload: Decoded webhook JSON (dict)
+
+        Returns:
+            (inbox event, created) - created is False for a redelivered event
+        """
+        from events.models import PayMongoWebhookEvent
+
+        data = payload.get('data') or {}
+        event_id = data.get('id')
+        if not event_id:
+            raise ValueError("Webhook payload has no event id")
+        event_type = (data.get('attributes') or {}).get('type', '')
+
+        try:
+            with transaction.atomic():
+                return PayMongoWebhookEvent.objects.create(
+                    event_id=event_id,
+                    event_type=event_type,
+                    payload=payload,
+                ), True
+        except IntegrityError:
+            return PayMongoWebhookEvent.objects.get(event_id=event_id), False
+
+    @staticmethod
+    def drain_in_background():
+        """
+        Process pending events on a background thread unless a separate
+        worker (process_paymongo_webhooks) is configured. At most one drain
+        thread runs per process; the row locks keep separate workers apart.
+        A webhook that finds the drain running only flags it, so the running
+        thread keeps going until no pending events remain.
+        """
+        if not getattr(settings, 'PAYMONGO_WEBHOOK_DRAIN_IN_THREAD', True):
+            return None
+        PayMongoWebhookService._drain_requested.set()
+        if not PayMongoWebhookService._drain_lock.acquire(blocking=False):
+            return None
+
+        def drain():
+            try:
+                while True:
+                    PayMongoWebhookService._drain_requested.clear()
+                    try:
+                        PayMongoWebhookService.drain_pending()
+                    except Exception as e:
+                        logger.error(f"PayMongo webhook drain failed: {e}", exc_info=True)
+                    finally:
+                        PayMongoWebhookService._drain_lock.release()
+                    # Flagged after the last batch was read: go again unless that webhook started its own thread
+                    if not PayMongoWebhookService._drain_requested.is_set():
+                        break
+                    if not PayMongoWebhookService._drain_lock.acquire(blocking=False):
+                        break
+            finally:
+                close_old_connections()
+
+        thread = threading.Thread(target=drain, name='paymongo-webhook-drain', daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def process_pending(limit=100):
+        """
+        Apply pending inbox events in arrival order.
+
+        Returns:
+            dict with processed, ignored and failed counts
+        """
+        from events.models import PayMongoWebhookEvent
+
+        stats = {'processed': 0, 'ignored': 0, 'failed': 0}
+        pending_ids = list(
+            PayMongoWebhookEvent.objects.filter(status='pending')
+            .order_by('received_at')
+            .values_list('id', flat=True)[:limit]
+        )
+        for inbox_id in pending_ids:
+            status = PayMongoWebhookService.process_event(inbox_id)
+            if status in stats:
+                stats[status] += 1
+        return stats
+
+    @staticmethod
+    def drain_pending(limit=100):
+        """
+        Apply batches of pending events until a batch settles none of them,
+        picking up events that arrive while earlier batches are applied.
+        Events left pending for retry end the drain rather than spin it.
+
+        Returns:
+            dict with processed, ignored and failed counts
+        """
+        totals = {'processed': 0, 'ignored': 0, 'failed': 0}
+        while True:
+            stats = PayMongoWebhookService.process_pending(limit)
+            if not any(stats.values()):
+                return totals
+            for status, count in stats.items():
+                totals[status] += count
+
+    @staticmethod
+    def process_event(inbox_id):
+        """
+        Apply one inbox event inside a transaction holding its row lock.
+        Workers that lose the race for the row skip it.
+
+        A source.chargeable event claims its payments and commits, leaving
+        the event pending; the payment is then created with no transaction
+        open and recorded in a second transaction that marks the event
+        processed. If the worker dies in between, the retry charges again
+        under the same idempotency key and gets the same payment back.
+
+        Returns:
+            New status of the event, or None if another worker has it
+        """
+        from events.models import PayMongoWebhookEvent
+        from events.paymongo_service import PayMongoService
+
+        def finish(event, status, error=''):
+            event.status = status
+            event.last_error = error
+            event.attempts += 1
+            event.processed_at = timezone.now()
+            event.save(update_fields=['status', 'attempts', 'last_error', 'processed_at'])
+            return event.status
+
+        try:
+            with transaction.atomic():
+                event = (
+                    PayMongoWebhookEvent.objects.select_for_update(skip_locked=True)
+                    .filter(id=inbox_id, status='pending')
+                    .first()
+                )
+                if event is None:
+                    return None
+                try:
+                    charge = PayMongoWebhookService._apply(event.event_type, event.payload)
+                except WebhookIgnored as e:
+                    return finish(event, 'ignored', str(e))
+                if charge is None:
+                    return finish(event, 'processed')
+
+            payment_response = PayMongoService().create_payment(
+                idempotency_key=f"charge-{charge['source_id']}", **charge
+            )
+
+            with transaction.atomic():
+                event = (
+                    PayMongoWebhookEvent.objects.select_for_update()
+                    .filter(id=inbox_id, status='pending')
+                    .first()
+                )
+                if event is None:
+                    return None
+                PayMongoWebhookService._record_charge(charge['source_id'], payment_response)
+                return finish(event, 'processed')
+        except Exception as e:
+            # The handler's changes were rolled back; record the attempt for retry
+            logger.error(f"PayMongo webhook event {inbox_id} failed: {e}", exc_info=True)
+            event = PayMongoWebhookEvent.objects.get(id=inbox_id)
+            event.attempts += 1
+            event.last_error = str(e)
+            if event.attempts >= settings.PAYMONGO_WEBHOOK_MAX_ATTEMPTS:
+                event.status = 'failed'
+            event.save(update_fields=['status', 'attempts', 'last_error'])
+            return 'failed' if event.status == 'failed' else 'pending'
+
+    @staticmethod
+    def _apply(event_type, payload):
+        event_data = payload.get('data', {}).get('attributes', {}).get('data', {})
+        logger.info(f"Applying PayMongo {event_type} for {event_data.get('id')}")
+        if event_type == 'source.chargeable':
+            return PayMongoWebhookService._source_chargeable(event_data)
+        elif event_type == 'payment.paid':
+            PayMongoWebhookService._payment_paid(event_data)
+        elif event_type == 'payment.failed':
+            PayMongoWebhookService._payment_failed(event_data)
+        else:
+            raise WebhookIgnored(f"Unhandled event type: {event_type}")
+
+    @staticmethod
+    def _locked_payments(field, value):
+        """
+        Lock the payment rows carrying the given PayMongo id.
+
+        Returns:
+            (EventPayment or None, list of RegistrationPayments); bulk
+            registration payments share one source, hence the list
+        """
+        from accounts.models import RegistrationPayment
+        from events.models import EventPayment
+
+        if not value:
+            raise WebhookIgnored(f"Event has no {field}")
+        payment = (
+            EventPayment.objects.select_for_update()
+            .select_related('registration__event', 'registration__user')
+            .filter(**{field: value}).first()
+        )
+        if payment:
+            return payment, []
+        registration_payments = list(
+            RegistrationPayment.objects.select_for_update()
+            .select_related('user')
+            .filter(**{field: value})
+            .order_by('id')
+        )
+        if registration_payments:
+            return None, registration_payments
+        raise WebhookIgnored(f"Payment not found for {field}={value}")
+
+    @staticmethod
+    def _source_chargeable(event_data):
+        """
+        Claim the source's payments for charging by moving them to
+        processing. A claim left behind by a worker that died before
+        recording its charge is taken over, and a checkout the expiry sweep
+        gave up on is revived: the customer has authorized the payment, so
+        it is charged rather than left hanging. An expired checkout that was
+        since replaced by a new one, or whose registrations are settled, is
+        left expired so nobody pays twice.
+
+        Returns:
+            create_payment arguments for the charge, or None if already charged
+        """
+        source_id = event_data.get('id')
+        payment, registration_payments = PayMongoWebhookService._locked_payments('paymongo_source_id', source_id)
+        targets = [payment] if payment else registration_payments
+        if any(
+            target.paymongo_payment_id or target.status not in ('pending', 'processing', 'expired')
+            for target in targets
+        ):
+            # Already charged; never charge a source twice
+            return None
+        if any(target.status == 'expired' for target in targets) and PayMongoWebhookService._superseded(
+            payment, registration_payments
+        ):
+            logger.warning(f"Not charging expired source {source_id}: settled or replaced by a newer checkout")
+            raise WebhookIgnored(f"Expired source {source_id} was superseded")
+
+        if payment:
+            description = f"Event Payment - {payment.registration.event.title}"
+        elif len(registration_payments) > 1:
+            description = f"Bulk Registration Payment - {len(registration_payments)} students"
+        else:
+            description = f"Registration Fee - {registration_payments[0].user.get_full_name()}"
+
+        for target in targets:
+            target.status = 'processing'
+            if payment:
+                target.is_expired = False
+            target.save()
+        return {
+            'source_id': source_id,
+            'amount': sum(target.amount for target in targets),
+            'description': description,
+        }
+
+    @staticmethod
+    def _superseded(payment, registration_payments):
+        """
+        Whether an expired checkout no longer needs charging: what it paid
+        for is settled, or the customer started another checkout for it.
+        """
+        from accounts.models import RegistrationPayment, User
+        from events.models import EventPayment
+
+        if payment:
+            registrations = PayMongoWebhookService._covered_registrations(payment)
+            if registrations.filter(payment_status__in=('paid', 'not_required')).exists():
+                return True
+            return EventPayment.objects.filter(
+                Q(registration__in=registrations) | Q(allocations__registration__in=registrations),
+                status__in=('pending', 'processing'),
+            ).exclude(pk=payment.pk).exists()
+
+        user_ids = [registration_payment.user_id for registration_payment in registration_payments]
+        if User.objects.filter(id__in=user_ids).exclude(
+            registration_status__in=('pending_payment', 'partial_payment')
+        ).exists():
+            return True
+        return RegistrationPayment.objects.filter(
+            user_id__in=user_ids, status__in=('pending', 'processing'),
+        ).exclude(pk__in=[registration_payment.pk for registration_payment in registration_payments]).exists()
+
+    @staticmethod
+    def _record_charge(source_id, payment_response):
+        """Store the payment created for a claimed source, or fail the claim"""
+        payment, registration_payments = PayMongoWebhookService._locked_payments('paymongo_source_id', source_id)
+        targets = [payment] if payment else registration_payments
+        if any(target.paymongo_payment_id or target.status != 'processing' for target in targets):
+            return
+
+        if payment_response and payment_response.get('data'):
+            payment_id = payment_response['data']['id']
+            for target in targets:
+                target.paymongo_payment_id = payment_id
+                target.status = 'processing'
+                target.save()
+            if payment:
+                PayMongoWebhookService._covered_registrations(payment).update(payment_status='pending')
+            logger.info(f"Payment created: {payment_id}")
+            # E-wallet payments are usually paid on creation; don't wait for payment.paid
+            if payment_response['data'].get('attributes', {}).get('status') == 'paid':
+                PayMongoWebhookService._payment_paid({'id': payment_id})
+        else:
+            for target in targets:
+                target.status = 'failed'
+                target.save()
+            if payment:
+                PayMongoWebhookService._covered_registrations(payment).update(payment_status='rejected')
+            logger.error(f"Failed to create payment for source: {source_id}")
+
+    @staticmethod
+    def _payment_paid(event_data):
+        payment_id = event_data.get('id')
+        payment, registration_payments = PayMongoWebhookService._locked_payments('paymongo_payment_id', payment_id)
+        now = timezone.now()
+
+        if payment:
+            if payment.status == 'verified':
+                # Credited already; crediting again would double-count total_paid
+                return
+            payment.status = 'verified'
+            payment.verification_date = now
+            payment.save()
+            credited = PayMongoWebhookService._credit_registrations(payment, now)
+            logger.info(f"Event payment verified: {payment_id} for {credited} registration(s)")
+            return
+
+        registration_payments = [rp for rp in registration_payments if rp.status != 'verified']
+        if not registration_payments:
+            return
+        PayMongoWebhookService._verify_registration_payments(registration_payments, now)
+        logger.info(f"Registration payment verified: {payment_id} for {len(registration_payments)} payment(s)")
+
+    @staticmethod
+    def _covered_registrations(payment):
+        """
+        Registrations an event payment pays for: every allocated one for a
+        bulk checkout, otherwise the payment's own registration.
+        """
+        from events.models import EventRegistration
+
+        return EventRegistration.objects.filter(
+            Q(payment_allocations__payment=payment) | Q(pk=payment.registration_id)
+        ).distinct()
+
+    @staticmethod
+    def _credit_registrations(payment, now):
+        """
+        Credit each covered registration with its allocated share (the whole
+        amount when the payment has no allocations) in one UPDATE, and
+        notify their students in one batch after commit.
+
+        Returns:
+            Number of registrations credited
+        """
+        from events.models import EventRegistration, PaymentAllocation
+        from notifications.services import send_realtime_notifications
+
+        covered = list(
+            PayMongoWebhookService._covered_registrations(payment).values_list('id', 'user_id')
+        )
+        allocated = PaymentAllocation.objects.filter(payment=payment, registration=OuterRef('pk'))
+        EventRegistration.objects.filter(id__in=[reg_id for reg_id, _ in covered]).update(
+            total_paid=F('total_paid') + Coalesce(
+                Subquery(allocated.values('amount')[:1]), Value(payment.amount), output_field=DecimalField()
+            ),
+            payment_status='paid',
+            verified=True,
+            verification_date=now,
+        )
+
+        message = (
+            f"Your payment for {payment.registration.event.title} has been verified. "
+            "Your registration is confirmed!"
+        )
+        notifications = [(user_id, message, 'payment') for _, user_id in covered]
+        transaction.on_commit(lambda: send_realtime_notifications(notifications))
+        return len(covered)
+
+    @staticmethod
+    def _verify_registration_payments(registration_payments, now):
+        """
+        Verify a group of locked registration payments set-wise: one UPDATE
+        on the payments, one UPDATE crediting their users and recomputing
+        their status, and one batched notification insert after commit,
+        however many students it covers.
+        """
+        from accounts.models import RegistrationPayment, User
+        from notifications.services import send_realtime_notifications
+
+        RegistrationPayment.objects.filter(
+            id__in=[rp.id for rp in registration_payments]
+        ).update(status='verified', verification_date=now, updated_at=now)
+
+        credited = {}
+        for registration_payment in registration_payments:
+            credited[registration_payment.user_id] = (
+                credited.get(registration_payment.user_id, 0) + registration_payment.amount
+            )
+        credit = Case(
+            *(When(id=user_id, then=Value(amount)) for user_id, amount in credited.items()),
+            output_field=DecimalField(),
+        )
+        # Sets 'payment_verified'/expiry when fully paid
+        User.objects.filter(id__in=credited).recompute_registration_status(
+            now, registration_total_paid=F('registration_total_paid') + credit,
+        )
+        users = list(User.objects.filter(id__in=credited).only('id', 'username', 'first_name', 'last_name'))
+
+        admin_ids = list(User.objects.filter(rank='admin').values_list('id', flat=True))
+        notifications = []
+        for user in users:
+            notifications.append((
+                user.id,
+                f"Your registration payment of ₱{credited[user.id]} has been verified. Welcome to Boy Scout System!",
+                'payment',
+            ))
+            notifications.extend(
+                (admin_id, f"{user.get_full_name()} has completed registration payment and is now an active member.", 'registration')
+                for admin_id in admin_ids
+            )
+        transaction.on_commit(lambda: send_realtime_notifications(notifications))
+
+    @staticmethod
+    def _payment_failed(event_data):
+        from notifications.services import send_realtime_notification
+
+        payment_id = event_data.get('id')
+        payment, registration_payments = PayMongoWebhookService._locked_payments('paymongo_payment_id', payment_id)
+        targets = [payment] if payment else registration_payments
+        targets = [target for target in targets if target.status not in ('verified', 'failed')]
+        if not targets:
+            return
+
+        for target in targets:
+            target.status = 'failed'
+            target.save()
+
+        if payment:
+            covered = PayMongoWebhookService._covered_registrations(payment)
+            user_ids = list(covered.values_list('user_id', flat=True))
+            covered.update(payment_status='rejected')
+            notices = [
+                (user_id, f"Payment for {payment.registration.event.title} failed. Please try again.")
+                for user_id in user_ids
+            ]
+        else:
+            notices = [
+                (target.user_id, "Your registration payment failed. Please try again or contact support.")
+                for target in targets
+            ]
+
+        def notify():
+            for user_id, message in notices:
+                send_realtime_notification(user_id=user_id, message=message, type='payment')
+
+        transaction.on_commit(notify)
+        logger.info(f"Payment failed: {payment_id}")
+
+    @staticmethod
+    def schedule_poll(source_id):
+        """
+        Poll PayMongo for a source in the background, for when its webhook is
+        late. Payment status pages call this on every refresh; polls of the
+        same source are coalesced so at most one runs per
+        PAYMONGO_SOURCE_POLL_INTERVAL seconds (per cache).
+
+        Returns:
+            The polling thread, or None if a poll of this source is recent
+        """
+        if not source_id:
+            return None
+        key = PayMongoWebhookService.POLL_KEY.format(source_id=source_id)
+        if not cache.add(key, True, timeout=settings.PAYMONGO_SOURCE_POLL_INTERVAL):
+            return None
+
+        def poll():
+            try:
+                PayMongoWebhookService.poll_source(source_id)
+            except Exception as e:
+                logger.error(f"PayMongo poll of source {source_id} failed: {e}", exc_info=True)
+            finally:
+                close_old_connections()
+
+        thread = threading.Thread(target=poll, name=f'paymongo-poll-{source_id}', daemon=True)
+        thread.start()
+        return thread
+
+    @staticmethod
+    def poll_source(source_id):
+        """
+        Fetch a source (and its payment, once created) from PayMongo and feed
+        any state change through the inbox as a synthetic event, so it is
+        applied exactly like the webhook it stands in for.
+
+        Returns:
+            Type of the event queued, or None if nothing changed
+        """
+        from accounts.models import RegistrationPayment
+        from events.models import EventPayment
+        from events.paymongo_service import PayMongoService
+
+        payment = (
+            EventPayment.objects.filter(paymongo_source_id=source_id).first()
+            or RegistrationPayment.objects.filter(paymongo_source_id=source_id).first()
+        )
+        if payment is None or payment.status not in ('pending', 'processing'):
+            return None
+
+        paymongo = PayMongoService()
+        if not payment.paymongo_payment_id:
+            source_data = paymongo.get_source(source_id)
+            if not source_data or 'data' not in source_data:
+                return None
+            if source_data['data']['attributes'].get('status') != 'chargeable':
+                return None
+            event_type, resource = 'source.chargeable', source_data['data']
+        else:
+            payment_data = paymongo.get_payment(payment.paymongo_payment_id)
+            if not payment_data or 'data' not in payment_data:
+                return None
+            status = payment_data['data']['attributes'].get('status')
+            if status not in ('paid', 'failed'):
+                return None
+            event_type, resource = f'payment.{status}', payment_data['data']
+
+        inbox_event, created = PayMongoWebhookService.enqueue({
+            'data': {
+                'id': f"poll_{resource['id']}_{event_type}",
+                'type': 'event',
+                'attributes': {'type': event_type, 'data': resource},
+            }
+        })
+        if created:
+            PayMongoWebhookService.process_event(inbox_event.id)
+        return event_type
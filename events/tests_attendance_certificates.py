@@ -3,6 +3,10 @@ Unit tests for attendance session and certificate functionality.
 Tests models, views, and certificate generation service.
 """
 import os
+import shutil
+import tempfile
+import zipfile
+from unittest.mock import patch
 from django.test import TestCase, Client, override_settings
 from django.urls import reverse
 from django.contrib.auth import get_user_model
@@ -18,6 +22,8 @@ from events.models import (
     AttendanceSession, CertificateTemplate, EventCertificate
 )
 from events.services.certificate_service import CertificateService
+from events.services.certificate_cache import CertificateCache
+from events.services.attendance_state import AttendanceStateService
 
 User = get_user_model()
 
@@ -322,7 +328,15 @@ class CertificateServiceTest(TestCase):
         self.assertEqual(certificate.event, self.event)
         self.assertEqual(certificate.attendance, self.attendance)
         self.assertIn('CERT-', certificate.certificate_number)
-        self.assertTrue(certificate.certificate_file.name.endswith('.png'))
+        
+        # Image is rendered on first access rather than stored eagerly
+        self.assertFalse(certificate.certificate_file)
+        with override_settings(CERTIFICATE_CACHE_DIR=tempfile.mkdtemp(prefix='certificate_cache_test_')):
+            handle = CertificateService.open_certificate(certificate)
+            try:
+                self.assertTrue(handle.read(8).startswith(b'\x89PNG'))
+            finally:
+                handle.close()
     
     def test_generate_certificate_without_template(self):
         """Test that generation fails without template"""
@@ -342,10 +356,15 @@ class CertificateServiceTest(TestCase):
         self.assertIn('No certificate template found', str(context.exception))
 
 
+@override_settings(ATTENDANCE_CERTIFICATES_IN_THREAD=False)
 class AttendanceSessionViewsTest(TestCase):
     """Test attendance session views"""
     
     def setUp(self):
+        from django.core.cache import cache
+        
+        # Session state is cached per event id, which the test database reuses
+        cache.clear()
         self.client = Client()
         
         self.admin_user = User.objects.create_user(
@@ -629,6 +648,9 @@ class IntegrationTest(TestCase):
     """Integration tests for complete workflow"""
     
     def setUp(self):
+        from django.core.cache import cache
+        
+        cache.clear()
         self.client = Client()
         
         self.admin_user = User.objects.create_user(
@@ -679,7 +701,7 @@ class IntegrationTest(TestCase):
         )
     
     def test_complete_attendance_workflow(self):
-        """Test complete workflow: start session -> mark attendance -> certificate generated"""
+        """Test complete workflow: start session -> mark attendance -> stop -> certificate generated"""
         # Step 1: Admin starts session
         self.client.login(email='admin@test.com', password='testpass123')
         start_url = reverse('events:start_attendance_session', kwargs={'event_id': self.event.id})
@@ -701,16 +723,1033 @@ class IntegrationTest(TestCase):
         attendance = Attendance.objects.get(event=self.event, user=self.student_user)
         self.assertIsNotNone(attendance)
         
-        # Step 4: Verify certificate was generated
+        # Certificates are issued when the session closes, not per check-in
+        self.assertFalse(EventCertificate.objects.filter(user=self.student_user, event=self.event).exists())
+        
+        # Step 4: Admin stops session; certificates are left to the background job
+        self.client.login(email='admin@test.com', password='testpass123')
+        stop_url = reverse('events:stop_attendance_session', kwargs={'event_id': self.event.id})
+        with override_settings(ATTENDANCE_CERTIFICATES_IN_THREAD=False):
+            response = self.client.post(stop_url)
+        self.assertTrue(response.json()['certificates_pending'])
+        
+        session.refresh_from_db()
+        self.assertFalse(session.is_active)
+        self.assertFalse(EventCertificate.objects.filter(user=self.student_user, event=self.event).exists())
+        
+        # Step 5: The scheduler job issues the certificate exactly once
+        self.assertEqual(AttendanceStateService.issue_pending_certificates(), 1)
+        self.assertEqual(AttendanceStateService.issue_pending_certificates(), 0)
         certificate = EventCertificate.objects.get(user=self.student_user, event=self.event)
         self.assertIsNotNone(certificate)
         self.assertEqual(certificate.attendance, attendance)
         self.assertIn('CERT-', certificate.certificate_number)
+
+
+CACHE_DIR = tempfile.mkdtemp(prefix='certificate_cache_test_')
+
+
+@override_settings(CERTIFICATE_CACHE_DIR=CACHE_DIR)
+class BulkCertificateGenerationTest(TestCase):
+    """Test bulk certificate generation for an event"""
+    
+    def setUp(self):
+        self.admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            rank='admin'
+        )
+        self.event = Event.objects.create(
+            title='Bulk Event',
+            description='Test Description',
+            date=date.today(),
+            time=time(14, 0),
+            location='Test Location',
+            created_by=self.admin_user
+        )
+        self.scouts = []
+        for i in range(3):
+            scout = User.objects.create_user(
+                username=f'scout{i}',
+                email=f'scout{i}@test.com',
+                password='testpass123',
+                first_name='Scout',
+                last_name=str(i)
+            )
+            Attendance.objects.create(event=self.event, user=scout, status='present')
+            self.scouts.append(scout)
+        absent = User.objects.create_user(
+            username='absent',
+            email='absent@test.com',
+            password='testpass123'
+        )
+        Attendance.objects.create(event=self.event, user=absent, status='absent')
+    
+    def _upload_template(self):
+        image = Image.new('RGB', (800, 600), color='white')
+        image_io = BytesIO()
+        image.save(image_io, format='PNG')
+        return CertificateTemplate.objects.create(
+            event=self.event,
+            template_image=SimpleUploadedFile('template.png', image_io.getvalue())
+        )
+    
+    def _image_size(self, certificate):
+        handle = CertificateService.open_certificate(certificate)
+        try:
+            with Image.open(handle) as img:
+                return img.size
+        finally:
+            handle.close()
+    
+    def test_generates_only_missing_certificates(self):
+        """Test that only present attendees without a certificate get one"""
+        existing = CertificateService.generate_certificate(
+            user=self.scouts[0],
+            event=self.event,
+            attendance=Attendance.objects.get(event=self.event, user=self.scouts[0])
+        )
+        
+        stats = CertificateService.generate_event_certificates(self.event, notify=False)
+        
+        self.assertEqual(stats['generated'], 2)
+        self.assertEqual(stats['failed'], 0)
+        self.assertEqual(EventCertificate.objects.filter(event=self.event).count(), 3)
+        self.assertTrue(EventCertificate.objects.filter(pk=existing.pk).exists())
+    
+    def test_rerun_is_idempotent(self):
+        """Test that running twice does not create duplicates"""
+        CertificateService.generate_event_certificates(self.event, notify=False)
+        stats = CertificateService.generate_event_certificates(self.event, notify=False)
+        
+        self.assertEqual(stats['generated'], 0)
+        self.assertEqual(EventCertificate.objects.filter(event=self.event).count(), 3)
+    
+    def test_prerender_in_parallel_workers(self):
+        """Test warming the certificate cache from worker processes"""
+        stats = CertificateService.generate_event_certificates(
+            self.event, workers=2, batch_size=2, prerender=True, notify=False
+        )
+        
+        self.assertEqual(stats['generated'], 3)
+        self.assertEqual(stats['rendered'], 3)
+        cache = CertificateCache()
+        for certificate in EventCertificate.objects.filter(event=self.event).select_related('user', 'event'):
+            key = CertificateService.certificate_cache_key(CertificateService.certificate_render_job(certificate))
+            self.assertTrue(os.path.exists(cache.path_for(key)))
+    
+    def test_late_template_upload(self):
+        """Test that certificates render over a template uploaded after they were issued"""
+        CertificateService.generate_event_certificates(self.event, notify=False)
+        certificate = EventCertificate.objects.filter(event=self.event).first()
+        self.assertEqual(self._image_size(certificate), (CertificateService.CERT_WIDTH, CertificateService.CERT_HEIGHT))
+        
+        self._upload_template()
+        
+        self.assertEqual(self._image_size(certificate), (800, 600))
+    
+    def test_regenerate_drops_stale_stored_files(self):
+        """Test that stored certificates from before a template upload switch to on-demand rendering"""
+        attendance = Attendance.objects.get(event=self.event, user=self.scouts[0])
+        image_io = BytesIO()
+        Image.new('RGB', (100, 100), color='white').save(image_io, format='PNG')
+        certificate = EventCertificate.objects.create(
+            user=self.scouts[0],
+            event=self.event,
+            attendance=attendance,
+            certificate_number='CERT-LEGACY-1',
+            certificate_file=SimpleUploadedFile('legacy.png', image_io.getvalue())
+        )
+        self._upload_template()
+        
+        stats = CertificateService.generate_event_certificates(self.event, regenerate=True, notify=False)
         
-        # Step 5: Admin stops session
+        self.assertEqual(stats['regenerated'], 1)
+        certificate.refresh_from_db()
+        self.assertFalse(certificate.certificate_file)
+        self.assertEqual(self._image_size(certificate), (800, 600))
+    
+    def test_management_command(self):
+        """Test the generate_event_certificates command"""
+        from django.core.management import call_command
+        from io import StringIO
+        
+        out = StringIO()
+        call_command('generate_event_certificates', str(self.event.id), '--workers', '1', '--no-notify', stdout=out)
+        
+        self.assertIn('Generated 3', out.getvalue())
+        self.assertEqual(EventCertificate.objects.filter(event=self.event).count(), 3)
+
+
+class CertificateCacheTest(TestCase):
+    """Test the content-addressed certificate cache"""
+    
+    def setUp(self):
+        self.root = tempfile.mkdtemp(prefix='certificate_cache_test_')
+        self.addCleanup(shutil.rmtree, self.root, ignore_errors=True)
+    
+    def test_miss_then_hit(self):
+        """Test that stored entries are returned by key"""
+        cache = CertificateCache(root=self.root, max_bytes=1024)
+        key = CertificateCache.make_key('template-v1', 'John Doe', 'Event')
+        
+        self.assertIsNone(cache.open(key))
+        cache.put(key, b'png-bytes')
+        with cache.open(key) as handle:
+            self.assertEqual(handle.read(), b'png-bytes')
+    
+    def test_key_changes_with_content(self):
+        """Test that any input change produces a different key"""
+        self.assertNotEqual(
+            CertificateCache.make_key('template-v1', 'John Doe'),
+            CertificateCache.make_key('template-v2', 'John Doe')
+        )
+    
+    def test_evicts_least_recently_used(self):
+        """Test size-bounded eviction keeps the most recently used entries"""
+        cache = CertificateCache(root=self.root, max_bytes=250)
+        keys = [CertificateCache.make_key(i) for i in range(3)]
+        for age, key in enumerate(keys):
+            path = cache.put(key, b'x' * 100)
+            os.utime(path, (1000 + age, 1000 + age))
+        
+        self.assertIsNone(cache.open(keys[0]))
+        self.assertFalse(os.path.exists(cache.path_for(keys[0])))
+        self.assertTrue(os.path.exists(cache.path_for(keys[2])))
+    
+    def test_directory_walked_only_when_estimate_exceeds_bound(self):
+        """Test that puts under the bound only update the running size estimate"""
+        cache = CertificateCache(root=self.root, max_bytes=1000)
+        with patch('events.services.certificate_cache.os.walk', wraps=os.walk) as walk:
+            for i in range(9):
+                CertificateCache(root=self.root, max_bytes=1000).put(CertificateCache.make_key(i), b'x' * 100)
+            # Measured once on the first write, then tracked from the writes alone
+            self.assertEqual(walk.call_count, 1)
+            cache.put(CertificateCache.make_key('over'), b'x' * 200)
+            self.assertEqual(walk.call_count, 2)
+        
+        self.assertEqual(CertificateCache._sizes[self.root], 900)
+
+
+@override_settings(CERTIFICATE_CACHE_DIR=CACHE_DIR)
+class DownloadCertificateViewTest(TestCase):
+    """Test on-demand certificate download"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            rank='admin',
+            is_active=True
+        )
+        self.student_user = User.objects.create_user(
+            username='student',
+            email='student@test.com',
+            password='testpass123',
+            first_name='John',
+            last_name='Doe',
+            rank='scout',
+            is_active=True
+        )
+        self.other_user = User.objects.create_user(
+            username='other',
+            email='other@test.com',
+            password='testpass123',
+            rank='scout',
+            is_active=True
+        )
+        self.event = Event.objects.create(
+            title='Test Event',
+            description='Test Description',
+            date=date.today(),
+            time=time(14, 0),
+            location='Test Location',
+            created_by=self.admin_user
+        )
+        attendance = Attendance.objects.create(event=self.event, user=self.student_user)
+        self.certificate = CertificateService.generate_certificate(
+            user=self.student_user,
+            event=self.event,
+            attendance=attendance
+        )
+    
+    def test_owner_downloads_rendered_png(self):
+        """Test the certificate is rendered on first download"""
+        self.client.login(email='student@test.com', password='testpass123')
+        
+        url = reverse('events:download_certificate', kwargs={'certificate_id': self.certificate.id})
+        response = self.client.get(url)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        content = b''.join(response.streaming_content)
+        self.assertTrue(content.startswith(b'\x89PNG'))
+    
+    def test_pdf_request_without_template_served_as_png(self):
+        """Test the response describes the PNG rendered when no template allows a PDF"""
+        self.client.login(email='student@test.com', password='testpass123')
+        
+        url = reverse('events:download_certificate', kwargs={'certificate_id': self.certificate.id})
+        response = self.client.get(url, {'format': 'pdf', 'download': '1'})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn(f'certificate_{self.certificate.certificate_number}.png', response['Content-Disposition'])
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'\x89PNG'))
+    
+    def test_other_user_forbidden(self):
+        """Test that other scouts cannot download the certificate"""
+        self.client.login(email='other@test.com', password='testpass123')
+        
+        url = reverse('events:download_certificate', kwargs={'certificate_id': self.certificate.id})
+        response = self.client.get(url)
+        
+        self.assertEqual(response.status_code, 403)
+
+
+@override_settings(CERTIFICATE_CACHE_DIR=CACHE_DIR)
+class PdfCertificateTest(TestCase):
+    """Test vector PDF certificate output"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            rank='admin',
+            is_active=True
+        )
+        self.event = Event.objects.create(
+            title='PDF Event',
+            description='Test Description',
+            date=date.today(),
+            time=time(14, 0),
+            location='Test Location',
+            created_by=self.admin_user
+        )
+        image = Image.new('RGB', (1500, 1000), color='white')
+        image_io = BytesIO()
+        image.save(image_io, format='PNG')
+        CertificateTemplate.objects.create(
+            event=self.event,
+            template_image=SimpleUploadedFile('template.png', image_io.getvalue()),
+            output_format='pdf'
+        )
+        self.scouts = []
+        for i in range(3):
+            scout = User.objects.create_user(
+                username=f'scout{i}',
+                email=f'scout{i}@test.com',
+                password='testpass123',
+                first_name='Scout',
+                last_name=f'Number{i}',
+                is_active=True
+            )
+            Attendance.objects.create(event=self.event, user=scout, status='present')
+            self.scouts.append(scout)
+        CertificateService.generate_event_certificates(self.event, notify=False)
+    
+    def _read_pdf(self, data):
+        from PyPDF2 import PdfReader
+        return PdfReader(BytesIO(data))
+    
+    def test_open_certificate_renders_vector_pdf(self):
+        """Test the name is drawn as text on a page sized from the template"""
+        certificate = EventCertificate.objects.get(event=self.event, user=self.scouts[0])
+        self.assertEqual(CertificateService.certificate_format(certificate), 'pdf')
+        
+        handle = CertificateService.open_certificate(certificate)
+        try:
+            data = handle.read()
+        finally:
+            handle.close()
+        
+        self.assertTrue(data.startswith(b'%PDF'))
+        reader = self._read_pdf(data)
+        self.assertEqual(len(reader.pages), 1)
+        page = reader.pages[0]
+        # 1500x1000 px at 150 DPI
+        self.assertAlmostEqual(float(page.mediabox.width), 720, places=1)
+        self.assertAlmostEqual(float(page.mediabox.height), 480, places=1)
+        self.assertIn('Scout Number0', page.extract_text())
+    
+    def test_png_thumbnail_of_pdf_certificate(self):
+        """Test ?format=png still serves an image for on-page previews"""
+        certificate = EventCertificate.objects.get(event=self.event, user=self.scouts[0])
+        self.client.login(email='scout0@test.com', password='testpass123')
+        url = reverse('events:download_certificate', kwargs={'certificate_id': certificate.id})
+        
+        response = self.client.get(url)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        
+        response = self.client.get(url, {'format': 'png'})
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'\x89PNG'))
+    
+    def test_event_pdf_contains_all_certificates(self):
+        """Test the admin export writes one page per certificate"""
         self.client.login(email='admin@test.com', password='testpass123')
-        stop_url = reverse('events:stop_attendance_session', kwargs={'event_id': self.event.id})
-        self.client.post(stop_url)
         
+        response = self.client.get(reverse('events:event_certificates_pdf', kwargs={'event_id': self.event.id}))
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        reader = self._read_pdf(b''.join(response.streaming_content))
+        self.assertEqual(len(reader.pages), 3)
+        self.assertIn('Scout Number2', reader.pages[2].extract_text())
+    
+    def test_event_pdf_admin_only(self):
+        """Test scouts cannot export the event PDF"""
+        self.client.login(email='scout0@test.com', password='testpass123')
+        
+        response = self.client.get(reverse('events:event_certificates_pdf', kwargs={'event_id': self.event.id}))
+        
+        self.assertNotEqual(response.status_code, 200)
+
+
+@override_settings(CERTIFICATE_CACHE_DIR=CACHE_DIR)
+class BulkCertificateDownloadTest(TestCase):
+    """Test streamed ZIP downloads of certificates"""
+    
+    def setUp(self):
+        self.client = Client()
+        self.admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            rank='admin',
+            is_active=True
+        )
+        self.teacher = User.objects.create_user(
+            username='teacher',
+            email='teacher@test.com',
+            password='testpass123',
+            first_name='Tina',
+            last_name='Teacher',
+            rank='teacher',
+            is_active=True
+        )
+        self.event = Event.objects.create(
+            title='Zip Event',
+            description='Test Description',
+            date=date.today(),
+            time=time(14, 0),
+            location='Test Location',
+            created_by=self.admin_user
+        )
+        self.certificates = []
+        for i in range(3):
+            student = User.objects.create_user(
+                username=f'student{i}',
+                email=f'student{i}@test.com',
+                password='testpass123',
+                first_name='Student',
+                last_name=str(i),
+                rank='scout',
+                managed_by=self.teacher,
+                is_active=True
+            )
+            attendance = Attendance.objects.create(event=self.event, user=student)
+            self.certificates.append(
+                CertificateService.generate_certificate(user=student, event=self.event, attendance=attendance)
+            )
+    
+    def _read_zip(self, response):
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'application/zip')
+        self.assertTrue(response.streaming)
+        return zipfile.ZipFile(BytesIO(b''.join(response.streaming_content)))
+    
+    def test_teacher_bulk_download_streams_stored_pngs(self):
+        """Test teacher ZIP contains every selected certificate, stored without recompression"""
+        self.client.login(email='teacher@test.com', password='testpass123')
+        
+        url = reverse('events:teacher_bulk_download_certificates')
+        response = self.client.post(url, {'certificate_ids': [c.id for c in self.certificates]})
+        
+        archive = self._read_zip(response)
+        self.assertIsNone(archive.testzip())
+        infos = archive.infolist()
+        self.assertEqual(len(infos), 3)
+        for info in infos:
+            self.assertEqual(info.compress_type, zipfile.ZIP_STORED)
+            self.assertTrue(archive.read(info).startswith(b'\x89PNG'))
+    
+    def test_scout_bulk_download_only_own_certificates(self):
+        """Test that scouts only receive their own certificates"""
+        self.client.login(email='student0@test.com', password='testpass123')
+        
+        url = reverse('events:bulk_download_certificates')
+        response = self.client.get(url, {'certificate_ids[]': [c.id for c in self.certificates]})
+        
+        archive = self._read_zip(response)
+        self.assertEqual(len(archive.namelist()), 1)
+        self.assertIn(self.certificates[0].certificate_number, archive.namelist()[0])
+    
+    async def test_asgi_download_streams_asynchronously(self):
+        """Test that under ASGI the ZIP is produced by an async iterator, not buffered whole"""
+        await self.async_client.alogin(email='teacher@test.com', password='testpass123')
+        
+        url = reverse('events:teacher_bulk_download_certificates')
+        response = await self.async_client.post(url, {'certificate_ids': [c.id for c in self.certificates]})
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        archive = zipfile.ZipFile(BytesIO(content))
+        self.assertIsNone(archive.testzip())
+        self.assertEqual(len(archive.namelist()), 3)
+    
+    async def test_iterate_async_pulls_one_item_at_a_time(self):
+        """Test that the async wrapper only advances the sync iterator on demand"""
+        from boyscout_system.utils import iterate_async
+        
+        produced = []
+        
+        def chunks():
+            for i in range(3):
+                produced.append(i)
+                yield i
+        
+        stream = iterate_async(chunks())
+        self.assertEqual(await stream.__anext__(), 0)
+        self.assertEqual(produced, [0])
+        self.assertEqual([item async for item in stream], [1, 2])
+
+
+@override_settings(ATTENDANCE_CERTIFICATES_IN_THREAD=False)
+class AttendanceBroadcastTest(TestCase):
+    """Test attendance state pushed over the per-event channels groups"""
+    
+    def setUp(self):
+        from asgiref.sync import async_to_sync
+        from channels.layers import get_channel_layer
+        from django.core.cache import cache
+        
+        cache.clear()
+        self.client = Client()
+        self.admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            rank='admin',
+            is_active=True
+        )
+        self.student_user = User.objects.create_user(
+            username='student',
+            email='student@test.com',
+            password='testpass123',
+            rank='scout',
+            is_active=True
+        )
+        self.event = Event.objects.create(
+            title='Live Event',
+            description='Test Description',
+            date=date.today(),
+            time=time(14, 0),
+            location='Test Location',
+            created_by=self.admin_user
+        )
+        EventRegistration.objects.create(
+            event=self.event,
+            user=self.student_user,
+            payment_status='not_required'
+        )
+        
+        self.layer = get_channel_layer()
+        self.async_to_sync = async_to_sync
+        self.channel = async_to_sync(self.layer.new_channel)()
+    
+    def _join(self, group):
+        self.async_to_sync(self.layer.group_add)(group, self.channel)
+    
+    def _receive(self):
+        return self.async_to_sync(self.layer.receive)(self.channel)
+    
+    def test_start_and_stop_broadcast_session_state(self):
+        """Test starting and stopping a session is pushed to the event group"""
+        self._join(AttendanceStateService.group_name(self.event.id))
+        self.client.login(email='admin@test.com', password='testpass123')
+        
+        self.client.post(reverse('events:start_attendance_session', kwargs={'event_id': self.event.id}))
+        message = self._receive()
+        self.assertEqual(message['type'], 'attendance.session')
+        self.assertTrue(message['is_active'])
+        
+        self.client.post(reverse('events:stop_attendance_session', kwargs={'event_id': self.event.id}))
+        message = self._receive()
+        self.assertFalse(message['is_active'])
+    
+    def test_check_in_pushes_live_count_to_admins(self):
+        """Test the in-memory counter is incremented and pushed on check-in"""
+        session = AttendanceSession.objects.create(event=self.event)
+        session.start(self.admin_user)
+        self.assertEqual(AttendanceStateService.get_count(self.event.id), 0)
+        self._join(AttendanceStateService.admin_group_name(self.event.id))
+        
+        self.client.login(email='student@test.com', password='testpass123')
+        response = self.client.post(reverse('events:mark_my_attendance', kwargs={'event_id': self.event.id}))
+        self.assertEqual(response.status_code, 200)
+        
+        message = self._receive()
+        self.assertEqual(message['type'], 'attendance.count')
+        self.assertEqual(message['attendance_count'], 1)
+        
+        # Served from the counter without a COUNT query
+        with self.assertNumQueries(0):
+            self.assertEqual(AttendanceStateService.get_count(self.event.id), 1)
+    
+    def test_consumer_sends_snapshot_and_updates(self):
+        """Test the websocket consumer sends the current state, then pushed changes"""
+        import json
+        from asgiref.testing import ApplicationCommunicator
+        from events.consumers import AttendanceConsumer
+        
+        session = AttendanceSession.objects.create(event=self.event)
+        session.start(self.admin_user)
+        
+        async def scenario():
+            # channels.testing needs daphne, so drive the ASGI app directly
+            communicator = ApplicationCommunicator(AttendanceConsumer.as_asgi(), {
+                'type': 'websocket',
+                'path': f'/ws/events/{self.event.id}/attendance/',
+                'user': self.admin_user,
+                'url_route': {'kwargs': {'event_id': str(self.event.id)}},
+            })
+            await communicator.send_input({'type': 'websocket.connect'})
+            self.assertEqual((await communicator.receive_output())['type'], 'websocket.accept')
+            
+            snapshot = json.loads((await communicator.receive_output())['text'])
+            self.assertEqual(snapshot, {'kind': 'session', 'is_active': True, 'expires_at': None, 'attendance_count': 0})
+            
+            await self.layer.group_send(
+                AttendanceStateService.admin_group_name(self.event.id),
+                {'type': 'attendance.count', 'attendance_count': 5}
+            )
+            update = json.loads((await communicator.receive_output())['text'])
+            self.assertEqual(update, {'kind': 'count', 'attendance_count': 5})
+            
+            await communicator.send_input({'type': 'websocket.disconnect', 'code': 1000})
+            await communicator.wait()
+        
+        self.async_to_sync(scenario)()
+
+
+class AttendanceAutoStopTest(TestCase):
+    """Test enforcement of AttendanceSession.auto_stop_minutes"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        
+        cache.clear()
+        self.client = Client()
+        self.admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            rank='admin',
+            is_active=True
+        )
+        self.student_user = User.objects.create_user(
+            username='student',
+            email='student@test.com',
+            password='testpass123',
+            rank='scout',
+            is_active=True
+        )
+        self.events = []
+        for i in range(3):
+            event = Event.objects.create(
+                title=f'Event {i}',
+                description='Test Description',
+                date=date.today(),
+                time=time(14, 0),
+                location='Test Location',
+                created_by=self.admin_user
+            )
+            EventRegistration.objects.create(event=event, user=self.student_user, payment_status='not_required')
+            self.events.append(event)
+    
+    def _start(self, event, minutes, started_minutes_ago):
+        session = AttendanceSession.objects.create(event=event, auto_stop_minutes=minutes)
+        session.start(self.admin_user)
+        session.started_at = timezone.now() - timezone.timedelta(minutes=started_minutes_ago)
+        session.save()
+        return session
+    
+    def test_expires_at(self):
+        """Test the auto-stop deadline is derived from started_at"""
+        session = self._start(self.events[0], 30, 0)
+        self.assertEqual(session.expires_at, session.started_at + timezone.timedelta(minutes=30))
+        
+        manual = self._start(self.events[1], 0, 0)
+        self.assertIsNone(manual.expires_at)
+    
+    def test_stop_expired_sessions_in_bulk(self):
+        """Test only sessions past their auto-stop time are closed"""
+        expired = self._start(self.events[0], 10, 15)
+        running = self._start(self.events[1], 10, 5)
+        manual = self._start(self.events[2], 0, 600)
+        
+        self.assertEqual(AttendanceStateService.stop_expired_sessions(), 1)
+        
+        expired.refresh_from_db()
+        running.refresh_from_db()
+        manual.refresh_from_db()
+        self.assertFalse(expired.is_active)
+        self.assertIsNotNone(expired.stopped_at)
+        self.assertTrue(running.is_active)
+        self.assertTrue(manual.is_active)
+        self.assertFalse(AttendanceStateService.get_session_state(self.events[0].id)['is_active'])
+    
+    def test_overlapping_sweeps_act_once_per_session(self):
+        """Test a session another sweep stopped first is not broadcast or issued again"""
+        first = self._start(self.events[0], 10, 15)
+        second = self._start(self.events[1], 10, 20)
+        
+        def concurrent_sweep(session):
+            # The other sweep closes the remaining session while this one is busy
+            AttendanceSession.objects.exclude(id=session.id).update(is_active=False)
+        
+        with patch.object(AttendanceStateService, 'broadcast_session', side_effect=concurrent_sweep) as broadcast, \
+                patch.object(AttendanceStateService, 'issue_certificates') as issue:
+            self.assertEqual(AttendanceStateService.stop_expired_sessions(), 1)
+        
+        self.assertEqual(broadcast.call_count, 1)
+        self.assertEqual(issue.call_count, 1)
+        self.assertEqual(issue.call_args[0][0].id, broadcast.call_args[0][0].event_id)
+        self.assertFalse(AttendanceSession.objects.filter(id__in=[first.id, second.id], is_active=True).exists())
+    
+    def test_mark_attendance_after_auto_stop(self):
+        """Test check-ins are refused once the cached deadline has passed"""
+        session = self._start(self.events[0], 10, 5)
+        url = reverse('events:mark_my_attendance', kwargs={'event_id': self.events[0].id})
+        self.client.login(email='student@test.com', password='testpass123')
+        
+        # Cache the still-open state, then check in just past the deadline before any sweep
+        state = AttendanceStateService.get_session_state(self.events[0].id)
+        self.assertTrue(AttendanceStateService.session_is_open(state))
+        later = state['expires_at'] + timezone.timedelta(seconds=1)
+        
+        with patch('django.utils.timezone.now', return_value=later):
+            response = self.client.post(url)
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('ended', response.json()['error'])
+        # Closing the session (and issuing certificates) is left to the sweep job
         session.refresh_from_db()
+        self.assertTrue(session.is_active)
+        self.assertFalse(Attendance.objects.filter(event=self.events[0], user=self.student_user).exists())
+    
+    def test_start_with_auto_stop(self):
+        """Test admins can set the auto-stop when starting a session"""
+        self.client.login(email='admin@test.com', password='testpass123')
+        
+        response = self.client.post(
+            reverse('events:start_attendance_session', kwargs={'event_id': self.events[0].id}),
+            {'auto_stop_minutes': '45'}
+        )
+        
+        self.assertEqual(response.status_code, 200)
+        session = AttendanceSession.objects.get(event=self.events[0])
+        self.assertEqual(session.auto_stop_minutes, 45)
+    
+    def test_management_command(self):
+        """Test the cron command closes expired sessions"""
+        from django.core.management import call_command
+        from io import StringIO
+        
+        self._start(self.events[0], 10, 15)
+        out = StringIO()
+        call_command('stop_expired_attendance_sessions', stdout=out)
+        
+        self.assertIn('Stopped 1', out.getvalue())
+        self.assertFalse(AttendanceSession.objects.get(event=self.events[0]).is_active)
+
+
+class MarkAttendanceFastPathTest(TestCase):
+    """Test the per-tap cost of mark_my_attendance"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        
+        cache.clear()
+        self.client = Client()
+        self.admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            rank='admin',
+            is_active=True
+        )
+        self.event = Event.objects.create(
+            title='Jamboree',
+            description='Test Description',
+            date=date.today(),
+            time=time(14, 0),
+            location='Test Location',
+            created_by=self.admin_user
+        )
+        self.scouts = []
+        for i in range(3):
+            scout = User.objects.create_user(
+                username=f'scout{i}',
+                email=f'scout{i}@test.com',
+                password='testpass123',
+                rank='scout',
+                is_active=True
+            )
+            EventRegistration.objects.create(event=self.event, user=scout, payment_status='not_required')
+            self.scouts.append(scout)
+        session = AttendanceSession.objects.create(event=self.event)
+        session.start(self.admin_user)
+        self.url = reverse('events:mark_my_attendance', kwargs={'event_id': self.event.id})
+    
+    def test_warm_check_in_is_a_single_insert(self):
+        """Test a check-in only touches the database for auth and the INSERT"""
+        # Warm the session and registrant caches
+        self.client.force_login(self.scouts[0])
+        self.client.post(self.url)
+        
+        self.client.force_login(self.scouts[1])
+        # Session and user rows for authentication, the analytics page view,
+        # then SAVEPOINT/INSERT/RELEASE for the attendance row
+        with self.assertNumQueries(6):
+            response = self.client.post(self.url)
+        
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(Attendance.objects.filter(event=self.event, user=self.scouts[1]).exists())
+    
+    def test_duplicate_check_in_rejected_by_constraint(self):
+        """Test the unique constraint turns a second tap into a clean error"""
+        self.client.force_login(self.scouts[0])
+        self.assertEqual(self.client.post(self.url).status_code, 200)
+        
+        response = self.client.post(self.url)
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('already marked', response.json()['error'])
+        self.assertEqual(Attendance.objects.filter(event=self.event).count(), 1)
+    
+    def test_registrant_paid_after_session_start(self):
+        """Test registrants missing from the cached set are looked up directly"""
+        AttendanceStateService.get_eligible_user_ids(self.event.id)
+        late = User.objects.create_user(
+            username='late',
+            email='late@test.com',
+            password='testpass123',
+            rank='scout',
+            is_active=True
+        )
+        EventRegistration.objects.create(event=self.event, user=late, payment_status='not_required')
+        outsider = User.objects.create_user(
+            username='outsider',
+            email='outsider@test.com',
+            password='testpass123',
+            rank='scout',
+            is_active=True
+        )
+        
+        self.client.force_login(late)
+        self.assertEqual(self.client.post(self.url).status_code, 200)
+        self.client.force_login(outsider)
+        self.assertEqual(self.client.post(self.url).status_code, 403)
+    
+    def test_stop_by_another_worker_seen_within_seconds(self):
+        """Test a process-local cache keeps session state only briefly"""
+        import time as clock
+        self.client.force_login(self.scouts[0])
+        self.assertEqual(self.client.post(self.url).status_code, 200)
+        # Stopped by another worker: this process's cache was never told
+        AttendanceSession.objects.filter(event=self.event).update(is_active=False)
+        
+        later = clock.time() + AttendanceStateService.LOCAL_STATE_TIMEOUT + 1
+        with patch('django.core.cache.backends.locmem.time.time', return_value=later):
+            self.client.force_login(self.scouts[1])
+            response = self.client.post(self.url)
+        
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('not active', response.json()['error'])
+    
+    def test_shared_cache_keeps_session_state_longer(self):
+        """Test the short lifetime only applies to process-local caches"""
+        self.assertEqual(AttendanceStateService.state_timeout(), AttendanceStateService.LOCAL_STATE_TIMEOUT)
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://localhost'}}
+        with self.settings(CACHES=redis):
+            self.assertEqual(AttendanceStateService.state_timeout(), AttendanceStateService.COUNT_TIMEOUT)
+    
+    def test_registration_removed_mid_session(self):
+        """Test a registrant dropped after the set was cached can no longer check in"""
+        self.assertIn(self.scouts[0].id, AttendanceStateService.get_eligible_user_ids(self.event.id))
+        EventRegistration.objects.get(event=self.event, user=self.scouts[0]).delete()
+        registration = EventRegistration.objects.get(event=self.event, user=self.scouts[1])
+        registration.payment_status = 'pending'
+        registration.save()
+        
+        self.assertEqual(AttendanceStateService.check_eligibility(self.event.id, self.scouts[0].id), 'not_registered')
+        self.assertEqual(AttendanceStateService.check_eligibility(self.event.id, self.scouts[1].id), 'payment_required')
+        self.client.force_login(self.scouts[0])
+        response = self.client.post(self.url)
+        self.assertEqual(response.status_code, 403)
+        self.assertIn('not registered', response.json()['error'])
+
+
+@override_settings(ATTENDANCE_CERTIFICATES_IN_THREAD=False)
+class QrCheckInTest(TestCase):
+    """Test signed QR check-in tokens and batch check-in"""
+    
+    def setUp(self):
+        from django.core.cache import cache
+        
+        cache.clear()
+        self.client = Client()
+        self.admin_user = User.objects.create_user(
+            username='admin',
+            email='admin@test.com',
+            password='testpass123',
+            rank='admin',
+            is_active=True
+        )
+        self.teacher = User.objects.create_user(
+            username='teacher',
+            email='teacher@test.com',
+            password='testpass123',
+            rank='teacher',
+            is_active=True
+        )
+        self.event = Event.objects.create(
+            title='Gate Event',
+            description='Test Description',
+            date=date.today(),
+            time=time(14, 0),
+            location='Test Location',
+            created_by=self.admin_user
+        )
+        self.other_event = Event.objects.create(
+            title='Other Event',
+            description='Test Description',
+            date=date.today(),
+            time=time(14, 0),
+            location='Test Location',
+            created_by=self.admin_user
+        )
+        self.registrations = []
+        for i in range(3):
+            scout = User.objects.create_user(
+                username=f'scout{i}',
+                email=f'scout{i}@test.com',
+                password='testpass123',
+                rank='scout',
+                is_active=True,
+                managed_by=self.teacher if i == 0 else None
+            )
+            self.registrations.append(
+                EventRegistration.objects.create(event=self.event, user=scout, payment_status='not_required')
+            )
+        self.url = reverse('events:batch_check_in', kwargs={'event_id': self.event.id})
+    
+    def _post(self, tokens):
+        import json
+        return self.client.post(self.url, json.dumps({'tokens': tokens}), content_type='application/json')
+    
+    def test_token_round_trip_and_tampering(self):
+        """Test tokens verify offline and reject edited ids"""
+        from events.services.check_in_token import CheckInTokenService
+        
+        registration = self.registrations[0]
+        token = registration.check_in_token
+        self.assertEqual(CheckInTokenService.verify_token(token), (registration.id, self.event.id))
+        
+        reg_id, event_id, signature = token.split('.')
+        self.assertIsNone(CheckInTokenService.verify_token(f'{int(reg_id) + 1}.{event_id}.{signature}'))
+        self.assertIsNone(CheckInTokenService.verify_token('garbage'))
+    
+    def test_admin_batch_check_in(self):
+        """Test one request records many check-ins and reports each token"""
+        self.client.login(email='admin@test.com', password='testpass123')
+        Attendance.objects.create(event=self.event, user=self.registrations[2].user, status='present')
+        other_registration = EventRegistration.objects.create(
+            event=self.other_event, user=self.registrations[0].user, payment_status='not_required'
+        )
+        tokens = [
+            self.registrations[0].check_in_token,
+            self.registrations[1].check_in_token,
+            self.registrations[2].check_in_token,
+            other_registration.check_in_token,
+            'forged.token.value',
+        ]
+        
+        response = self._post(tokens)
+        
+        self.assertEqual(response.status_code, 200)
+        data = response.json()
+        self.assertEqual(data['recorded'], 2)
+        self.assertEqual(
+            [result['status'] for result in data['results']],
+            ['recorded', 'recorded', 'already_recorded', 'wrong_event', 'invalid']
+        )
+        self.assertEqual(Attendance.objects.filter(event=self.event).count(), 3)
+        
+        # Re-uploading the same queued batch is harmless
+        data = self._post(tokens[:2]).json()
+        self.assertEqual(data['recorded'], 0)
+        self.assertEqual(Attendance.objects.filter(event=self.event).count(), 3)
+    
+    def test_check_in_without_session_queues_certificates(self):
+        """Test certificates are left to the background issuer, not rendered in the upload"""
+        self.client.login(email='admin@test.com', password='testpass123')
+        
+        with patch.object(AttendanceStateService, 'issue_certificates') as issue, \
+                patch.object(AttendanceStateService, 'issue_certificates_in_background') as background:
+            data = self._post([self.registrations[0].check_in_token]).json()
+        
+        self.assertEqual(data['recorded'], 1)
+        issue.assert_not_called()
+        background.assert_called_once()
+        session = AttendanceSession.objects.get(event=self.event)
         self.assertFalse(session.is_active)
+        self.assertIsNone(session.certificates_issued_at)
+        
+        # The next issue run picks the event up; a stopped session already issued is flagged again
+        with patch.object(AttendanceStateService, 'issue_certificates', return_value=[]) as issue:
+            self.assertEqual(AttendanceStateService.issue_pending_certificates(), 1)
+            self._post([self.registrations[1].check_in_token])
+            self.assertEqual(AttendanceStateService.issue_pending_certificates(), 1)
+        self.assertEqual(issue.call_count, 2)
+    
+    def test_teacher_limited_to_own_students(self):
+        """Test teachers can only check in the students they manage"""
+        self.client.login(email='teacher@test.com', password='testpass123')
+        
+        data = self._post([self.registrations[0].check_in_token, self.registrations[1].check_in_token]).json()
+        
+        self.assertEqual(
+            [result['status'] for result in data['results']],
+            ['recorded', 'not_your_student']
+        )
+    
+    def test_scouts_cannot_batch_check_in(self):
+        """Test scouts are refused"""
+        self.client.login(email='scout1@test.com', password='testpass123')
+        
+        response = self._post([self.registrations[1].check_in_token])
+        
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Attendance.objects.filter(event=self.event).exists())
+    
+    def test_registration_qr_svg(self):
+        """Test the registrant can fetch their QR code"""
+        self.client.login(email='scout1@test.com', password='testpass123')
+        
+        response = self.client.get(reverse('events:registration_qr', kwargs={'registration_id': self.registrations[1].id}))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/svg+xml')
+        self.assertIn(b'<svg', response.content)
+        
+        response = self.client.get(reverse('events:registration_qr', kwargs={'registration_id': self.registrations[2].id}))
+        self.assertEqual(response.status_code, 403)
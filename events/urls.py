@@ -31,8 +31,13 @@ urlpatterns = [
     path('<int:event_id>/stop-attendance/', views.stop_attendance_session, name='stop_attendance_session'),
     path('<int:event_id>/attendance-status/', views.check_attendance_status, name='check_attendance_status'),
     path('<int:event_id>/mark-attendance/', views.mark_my_attendance, name='mark_my_attendance'),
+    path('<int:event_id>/check-in/scanner/', views.check_in_scanner, name='check_in_scanner'),
+    path('<int:event_id>/check-in/batch/', views.batch_check_in, name='batch_check_in'),
+    path('registrations/<int:registration_id>/qr/', views.registration_qr, name='registration_qr'),
     path('<int:event_id>/upload-certificate/', views.upload_certificate_template, name='upload_certificate_template'),
     path('<int:event_id>/preview-certificate/', views.preview_certificate_template, name='preview_certificate_template'),
+    path('<int:event_id>/certificates.pdf', views.event_certificates_pdf, name='event_certificates_pdf'),
     path('my-certificates/', views.my_certificates, name='my_certificates'),
+    path('certificates/<int:certificate_id>/', views.download_certificate, name='download_certificate'),
     path('bulk-download-certificates/', views.bulk_download_certificates, name='bulk_download_certificates'),
 ] 
\ No newline at end of file
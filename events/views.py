@@ -1,13 +1,17 @@
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.contrib import messages
-from .models import Event, EventPhoto, Attendance, EventRegistration, EventPayment, AttendanceSession, CertificateTemplate, EventCertificate
+from .models import Event, EventPhoto, Attendance, EventRegistration, EventPayment, AttendanceSession, CertificateTemplate, EventCertificate, PaymentAllocation
 from .forms import EventForm, EventPhotoForm, EventRegistrationForm, EventPaymentForm
 from accounts.views import admin_required # Reusing the admin_required decorator
 from .services.certificate_service import CertificateService
+from .services.attendance_state import AttendanceStateService
+from .services.check_in_token import CheckInTokenService
+from .paymongo_service import PendingCheckout, run_checkout
+from asgiref.sync import sync_to_async
 from django.core.paginator import Paginator
-from django.db.models import Q, Sum
-from django.db import models
+from django.db.models import Count, Q, Sum
+from django.db import models, transaction
 from django.core.exceptions import PermissionDenied
 from django.http import HttpResponseForbidden, JsonResponse
 from django.conf import settings
@@ -18,7 +22,7 @@ from django.core.files.base import ContentFile
 from accounts.models import User
 from analytics.models import AuditLog
 from django.utils import timezone
-from notifications.services import send_realtime_notification, NotificationService
+from notifications.services import send_realtime_notification, send_realtime_notifications, NotificationService
 from decimal import Decimal
 import logging
 import sys
@@ -122,7 +126,15 @@ def event_create(request):
     return render(request, 'events/event_form.html', {'form': form})
 
 @login_required
-def event_detail(request, pk):
+async def event_detail(request, pk):
+    """
+    Event page with registration. Registering for a paid event awaits the
+    PayMongo source without blocking the worker; everything else runs sync.
+    """
+    return await run_checkout(await sync_to_async(_event_detail)(request, pk))
+
+
+def _event_detail(request, pk):
     # Gate events for scouts until registration is verified
     if hasattr(request.user, 'is_scout') and request.user.is_scout() and not request.user.is_registration_complete:
         messages.warning(request, 'Events are locked until your registration payment is verified.')
@@ -172,11 +184,11 @@ def event_detail(request, pk):
                     
                     amount_to_pay = event.payment_amount - total_paid
                     
-                    # Check if user already has a pending payment
+                    # Check if user already has a pending payment (a lapsed checkout doesn't count)
                     existing_pending = EventPayment.objects.filter(
                         registration=reg,
                         status='pending'
-                    ).first()
+                    ).exclude(expires_at__lte=timezone.now()).first()
                     
                     # Update payment status
                     if amount_to_pay > 0:
@@ -187,10 +199,6 @@ def event_detail(request, pk):
                     
                     # Only create new payment if no pending payment exists and amount is due
                     if amount_to_pay > 0 and not existing_pending:
-                        # Create PayMongo source for QR payment
-                        from .paymongo_service import PayMongoService
-                        paymongo_service = PayMongoService()
-                        
                         # Get selected payment method from form
                         payment_method = request.POST.get('payment_method', 'gcash')
                         
@@ -198,51 +206,56 @@ def event_detail(request, pk):
                         success_url = request.build_absolute_uri(f'/events/payment-status/{reg.id}/success/')
                         failed_url = request.build_absolute_uri(f'/events/payment-status/{reg.id}/failed/')
                         
-                        source_response = paymongo_service.create_source(
-                            amount=amount_to_pay,
-                            type=payment_method,  # gcash, grab_pay, or paymaya
-                            redirect_success=success_url,
-                            redirect_failed=failed_url,
-                            metadata={
-                                'registration_id': str(reg.id),
-                                'event_id': str(event.id),
-                                'user_id': str(request.user.id)
-                            }
-                        )
-                        
-                        # Check if PayMongo returned an error
-                        if source_response and isinstance(source_response, dict) and source_response.get('error'):
-                            error_msg = source_response.get('message', 'Unknown error')
-                            print(f"PayMongo source creation failed. Error: {error_msg}")
-                            messages.error(request, f'Failed to create payment link: {error_msg}')
-                            return redirect('events:event_detail', pk=event.pk)
-                        
-                        if source_response and 'id' in source_response and 'attributes' in source_response:
-                            source_id = source_response['id']
-                            checkout_url = source_response['attributes']['redirect']['checkout_url']
-                            return_url_data = source_response['attributes'].get('redirect', {})
-                            expires_at_str = return_url_data.get('return_url_expires_at')
+                        def finish(source_response):
+                            # Check if PayMongo returned an error
+                            if source_response and isinstance(source_response, dict) and source_response.get('error'):
+                                error_msg = source_response.get('message', 'Unknown error')
+                                print(f"PayMongo source creation failed. Error: {error_msg}")
+                                messages.error(request, f'Failed to create payment link: {error_msg}')
+                                return redirect('events:event_detail', pk=event.pk)
                             
-                            # Create EventPayment record
-                            payment = EventPayment.objects.create(
-                                registration=reg,
-                                amount=amount_to_pay,
-                                paymongo_source_id=source_id,
-                                paymongo_checkout_url=checkout_url,
-                                payment_method=f'paymongo_{payment_method}',
-                                status='pending',
-                                expires_at=timezone.datetime.fromisoformat(expires_at_str.replace('Z', '+00:00')) if expires_at_str else None
-                            )
-                            
-                            messages.success(request, 'Registration created! Click the "Pay Now" button below to complete your payment.')
-                            # Store checkout URL in session to open in new tab
-                            request.session['paymongo_checkout_url'] = checkout_url
-                            return redirect('events:event_detail', pk=event.pk)
-                        else:
-                            # Log the error for debugging
-                            print(f"PayMongo source creation failed. Response: {source_response}")
-                            messages.error(request, 'Failed to create payment link. Please try again.')
-                            return redirect('events:event_detail', pk=event.pk)
+                            if source_response and 'id' in source_response and 'attributes' in source_response:
+                                source_id = source_response['id']
+                                checkout_url = source_response['attributes']['redirect']['checkout_url']
+                                return_url_data = source_response['attributes'].get('redirect', {})
+                                expires_at_str = return_url_data.get('return_url_expires_at')
+                                
+                                # Create EventPayment record
+                                payment = EventPayment.objects.create(
+                                    registration=reg,
+                                    amount=amount_to_pay,
+                                    paymongo_source_id=source_id,
+                                    paymongo_checkout_url=checkout_url,
+                                    payment_method=f'paymongo_{payment_method}',
+                                    status='pending',
+                                    expires_at=timezone.datetime.fromisoformat(expires_at_str.replace('Z', '+00:00')) if expires_at_str else None
+                                )
+                                
+                                messages.success(request, 'Registration created! Click the "Pay Now" button below to complete your payment.')
+                                # Store checkout URL in session to open in new tab
+                                request.session['paymongo_checkout_url'] = checkout_url
+                                return redirect('events:event_detail', pk=event.pk)
+                            else:
+                                # Log the error for debugging
+                                print(f"PayMongo source creation failed. Response: {source_response}")
+                                messages.error(request, 'Failed to create payment link. Please try again.')
+                                return redirect('events:event_detail', pk=event.pk)
+                        
+                        # Create PayMongo source for QR payment (awaited by event_detail)
+                        return PendingCheckout(
+                            source_kwargs={
+                                'amount': amount_to_pay,
+                                'type': payment_method,  # gcash, grab_pay, or paymaya
+                                'redirect_success': success_url,
+                                'redirect_failed': failed_url,
+                                'metadata': {
+                                    'registration_id': str(reg.id),
+                                    'event_id': str(event.id),
+                                    'user_id': str(request.user.id)
+                                },
+                            },
+                            finish=finish,
+                        )
                     elif amount_to_pay > 0 and existing_pending:
                         # User already has pending payment
                         if is_update:
@@ -486,6 +499,7 @@ def event_attendance(request, pk):
                 att.status = status
                 att.marked_by = request.user
                 att.save()
+        AttendanceStateService.reset_count(event.id)
         messages.success(request, 'Attendance has been updated.')
         return redirect('events:event_attendance', pk=event.pk)
 
@@ -631,14 +645,17 @@ def verify_event_registration(request, event_pk, reg_pk):
 # ==================== TEACHER VIEWS ====================
 
 @login_required
-def teacher_register_students_event(request):
+async def teacher_register_students_event(request):
     """Teacher registers multiple students for an event with PayMongo payment"""
+    return await run_checkout(await sync_to_async(_teacher_register_students_event)(request))
+
+
+def _teacher_register_students_event(request):
     if not request.user.is_teacher():
         messages.error(request, 'Only teachers can access this page.')
         return redirect('home')
     
     from .forms import TeacherBulkEventRegistrationForm
-    from .paymongo_service import PayMongoService
     
     if request.method == 'POST':
         logger.error("=" * 80)
@@ -665,15 +682,12 @@ def teacher_register_students_event(request):
             logger.error(f"Students count: {len(students)}")
             logger.error(f"Students: {[s.get_full_name() for s in students]}")
             
-            # Check for already registered students
-            already_registered = []
-            students_to_register = []
-            
-            for student in students:
-                if EventRegistration.objects.filter(event=event, user=student).exists():
-                    already_registered.append(student.get_full_name())
-                else:
-                    students_to_register.append(student)
+            # Check for already registered students in one query
+            registered_ids = set(
+                EventRegistration.objects.filter(event=event, user__in=students).values_list('user_id', flat=True)
+            )
+            already_registered = [s.get_full_name() for s in students if s.id in registered_ids]
+            students_to_register = [s for s in students if s.id not in registered_ids]
             
             logger.error(f"Already registered: {already_registered}")
             logger.error(f"Students to register: {[s.get_full_name() for s in students_to_register]}")
@@ -696,25 +710,27 @@ def teacher_register_students_event(request):
             # If free event, register immediately
             if not event.has_payment_required or total_amount == 0:
                 logger.error("FREE EVENT - Registering immediately")
-                registered_count = 0
-                for student in students_to_register:
-                    registration = EventRegistration.objects.create(
-                        event=event,
-                        user=student,
-                        rsvp='yes',
-                        amount_required=Decimal('0.00'),
-                        payment_status='not_required',
-                        verified=True,
-                        verification_date=timezone.now()
-                    )
-                    registered_count += 1
+                with transaction.atomic():
+                    EventRegistration.objects.bulk_create([
+                        EventRegistration(
+                            event=event,
+                            user=student,
+                            rsvp='yes',
+                            amount_required=Decimal('0.00'),
+                            payment_status='not_required',
+                            verified=True,
+                            verification_date=timezone.now()
+                        )
+                        for student in students_to_register
+                    ])
+                    registered_count = len(students_to_register)
                     
-                    # Send notification to student
-                    send_realtime_notification(
-                        student.id,
-                        f"Your teacher has registered you for {event.title}",
-                        type='event'
-                    )
+                    # Send notification to students
+                    notifications = [
+                        (student.id, f"Your teacher has registered you for {event.title}", 'event')
+                        for student in students_to_register
+                    ]
+                    transaction.on_commit(lambda: send_realtime_notifications(notifications))
                 
                 if already_registered:
                     messages.warning(request, f'Already registered: {", ".join(already_registered)}')
@@ -724,66 +740,30 @@ def teacher_register_students_event(request):
                 messages.success(request, f'Successfully registered {registered_count} student(s) for {event.title}.')
                 return redirect('events:event_detail', pk=event.id)
             
-            # Create event registrations (pending payment)
+            # Pending registrations are only written once the PayMongo source exists
             logger.error("PAID EVENT - Creating PayMongo payment")
-            registrations_created = []
-            for student in students_to_register:
-                registration = EventRegistration.objects.create(
-                    event=event,
-                    user=student,
-                    rsvp='yes',
-                    amount_required=event.payment_amount,
-                    payment_status='pending',
-                    verified=False,
-                    total_paid=Decimal('0.00')
-                )
-                registrations_created.append(registration)
             
-            logger.error(f"Created {len(registrations_created)} pending registrations")
+            # Build redirect URL
+            redirect_url = request.build_absolute_uri(
+                f'/events/teacher-bulk-event-payment-status/{event.id}/'
+            )
             
-            # Create PayMongo source for bulk payment
-            paymongo = PayMongoService()
+            logger.error(f"Redirect URL: {redirect_url}")
             
-            try:
-                # Build redirect URL
-                redirect_url = request.build_absolute_uri(
-                    f'/events/teacher-bulk-event-payment-status/{event.id}/'
-                )
-                
-                logger.error(f"Redirect URL: {redirect_url}")
-                
-                # Get student names for description
-                student_names = ', '.join([s.get_full_name() for s in students_to_register[:3]])
-                if len(students_to_register) > 3:
-                    student_names += f' and {len(students_to_register) - 3} more'
-                
-                logger.error(f"Creating PayMongo source for ₱{total_amount}")
-                logger.error(f"Description: Event Registration for {len(students_to_register)} students: {student_names}")
-                
-                source_data = paymongo.create_source(
-                    amount=total_amount,
-                    type='gcash',
-                    redirect_success=redirect_url,
-                    redirect_failed=redirect_url,
-                    metadata={
-                        'teacher_email': str(request.user.email),
-                        'teacher_name': str(request.user.get_full_name()),
-                        'event_id': str(event.id),
-                        'event_title': str(event.title),
-                        'student_count': str(len(students_to_register)),
-                        'student_names': student_names,
-                        'payment_type': 'bulk_event_registration',
-                    }
-                )
-                
+            # Get student names for description
+            student_names = ', '.join([s.get_full_name() for s in students_to_register[:3]])
+            if len(students_to_register) > 3:
+                student_names += f' and {len(students_to_register) - 3} more'
+            
+            logger.error(f"Creating PayMongo source for ₱{total_amount}")
+            logger.error(f"Description: Event Registration for {len(students_to_register)} students: {student_names}")
+            
+            def finish(source_data):
                 logger.error(f"PayMongo response: {source_data}")
                 
                 if not source_data or 'id' not in source_data:
                     logger.error("ERROR: Failed to create PayMongo source")
                     logger.error(f"Source data: {source_data}")
-                    # Rollback registrations
-                    for reg in registrations_created:
-                        reg.delete()
                     logger.error("=" * 80)
                     messages.error(request, 'Failed to create PayMongo payment. Please try again.')
                     return redirect('events:teacher_register_students_event')
@@ -794,42 +774,73 @@ def teacher_register_students_event(request):
                 logger.error(f"PayMongo source created: {source_id}")
                 logger.error(f"Checkout URL: {checkout_url}")
                 
-                # Create ONE EventPayment record for the bulk payment (linked to first registration)
-                # The other registrations will be updated when payment is verified
-                bulk_payment = EventPayment.objects.create(
-                    registration=registrations_created[0],  # Link to first registration
-                    amount=total_amount,  # Total amount for all students
-                    paymongo_source_id=source_id,
-                    paymongo_checkout_url=checkout_url,
-                    status='pending',
-                    notes=f"Bulk payment for {len(registrations_created)} students by teacher {request.user.get_full_name()}"
-                )
-                
-                logger.error(f"Created bulk EventPayment: {bulk_payment.id}")
-                
-                # Store registration IDs in session for verification later
-                request.session['bulk_event_registration_ids'] = [r.id for r in registrations_created]
+                # Registrations, the bulk payment and its allocations are written together;
+                # a student registered meanwhile fails the unique check and rolls all of it back
+                with transaction.atomic():
+                    EventRegistration.objects.bulk_create([
+                        EventRegistration(
+                            event=event,
+                            user=student,
+                            rsvp='yes',
+                            amount_required=event.payment_amount,
+                            payment_status='pending',
+                            verified=False,
+                            total_paid=Decimal('0.00')
+                        )
+                        for student in students_to_register
+                    ])
+                    registrations_created = list(
+                        EventRegistration.objects.filter(event=event, user__in=students_to_register).order_by('id')
+                    )
+                    
+                    # Create ONE EventPayment record for the bulk payment (linked to first registration)
+                    # and allocate it across every registration it pays for
+                    bulk_payment = EventPayment.objects.create(
+                        registration=registrations_created[0],  # Link to first registration
+                        amount=total_amount,  # Total amount for all students
+                        paymongo_source_id=source_id,
+                        paymongo_checkout_url=checkout_url,
+                        status='pending',
+                        notes=f"Bulk payment for {len(registrations_created)} students by teacher {request.user.get_full_name()}"
+                    )
+                    PaymentAllocation.objects.bulk_create([
+                        PaymentAllocation(payment=bulk_payment, registration=reg, amount=event.payment_amount)
+                        for reg in registrations_created
+                    ])
                 
-                logger.error(f"Stored {len(registrations_created)} registration IDs in session")
+                logger.error(f"Created bulk EventPayment: {bulk_payment.id} covering {len(registrations_created)} registrations")
                 logger.error(f"REDIRECTING TO PAYMONGO: {checkout_url}")
                 logger.error("=" * 80)
                 
                 # Redirect to PayMongo checkout
                 return redirect(checkout_url)
-                
-            except Exception as e:
-                logger.error(f"EXCEPTION occurred: {str(e)}")
-                logger.error(f"Exception type: {type(e)}")
-                import traceback
-                logger.error(traceback.format_exc())
-                logger.error(f"Exception creating bulk event PayMongo payment: {str(e)}", exc_info=True)
-                # Rollback registrations
-                for reg in registrations_created:
-                    reg.delete()
-                logger.error("Rolled back registrations due to exception")
+            
+            def on_error(e):
+                logger.error(f"Exception creating bulk event PayMongo payment: {str(e)}", exc_info=e)
                 logger.error("=" * 80)
                 messages.error(request, f'Error creating payment: {str(e)}. Please try again.')
                 return redirect('events:teacher_register_students_event')
+            
+            # Create PayMongo source for bulk payment (awaited by teacher_register_students_event)
+            return PendingCheckout(
+                source_kwargs={
+                    'amount': total_amount,
+                    'type': 'gcash',
+                    'redirect_success': redirect_url,
+                    'redirect_failed': redirect_url,
+                    'metadata': {
+                        'teacher_email': str(request.user.email),
+                        'teacher_name': str(request.user.get_full_name()),
+                        'event_id': str(event.id),
+                        'event_title': str(event.title),
+                        'student_count': str(len(students_to_register)),
+                        'student_names': student_names,
+                        'payment_type': 'bulk_event_registration',
+                    },
+                },
+                finish=finish,
+                on_error=on_error,
+            )
     else:
         logger.error("GET request - displaying form")
         form = TeacherBulkEventRegistrationForm(teacher=request.user)
@@ -851,80 +862,32 @@ def teacher_bulk_event_payment_status(request, event_id):
     
     event = get_object_or_404(Event, id=event_id)
     
-    # Get registration IDs from session
-    registration_ids = request.session.get('bulk_event_registration_ids', [])
+    # The teacher's latest bulk payment for this event, found through its allocations
+    bulk_payment = (
+        EventPayment.objects.filter(
+            registration__event=event,
+            allocations__registration__user__managed_by=request.user,
+        )
+        .annotate(student_count=Count('allocations'))
+        .order_by('-created_at')
+        .first()
+    )
     
-    if not registration_ids:
-        messages.warning(request, 'No pending registration payment session found.')
+    if not bulk_payment:
+        messages.warning(request, 'No pending registration payment found.')
         return redirect('events:event_detail', pk=event.id)
     
-    from .paymongo_service import PayMongoService
-    
-    # Get all registrations
-    registrations = EventRegistration.objects.filter(id__in=registration_ids)
-    
-    if not registrations.exists():
-        messages.error(request, 'Registration records not found.')
+    # The webhook worker credits every allocated registration when it verifies the payment
+    if bulk_payment.status == 'verified':
+        messages.success(
+            request,
+            f'Payment verified! {bulk_payment.student_count} student(s) successfully registered for {event.title}.'
+        )
         return redirect('events:event_detail', pk=event.id)
     
-    # Get the first payment to check PayMongo source status
-    first_payment = EventPayment.objects.filter(registration__in=registrations).first()
-    
-    if first_payment and first_payment.paymongo_source_id:
-        paymongo = PayMongoService()
-        source_data = paymongo.get_source(first_payment.paymongo_source_id)
-        
-        if source_data and 'data' in source_data:
-            source_status = source_data['data']['attributes']['status']
-            
-            # If source is chargeable, create payment
-            if source_status == 'chargeable':
-                total_amount = sum(r.amount_required for r in registrations)
-                description = f"Bulk Event Registration - {len(registrations)} students for {event.title}"
-                
-                payment_response = paymongo.create_payment(
-                    source_id=first_payment.paymongo_source_id,
-                    amount=total_amount,
-                    description=description
-                )
-                
-                if payment_response and payment_response.get('data'):
-                    payment_id = payment_response['data']['id']
-                    payment_status = payment_response['data']['attributes']['status']
-                    
-                    # If paid, verify all registrations
-                    if payment_status == 'paid':
-                        # Update the bulk EventPayment record
-                        first_payment.paymongo_payment_id = payment_id
-                        first_payment.status = 'verified'
-                        first_payment.verification_date = timezone.now()
-                        first_payment.save()
-                        
-                        # Update all registrations (no need to create individual EventPayment records
-                        # since they all share the same bulk payment)
-                        for registration in registrations:
-                            # Update registration status
-                            registration.total_paid = registration.amount_required
-                            registration.payment_status = 'paid'
-                            registration.verified = True
-                            registration.verification_date = timezone.now()
-                            registration.save()
-                            
-                            # Send notification to student
-                            send_realtime_notification(
-                                user_id=registration.user.id,
-                                message=f"Your event registration for {event.title} has been confirmed! Payment verified.",
-                                type='event'
-                            )
-                        
-                        # Clear session
-                        del request.session['bulk_event_registration_ids']
-                        
-                        messages.success(
-                            request,
-                            f'Payment verified! {len(registrations)} student(s) successfully registered for {event.title}.'
-                        )
-                        return redirect('events:event_detail', pk=event.id)
+    if bulk_payment.status in ('pending', 'processing'):
+        from .services.paymongo_webhook import PayMongoWebhookService
+        PayMongoWebhookService.schedule_poll(bulk_payment.paymongo_source_id)
     
     # If not verified yet, show waiting message and redirect
     messages.info(request, 'Processing payment... Please wait.')
@@ -1012,6 +975,8 @@ def teacher_mark_attendance(request):
                             logger.error(f"Certificate generation error for student {student.id}: {e}")
                             # Don't fail attendance marking if certificate generation fails
             
+            AttendanceStateService.reset_count(selected_event.id)
+            
             # Success message with certificate info
             success_msg = f'Attendance marked for {marked_count} student(s).'
             if certificates_generated > 0:
@@ -1039,299 +1004,48 @@ logger = logging.getLogger(__name__)
 @require_POST
 def paymongo_webhook(request):
     """
-    Handle PayMongo webhook events:
+    Receive PayMongo webhook events.
+    The event is verified and stored in the webhook inbox, and PayMongo gets
+    its 200 right away; PayMongoWebhookService applies it afterwards:
     - source.chargeable: Create payment when source becomes chargeable
     - payment.paid: Mark payment as verified
     - payment.failed: Mark payment as failed
+    Redelivered events are recognised by their PayMongo event id and not applied again.
     """
-    # CRITICAL DEBUG: Log every webhook request
-    print("=" * 80)
-    print("🔔 PAYMONGO WEBHOOK RECEIVED")
-    print("=" * 80)
-    
+    from .services.paymongo_webhook import PayMongoWebhookService
+
+    payload_bytes = request.body
+    signature = request.META.get('HTTP_PAYMONGO_SIGNATURE', '')
+    logger.info(f"PayMongo webhook received - Signature present: {bool(signature)}")
+
+    verify_signature = getattr(settings, 'PAYMONGO_VERIFY_WEBHOOK', True)
+    if verify_signature and not PayMongoService().verify_webhook_signature(payload_bytes, signature):
+        logger.warning("Invalid PayMongo webhook signature")
+        return JsonResponse({'error': 'Invalid signature'}, status=401)
+
     try:
-        # Get webhook data (keep as bytes for signature verification)
-        payload_bytes = request.body
-        signature = request.META.get('HTTP_PAYMONGO_SIGNATURE', '')
-        
-        # Log incoming webhook with full details
-        print(f"📥 Webhook Payload (first 500 chars): {payload_bytes.decode('utf-8')[:500]}...")
-        print(f"🔐 Signature Present: {bool(signature)}")
-        logger.info(f"PayMongo webhook received - Signature present: {bool(signature)}")
-        
-        # Verify webhook signature
-        paymongo_service = PayMongoService()
-        
-        # TEMPORARY: Skip signature verification in test mode for debugging
-        # TODO: Re-enable signature verification in production
-        verify_signature = getattr(settings, 'PAYMONGO_VERIFY_WEBHOOK', True)
-        if verify_signature and not paymongo_service.verify_webhook_signature(payload_bytes, signature):
-            logger.warning("Invalid PayMongo webhook signature")
-            return JsonResponse({'error': 'Invalid signature'}, status=401)
-        
-        # Now decode the payload for processing
-        payload = payload_bytes.decode('utf-8')
-        logger.info(f"Webhook payload: {payload}")
-        
-        # Parse webhook data
-        data = json.loads(payload)
-        event_type = data.get('data', {}).get('attributes', {}).get('type')
-        event_data = data.get('data', {}).get('attributes', {}).get('data', {})
-        
-        print(f"📋 Event Type: {event_type}")
-        print(f"📦 Event Data ID: {event_data.get('id', 'N/A')}")
-        logger.info(f"PayMongo webhook event type: {event_type}")
-        logger.info(f"Event data: {json.dumps(event_data, indent=2)}")
-        
-        if event_type == 'source.chargeable':
-            print("💳 Processing source.chargeable event...")
-            # Source is ready to be charged - create payment
-            source_id = event_data.get('id')
-            print(f"🔍 Looking for payment with source_id: {source_id}")
-            
-            # Find the payment record (check both EventPayment and RegistrationPayment)
-            payment = EventPayment.objects.filter(paymongo_source_id=source_id).first()
-            registration_payment = None
-            
-            if not payment:
-                print("   Not found in EventPayment, checking RegistrationPayment...")
-                # Check if it's a registration payment
-                from accounts.models import RegistrationPayment
-                registration_payment = RegistrationPayment.objects.filter(paymongo_source_id=source_id).first()
-                
-                if not registration_payment:
-                    print(f"❌ ERROR: Payment not found for source: {source_id}")
-                    logger.error(f"Payment not found for source: {source_id}")
-                    return JsonResponse({'error': 'Payment not found'}, status=404)
-                else:
-                    print(f"✅ Found RegistrationPayment: ID={registration_payment.id}, User={registration_payment.user.email}")
-                    logger.info(f"Found registration payment for source: {source_id}, User: {registration_payment.user.email}")
-            else:
-                print(f"✅ Found EventPayment: ID={payment.id}")
-            
-            # Create payment via PayMongo
-            if payment:
-                # Event payment
-                description = f"Event Payment - {payment.registration.event.title}"
-                print(f"💰 Creating payment for Event: {description}")
-            else:
-                # Registration payment
-                description = f"Registration Fee - {registration_payment.user.get_full_name()}"
-                print(f"💰 Creating payment for Registration: {description}")
-            
-            print(f"🚀 Calling PayMongo API to create payment...")
-            payment_response = paymongo_service.create_payment(
-                source_id=source_id,
-                amount=payment.amount if payment else registration_payment.amount,
-                description=description
-            )
-            
-            print(f"📨 PayMongo Response: {json.dumps(payment_response, indent=2) if payment_response else 'None'}")
-            
-            if payment_response and payment_response.get('data'):
-                payment_id = payment_response['data']['id']
-                print(f"✅ Payment created successfully: {payment_id}")
-                
-                if payment:
-                    # Update EventPayment
-                    payment.paymongo_payment_id = payment_id
-                    payment.status = 'processing'
-                    payment.save()
-                    
-                    # Update registration payment status
-                    payment.registration.payment_status = 'pending'
-                    payment.registration.save()
-                    print(f"✅ EventPayment updated to processing")
-                else:
-                    # Update RegistrationPayment
-                    registration_payment.paymongo_payment_id = payment_id
-                    registration_payment.status = 'processing'
-                    registration_payment.save()
-                    print(f"✅ RegistrationPayment updated to processing")
-                
-                logger.info(f"Payment created: {payment_id}")
-            else:
-                print(f"❌ Failed to create payment - No response from PayMongo")
-                if payment:
-                    payment.status = 'failed'
-                    payment.save()
-                    payment.registration.payment_status = 'rejected'
-                    payment.registration.save()
-                else:
-                    registration_payment.status = 'failed'
-                    registration_payment.save()
-                
-                logger.error(f"Failed to create payment for source: {source_id}")
-        
-        elif event_type == 'payment.paid':
-            print("✅ Processing payment.paid event...")
-            # Payment successful - mark as verified
-            payment_id = event_data.get('id')
-            print(f"🔍 Looking for payment with payment_id: {payment_id}")
-            
-            # Find the payment record (check both EventPayment and RegistrationPayment)
-            payment = EventPayment.objects.filter(paymongo_payment_id=payment_id).first()
-            registration_payment = None
-            
-            if not payment:
-                print("   Not found in EventPayment, checking RegistrationPayment...")
-                # Check if it's a registration payment
-                from accounts.models import RegistrationPayment
-                registration_payment = RegistrationPayment.objects.filter(paymongo_payment_id=payment_id).first()
-                
-                if not registration_payment:
-                    print(f"❌ ERROR: Payment not found for payment_id: {payment_id}")
-                    logger.error(f"Payment not found for payment_id: {payment_id}")
-                    return JsonResponse({'error': 'Payment not found'}, status=404)
-                else:
-                    print(f"✅ Found RegistrationPayment: ID={registration_payment.id}, User={registration_payment.user.email}")
-            else:
-                print(f"✅ Found EventPayment: ID={payment.id}")
-            
-            if payment:
-                # Event payment - mark as verified
-                print(f"💚 Marking EventPayment as verified...")
-                payment.status = 'verified'
-                payment.verification_date = timezone.now()
-                payment.save()
-                
-                # Update registration total paid and payment status
-                registration = payment.registration
-                registration.total_paid += payment.amount
-                registration.payment_status = 'paid'
-                registration.verified = True
-                registration.verification_date = timezone.now()
-                registration.save()
-                
-                # Send notification to user
-                NotificationService.send_notification(
-                    user=registration.user,
-                    title="Payment Verified",
-                    message=f"Your payment for {registration.event.title} has been verified. Your registration is confirmed!",
-                    notification_type='payment',
-                    related_object=payment
-                )
-                
-                logger.info(f"Event payment verified: {payment_id}")
-                print(f"✅ EventPayment verified successfully")
-            else:
-                # Registration payment - mark as verified
-                print(f"💚 Marking RegistrationPayment as verified...")
-                registration_payment.status = 'verified'
-                registration_payment.verification_date = timezone.now()
-                registration_payment.save()
-                print(f"   Status updated to: {registration_payment.status}")
-                
-                # Update user registration status
-                user = registration_payment.user
-                print(f"👤 Updating user {user.email} registration status...")
-                
-                # Update total paid amount
-                user.registration_total_paid += registration_payment.amount
-                user.registration_status = 'payment_verified'
-                user.update_registration_status()  # This will set to 'active' and set membership expiry
-                user.save()
-                print(f"   User status updated to: {user.registration_status}")
-                print(f"   User is_active: {user.is_active}")
-                print(f"   Total paid: ₱{user.registration_total_paid}")
-                
-                # Send notification to user
-                NotificationService.send_notification(
-                    user=user,
-                    title="Registration Payment Verified",
-                    message=f"Your registration payment of ₱{registration_payment.amount} has been verified. Welcome to Boy Scout System!",
-                    notification_type='payment',
-                    related_object=registration_payment
-                )
-                
-                # Notify admins
-                from accounts.models import User as UserModel
-                admins = UserModel.objects.filter(rank='admin')
-                for admin in admins:
-                    NotificationService.send_notification(
-                        user=admin,
-                        title="New Member Registered",
-                        message=f"{user.get_full_name()} has completed registration payment and is now an active member.",
-                        notification_type='registration'
-                    )
-                
-                logger.info(f"Registration payment verified: {payment_id} for user: {user.email}")
-                print(f"✅ RegistrationPayment verified successfully")
-                print(f"📧 Notifications sent to user and admins")
-        
-        elif event_type == 'payment.failed':
-            # Payment failed - mark as failed
-            payment_id = event_data.get('id')
-            
-            # Find the payment record (check both EventPayment and RegistrationPayment)
-            payment = EventPayment.objects.filter(paymongo_payment_id=payment_id).first()
-            registration_payment = None
-            
-            if not payment:
-                # Check if it's a registration payment
-                from accounts.models import RegistrationPayment
-                registration_payment = RegistrationPayment.objects.filter(paymongo_payment_id=payment_id).first()
-                
-                if not registration_payment:
-                    logger.error(f"Payment not found for payment_id: {payment_id}")
-                    return JsonResponse({'error': 'Payment not found'}, status=404)
-            
-            if payment:
-                # Event payment failed
-                payment.status = 'failed'
-                payment.save()
-                
-                # Update registration payment status
-                payment.registration.payment_status = 'rejected'
-                payment.registration.save()
-                
-                # Send notification to user
-                NotificationService.send_notification(
-                    user=payment.registration.user,
-                    title="Payment Failed",
-                    message=f"Payment for {payment.registration.event.title} failed. Please try again.",
-                    notification_type='payment',
-                    related_object=payment
-                )
-                
-                logger.info(f"Event payment failed: {payment_id}")
-            else:
-                # Registration payment failed
-                registration_payment.status = 'failed'
-                registration_payment.save()
-                
-                # Send notification to user
-                NotificationService.send_notification(
-                    user=registration_payment.user,
-                    title="Registration Payment Failed",
-                    message=f"Your registration payment failed. Please try again or contact support.",
-                    notification_type='payment',
-                    related_object=registration_payment
-                )
-                
-                logger.info(f"Registration payment failed: {payment_id}")
-        
-        print("=" * 80)
-        print("✅ WEBHOOK PROCESSED SUCCESSFULLY")
-        print("=" * 80)
-        return JsonResponse({'status': 'success'}, status=200)
-    
-    except Exception as e:
-        print("=" * 80)
-        print(f"❌ WEBHOOK ERROR: {str(e)}")
-        print("=" * 80)
-        logger.error(f"PayMongo webhook error: {str(e)}", exc_info=True)
-        import traceback
-        traceback.print_exc()
-        return JsonResponse({'error': 'Internal server error'}, status=500)
+        payload = json.loads(payload_bytes.decode('utf-8'))
+        event, created = PayMongoWebhookService.enqueue(payload)
+    except (ValueError, AttributeError) as e:
+        logger.warning(f"Malformed PayMongo webhook: {e}")
+        return JsonResponse({'error': 'Invalid payload'}, status=400)
+
+    if created:
+        PayMongoWebhookService.drain_in_background()
+    else:
+        logger.info(f"Duplicate PayMongo webhook {event.event_id} ignored")
+    return JsonResponse({'status': 'queued' if created else 'duplicate'}, status=200)
 
 
 @login_required
 def payment_status(request, registration_id, status):
     """
     Payment status page - shows payment result after PayMongo redirect
-    Immediately checks PayMongo source status and creates/verifies payment
+    Reads the payment as recorded by the webhook worker; while it is still
+    pending, a background poll of PayMongo covers a late webhook
     """
+    from .services.paymongo_webhook import PayMongoWebhookService
+    
     registration = get_object_or_404(EventRegistration, id=registration_id, user=request.user)
     
     # Get latest payment for this registration
@@ -1339,53 +1053,8 @@ def payment_status(request, registration_id, status):
         registration=registration
     ).order_by('-created_at').first()
     
-    # If payment is pending, check PayMongo source status immediately
-    if latest_payment and latest_payment.status == 'pending' and latest_payment.paymongo_source_id:
-        from .paymongo_service import PayMongoService
-        paymongo = PayMongoService()
-        source_data = paymongo.get_source(latest_payment.paymongo_source_id)
-        
-        if source_data and 'data' in source_data:
-            source_status = source_data['data']['attributes']['status']
-            
-            # If source is chargeable, create payment immediately
-            if source_status == 'chargeable':
-                print(f"🔍 Source is chargeable for registration {registration.id}, creating payment...")
-                
-                # Create payment via PayMongo
-                description = f"Event Payment - {registration.event.title}"
-                payment_response = paymongo.create_payment(
-                    source_id=latest_payment.paymongo_source_id,
-                    amount=latest_payment.amount,
-                    description=description
-                )
-                
-                if payment_response and payment_response.get('data'):
-                    payment_id = payment_response['data']['id']
-                    payment_status_value = payment_response['data']['attributes']['status']
-                    
-                    # Update EventPayment with payment ID
-                    latest_payment.paymongo_payment_id = payment_id
-                    latest_payment.status = 'processing'
-                    latest_payment.save()
-                    
-                    # If payment is already paid, mark as verified immediately
-                    if payment_status_value == 'paid':
-                        print(f"✅ Payment already paid, marking as verified...")
-                        latest_payment.status = 'verified'
-                        latest_payment.verification_date = timezone.now()
-                        latest_payment.save()
-                        
-                        # Update registration total paid and payment status
-                        registration.total_paid += latest_payment.amount
-                        registration.payment_status = 'paid'
-                        registration.verified = True
-                        registration.verification_date = timezone.now()
-                        registration.save()
-                        
-                        messages.success(request, 'Payment verified! Your event registration is confirmed.')
-                        # Redirect to event detail page instead of showing waiting page
-                        return redirect('events:event_detail', pk=registration.event.id)
+    if latest_payment and latest_payment.status in ('pending', 'processing'):
+        PayMongoWebhookService.schedule_poll(latest_payment.paymongo_source_id)
     
     # If payment is verified, redirect to event page
     if latest_payment and latest_payment.status == 'verified':
@@ -1419,7 +1088,7 @@ def clear_paymongo_session(request):
 def start_attendance_session(request, event_id):
     """
     Start attendance session for an event (Admin only).
-    Sends real-time notifications to all registered students.
+    Broadcasts the new state to the event page and notifies registered students.
     """
     if request.method != 'POST':
         return JsonResponse({'error': 'POST required'}, status=405)
@@ -1432,8 +1101,15 @@ def start_attendance_session(request, event_id):
     if session.is_active:
         return JsonResponse({'error': 'Attendance session is already active!'}, status=400)
     
+    # Optional auto-stop, enforced by the stop_expired_attendance_sessions command
+    try:
+        session.auto_stop_minutes = max(int(request.POST.get('auto_stop_minutes', session.auto_stop_minutes)), 0)
+    except (TypeError, ValueError):
+        return JsonResponse({'error': 'Auto-stop minutes must be a whole number'}, status=400)
+    
     # Start session
     session.start(request.user)
+    AttendanceStateService.broadcast_session(session)
     
     # Send notifications to all registered students
     registered_users = EventRegistration.objects.filter(
@@ -1459,6 +1135,7 @@ def start_attendance_session(request, event_id):
 def stop_attendance_session(request, event_id):
     """
     Stop attendance session for an event (Admin only).
+    Certificates for everyone who checked in are issued in the background.
     """
     if request.method != 'POST':
         return JsonResponse({'error': 'POST required'}, status=405)
@@ -1473,10 +1150,16 @@ def stop_attendance_session(request, event_id):
         
         # Stop session
         session.stop()
+        AttendanceStateService.broadcast_session(session)
+        
+        # Issue the certificates deferred from check-in off the request; the
+        # issue_attendance_certificates job picks them up if no thread does
+        AttendanceStateService.issue_certificates_in_background()
         
         return JsonResponse({
             'success': True,
-            'message': f'Attendance session stopped for {event.title}!'
+            'certificates_pending': True,
+            'message': f'Attendance session stopped for {event.title}! Certificates are being issued.'
         })
     except AttendanceSession.DoesNotExist:
         return JsonResponse({'error': 'No attendance session found for this event!'}, status=404)
@@ -1486,7 +1169,8 @@ def stop_attendance_session(request, event_id):
 def check_attendance_status(request, event_id):
     """
     AJAX endpoint to check attendance session status and user's attendance.
-    Returns JSON with session status and attendance info.
+    Returns JSON with session status and attendance info. Called once on page
+    load; later changes are pushed over the attendance websocket.
     """
     event = get_object_or_404(Event, id=event_id)
     
@@ -1498,20 +1182,19 @@ def check_attendance_status(request, event_id):
         is_eligible = False
     
     # Check session status
-    try:
-        session = AttendanceSession.objects.get(event=event)
-        is_active = session.is_active
-    except AttendanceSession.DoesNotExist:
-        is_active = False
+    session_state = AttendanceStateService.get_session_state(event.id)
+    is_active = AttendanceStateService.session_is_open(session_state)
+    expires_at = session_state['expires_at'] if is_active else None
     
     # Check if user already marked attendance
     has_attended = Attendance.objects.filter(event=event, user=request.user).exists()
     
     # Get attendance count (for admin)
-    attendance_count = Attendance.objects.filter(event=event).count() if request.user.is_admin() else 0
+    attendance_count = AttendanceStateService.get_count(event.id) if request.user.is_admin() else 0
     
     return JsonResponse({
         'is_active': is_active,
+        'expires_at': expires_at.isoformat() if expires_at else None,
         'has_attended': has_attended,
         'is_eligible': is_eligible,
         'attendance_count': attendance_count,
@@ -1522,73 +1205,168 @@ def check_attendance_status(request, event_id):
 def mark_my_attendance(request, event_id):
     """
     Student marks their own attendance when session is active.
-    Auto-generates certificate if template exists.
+    Kept to a single INSERT per tap: session state and eligible registrants
+    are cached per session, and certificates are issued in bulk when the
+    session closes instead of during check-in.
     """
+    from django.db import IntegrityError, transaction
+    
     if request.method != 'POST':
         return JsonResponse({'error': 'POST required'}, status=405)
     
-    event = get_object_or_404(Event, id=event_id)
-    
-    # Check if session is active
-    try:
-        session = AttendanceSession.objects.get(event=event)
-        if not session.is_active:
-            return JsonResponse({'error': 'Attendance session is not active'}, status=400)
-    except AttendanceSession.DoesNotExist:
-        return JsonResponse({'error': 'No attendance session for this event'}, status=400)
-    
-    # Check if user is registered
-    try:
-        registration = EventRegistration.objects.get(event=event, user=request.user)
-    except EventRegistration.DoesNotExist:
+    # Check if session is active (cached state, no session query per tap)
+    session_state = AttendanceStateService.get_session_state(event_id)
+    if not AttendanceStateService.session_is_open(session_state):
+        if session_state['is_active']:
+            # Past its auto-stop time; the scheduler's sweep closes it
+            return JsonResponse({'error': 'Attendance session has ended'}, status=400)
+        return JsonResponse({'error': 'Attendance session is not active'}, status=400)
+    
+    # Check registration and payment status
+    eligibility = AttendanceStateService.check_eligibility(event_id, request.user.id)
+    if eligibility == 'not_registered':
         return JsonResponse({'error': 'You are not registered for this event'}, status=403)
-    
-    # Check payment status
-    if registration.payment_status not in ['not_required', 'paid']:
+    if eligibility == 'payment_required':
         return JsonResponse({'error': 'Payment required before marking attendance'}, status=403)
     
-    # Check if already marked
-    if Attendance.objects.filter(event=event, user=request.user).exists():
+    # Mark attendance; unique (event, user) rejects a second check-in
+    try:
+        with transaction.atomic():
+            Attendance.objects.create(
+                event_id=event_id,
+                user=request.user,
+                status='present',
+                marked_by=request.user
+            )
+    except IntegrityError:
         return JsonResponse({'error': 'You have already marked your attendance'}, status=400)
+    AttendanceStateService.record_check_in(event_id)
     
-    # Mark attendance
-    attendance = Attendance.objects.create(
-        event=event,
-        user=request.user,
-        status='present',
-        marked_by=request.user
+    return JsonResponse({
+        'success': True,
+        'certificate_generated': False,
+        'message': 'Attendance marked successfully! Your certificate will be issued when the session closes.'
+    })
+
+
+# Upper bound on tokens accepted per batch upload
+BATCH_CHECK_IN_LIMIT = 500
+
+
+@login_required
+def registration_qr(request, registration_id):
+    """
+    QR code (SVG) carrying the signed check-in token of a registration.
+    Visible to the registrant, their teacher and admins.
+    """
+    from django.http import HttpResponse
+    
+    registration = get_object_or_404(
+        EventRegistration.objects.select_related('user'),
+        id=registration_id
     )
+    if not (
+        registration.user_id == request.user.id
+        or request.user.is_admin()
+        or (request.user.is_teacher() and registration.user.managed_by_id == request.user.id)
+    ):
+        raise PermissionDenied
     
-    # Auto-generate certificate for attendance
-    certificate_generated = False
-    try:
-        # Check if certificate doesn't already exist
-        from events.models import EventCertificate
-        if not EventCertificate.objects.filter(user=request.user, event=event).exists():
-            certificate = CertificateService.generate_certificate(
-                user=request.user,
-                event=event,
-                attendance=attendance
-            )
-            certificate_generated = True
-            
-            # Send notification about certificate
-            send_realtime_notification(
-                user_id=request.user.id,
-                message=f"Your certificate for {event.title} has been generated! View it in My Certificates.",
-                type='info'
-            )
-    except Exception as e:
-        print(f"Certificate generation error: {e}")
-        # Don't fail attendance marking if certificate generation fails
+    svg = CheckInTokenService.render_qr_svg(registration.check_in_token)
+    response = HttpResponse(svg, content_type='image/svg+xml')
+    response['Cache-Control'] = 'private, max-age=86400'
+    return response
+
+
+@login_required
+def check_in_scanner(request, event_id):
+    """
+    Gate scanner page for admins and teachers. Scans are queued in the
+    browser and uploaded in batches, so check-in keeps working on flaky
+    venue connectivity.
+    """
+    if not (request.user.is_admin() or request.user.is_teacher()):
+        raise PermissionDenied
+    event = get_object_or_404(Event, id=event_id)
+    return render(request, 'events/check_in_scanner.html', {
+        'event': event,
+        'batch_size': BATCH_CHECK_IN_LIMIT,
+    })
+
+
+@login_required
+def batch_check_in(request, event_id):
+    """
+    Record many QR check-ins in one request (Admins, and teachers for their students).
+    Expects JSON {"tokens": [...]} and returns a status per token. Tokens are
+    verified by signature; registrations are loaded with one query and
+    attendance is inserted in bulk, so re-uploading a batch is harmless.
+    """
+    if request.method != 'POST':
+        return JsonResponse({'error': 'POST required'}, status=405)
+    if not (request.user.is_admin() or request.user.is_teacher()):
+        return JsonResponse({'error': 'Only admins and teachers can check in attendees'}, status=403)
     
-    messages.success(request, "Attendance marked successfully!" + 
-                     (" Certificate generated!" if certificate_generated else ""))
+    event = get_object_or_404(Event, id=event_id)
+    
+    try:
+        tokens = json.loads(request.body or b'{}').get('tokens', [])
+    except (ValueError, AttributeError):
+        return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    if not isinstance(tokens, list):
+        return JsonResponse({'error': 'tokens must be a list'}, status=400)
+    if len(tokens) > BATCH_CHECK_IN_LIMIT:
+        return JsonResponse({'error': f'At most {BATCH_CHECK_IN_LIMIT} tokens per request'}, status=400)
+    
+    # Verify signatures first; only signed registration ids reach the database
+    statuses = {}
+    registration_tokens = {}
+    for token in tokens:
+        parsed = CheckInTokenService.verify_token(token)
+        if parsed is None:
+            statuses[token] = 'invalid'
+        elif parsed[1] != event.id:
+            statuses[token] = 'wrong_event'
+        else:
+            registration_tokens.setdefault(parsed[0], []).append(token)
+    
+    registrations = EventRegistration.objects.filter(
+        id__in=registration_tokens.keys(), event=event
+    ).values_list('id', 'user_id', 'payment_status', 'user__managed_by_id')
+    
+    token_users = {}
+    for registration_id, user_id, payment_status, managed_by_id in registrations:
+        if request.user.is_teacher() and managed_by_id != request.user.id:
+            status = 'not_your_student'
+        elif payment_status not in AttendanceStateService.ELIGIBLE_PAYMENT_STATUSES:
+            status = 'payment_required'
+        else:
+            status = None
+        for token in registration_tokens.pop(registration_id):
+            if status:
+                statuses[token] = status
+            else:
+                token_users[token] = user_id
+    for unknown in registration_tokens.values():
+        for token in unknown:
+            statuses[token] = 'not_found'
+    
+    recorded = AttendanceStateService.record_check_ins(event.id, token_users.values(), request.user)
+    for token, user_id in token_users.items():
+        statuses[token] = 'recorded' if user_id in recorded else 'already_recorded'
+    
+    # Without an open session there is no session close to issue certificates at;
+    # queue them for the background issuer rather than rendering in the scanner's request
+    if recorded and not AttendanceStateService.session_is_open(
+        AttendanceStateService.get_session_state(event.id)
+    ):
+        AttendanceStateService.queue_certificates(event.id)
+        AttendanceStateService.issue_certificates_in_background()
     
     return JsonResponse({
         'success': True,
-        'certificate_generated': certificate_generated,
-        'message': 'Attendance marked successfully!'
+        'recorded': len(recorded),
+        'results': [{'token': token, 'status': statuses[token]} for token in tokens],
     })
 
 
@@ -1630,6 +1408,10 @@ def upload_certificate_template(request, event_id):
         template.cert_number_font_size = int(request.POST.get('cert_number_font_size', 20))
         template.cert_number_color = request.POST.get('cert_number_color', '#666666')
         
+        output_format = request.POST.get('output_format', 'png')
+        if output_format in dict(CertificateTemplate.OUTPUT_FORMAT_CHOICES):
+            template.output_format = output_format
+        
         template.save()
         
         messages.success(request, "Certificate template saved successfully!")
@@ -1714,15 +1496,109 @@ def my_certificates(request):
     return render(request, 'events/my_certificates.html', context)
 
 
+@login_required
+def download_certificate(request, certificate_id):
+    """
+    Serve a single certificate, rendering it on first access.
+    Served in the template's output format; ?format=png forces an image
+    (used for on-page thumbnails). Owners, their teacher and admins may view it.
+    """
+    from django.http import FileResponse
+    
+    certificate = get_object_or_404(
+        EventCertificate.objects.select_related('event', 'user'),
+        id=certificate_id
+    )
+    
+    if not (
+        certificate.user_id == request.user.id
+        or request.user.is_admin()
+        or (request.user.is_teacher() and certificate.user.managed_by_id == request.user.id)
+    ):
+        raise PermissionDenied
+    
+    requested_format = request.GET.get('format')
+    if requested_format not in ('png', 'pdf'):
+        requested_format = None
+    # Content type and file name follow what is actually rendered, not what was asked for
+    layout = CertificateService.get_template_layout(certificate.event)
+    output_format = CertificateService.certificate_format(certificate, layout, requested_format)
+    
+    try:
+        certificate_handle = CertificateService.open_certificate(certificate, layout, output_format)
+    except Exception as e:
+        logger.error(f"Error rendering certificate {certificate.id}: {e}")
+        messages.error(request, "Could not load the certificate. Please try again.")
+        return redirect('events:my_certificates')
+    
+    return FileResponse(
+        certificate_handle,
+        content_type='application/pdf' if output_format == 'pdf' else 'image/png',
+        as_attachment=request.GET.get('download') == '1',
+        filename=f'certificate_{certificate.certificate_number}.{output_format}'
+    )
+
+
+@admin_required
+def event_certificates_pdf(request, event_id):
+    """
+    Download every certificate of an event as one multi-page PDF (Admin only).
+    Pages are drawn in a single pass into a temporary file, which is then streamed.
+    """
+    import tempfile
+    from django.http import FileResponse
+    
+    event = get_object_or_404(Event, id=event_id)
+    if not CertificateTemplate.objects.filter(event=event).exists():
+        messages.error(request, "Upload a certificate template before exporting certificates as PDF.")
+        return redirect('events:event_detail', pk=event.pk)
+    
+    pdf_file = tempfile.TemporaryFile()
+    try:
+        pages = CertificateService.write_event_pdf(event, pdf_file)
+    except Exception as e:
+        pdf_file.close()
+        logger.error(f"Error exporting certificates for event {event.id}: {e}")
+        messages.error(request, "Could not export the certificates. Please try again.")
+        return redirect('events:event_detail', pk=event.pk)
+    
+    if not pages:
+        pdf_file.close()
+        messages.info(request, "No certificates have been issued for this event yet.")
+        return redirect('events:event_detail', pk=event.pk)
+    
+    pdf_file.seek(0)
+    title = "".join(c for c in event.title if c.isalnum() or c in (' ', '_', '-')).strip().replace(' ', '_')
+    return FileResponse(
+        pdf_file,
+        content_type='application/pdf',
+        as_attachment=True,
+        filename=f'{title}_certificates.pdf'
+    )
+
+
+def _certificate_zip_entries(certificates, filename_for):
+    """
+    Yield (filename, opener) pairs for stream_zip.
+    Template layouts are looked up once per event rather than per certificate.
+    """
+    layouts = {}
+    for cert in certificates:
+        if cert.event_id not in layouts:
+            layouts[cert.event_id] = CertificateService.get_template_layout(cert.event)
+        layout = layouts[cert.event_id]
+        extension = CertificateService.certificate_format(cert, layout)
+        yield filename_for(cert, extension), lambda cert=cert, layout=layout: CertificateService.open_certificate(cert, layout)
+
+
 @login_required
 def bulk_download_certificates(request):
     """
     Download multiple certificates as a ZIP file.
     For teachers, can download their students' certificates.
+    The archive is streamed so memory use does not grow with the selection.
     """
-    import zipfile
-    import io
-    from django.http import HttpResponse
+    from boyscout_system.utils import stream_zip, streaming_response
     
     certificate_ids = request.GET.getlist('certificate_ids[]')
     
@@ -1731,14 +1607,13 @@ def bulk_download_certificates(request):
         return redirect('events:my_certificates')
     
     # Get certificates - check permissions
-    if request.user.is_teacher:
+    is_teacher = request.user.is_teacher()
+    if is_teacher:
         # Teachers can download their own or their students' certificates
-        from accounts.models import User
-        students = User.objects.filter(managed_by=request.user)
         certificates = EventCertificate.objects.filter(
             id__in=certificate_ids
         ).filter(
-            Q(user=request.user) | Q(user__in=students)
+            Q(user=request.user) | Q(user__managed_by=request.user)
         ).select_related('event', 'user')
     else:
         # Regular users can only download their own certificates
@@ -1751,41 +1626,26 @@ def bulk_download_certificates(request):
         messages.error(request, "No valid certificates found.")
         return redirect('events:my_certificates')
     
-    # Create ZIP file in memory
-    zip_buffer = io.BytesIO()
-    
-    with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-        for cert in certificates:
-            if cert.certificate_file:
-                try:
-                    # Read certificate file
-                    cert.certificate_file.open('rb')
-                    file_data = cert.certificate_file.read()
-                    
-                    # Create filename: Event_StudentName_CertNumber.png
-                    if request.user.is_teacher and cert.user != request.user:
-                        filename = f"{cert.event.title}_{cert.user.get_full_name()}_{cert.certificate_number}.png"
-                    else:
-                        filename = f"{cert.event.title}_{cert.certificate_number}.png"
-                    
-                    # Clean filename (remove invalid characters)
-                    filename = "".join(c for c in filename if c.isalnum() or c in (' ', '_', '-', '.')).rstrip()
-                    
-                    # Add to ZIP
-                    zip_file.writestr(filename, file_data)
-                    cert.certificate_file.close()
-                except Exception as e:
-                    logger.error(f"Error adding certificate {cert.id} to ZIP: {e}")
-                    continue
+    def filename_for(cert, extension):
+        # Create filename: Event_StudentName_CertNumber.png
+        if is_teacher and cert.user_id != request.user.id:
+            filename = f"{cert.event.title}_{cert.user.get_full_name()}_{cert.certificate_number}.{extension}"
+        else:
+            filename = f"{cert.event.title}_{cert.certificate_number}.{extension}"
+        
+        # Clean filename (remove invalid characters)
+        return "".join(c for c in filename if c.isalnum() or c in (' ', '_', '-', '.')).rstrip()
     
-    # Prepare response
-    zip_buffer.seek(0)
-    response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
+    response = streaming_response(
+        request,
+        stream_zip(_certificate_zip_entries(certificates.iterator(), filename_for)),
+        content_type='application/zip'
+    )
     
-    if request.user.is_teacher:
+    if is_teacher:
         filename = 'certificates_bulk_download.zip'
     else:
-        filename = f'my_certificates.zip'
+        filename = 'my_certificates.zip'
     
     response['Content-Disposition'] = f'attachment; filename="{filename}"'
     
@@ -1797,10 +1657,9 @@ def teacher_bulk_download_certificates(request):
     """
     Teacher-specific view to download multiple student certificates as a ZIP file.
     Uses POST method for better security and handling of multiple certificate IDs.
+    The archive is streamed so memory use does not grow with the selection.
     """
-    import zipfile
-    import io
-    from django.http import HttpResponse
+    from boyscout_system.utils import stream_zip, streaming_response
     
     # Verify user is a teacher
     if not request.user.is_teacher():
@@ -1827,50 +1686,26 @@ def teacher_bulk_download_certificates(request):
         messages.error(request, "No valid certificates found for your students.")
         return redirect(request.META.get('HTTP_REFERER', 'events:event_list'))
     
-    # Create ZIP file in memory
-    zip_buffer = io.BytesIO()
-    
-    try:
-        with zipfile.ZipFile(zip_buffer, 'w', zipfile.ZIP_DEFLATED) as zip_file:
-            for cert in certificates:
-                if cert.certificate_file:
-                    try:
-                        # Read certificate file
-                        cert.certificate_file.open('rb')
-                        file_data = cert.certificate_file.read()
-                        
-                        # Create filename: Event_StudentName_CertNumber.png
-                        event_title = "".join(c for c in cert.event.title if c.isalnum() or c in (' ', '_', '-')).strip()
-                        student_name = "".join(c for c in cert.user.get_full_name() if c.isalnum() or c in (' ', '_', '-')).strip()
-                        filename = f"{event_title}_{student_name}_{cert.certificate_number}.png"
-                        
-                        # Clean filename (remove any remaining invalid characters)
-                        filename = filename.replace(' ', '_')
-                        
-                        # Add to ZIP
-                        zip_file.writestr(filename, file_data)
-                        cert.certificate_file.close()
-                        
-                        logger.info(f"Added certificate {cert.id} to ZIP: {filename}")
-                    except Exception as e:
-                        logger.error(f"Error adding certificate {cert.id} to ZIP: {e}")
-                        continue
-        
-        # Prepare response
-        zip_buffer.seek(0)
-        response = HttpResponse(zip_buffer.getvalue(), content_type='application/zip')
-        
-        # Generate filename with timestamp
-        from django.utils import timezone
-        timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
-        filename = f'student_certificates_{timestamp}.zip'
-        
-        response['Content-Disposition'] = f'attachment; filename="{filename}"'
-        
-        logger.info(f"Teacher {request.user.username} downloaded {certificates.count()} certificates")
-        return response
+    def filename_for(cert, extension):
+        # Create filename: Event_StudentName_CertNumber.png
+        event_title = "".join(c for c in cert.event.title if c.isalnum() or c in (' ', '_', '-')).strip()
+        student_name = "".join(c for c in cert.user.get_full_name() if c.isalnum() or c in (' ', '_', '-')).strip()
+        filename = f"{event_title}_{student_name}_{cert.certificate_number}.{extension}"
         
-    except Exception as e:
-        logger.error(f"Error creating ZIP file: {e}")
-        messages.error(request, "An error occurred while creating the download. Please try again.")
-        return redirect(request.META.get('HTTP_REFERER', 'events:event_list'))
+        # Clean filename (remove any remaining invalid characters)
+        return filename.replace(' ', '_')
+    
+    response = streaming_response(
+        request,
+        stream_zip(_certificate_zip_entries(certificates.iterator(), filename_for)),
+        content_type='application/zip'
+    )
+    
+    # Generate filename with timestamp
+    timestamp = timezone.now().strftime('%Y%m%d_%H%M%S')
+    filename = f'student_certificates_{timestamp}.zip'
+    
+    response['Content-Disposition'] = f'attachment; filename="{filename}"'
+    
+    logger.info(f"Teacher {request.user.username} started download of {len(certificate_ids)} selected certificates")
+    return response
@@ -22,5 +22,5 @@ class NotificationConsumer(AsyncWebsocketConsumer):
     async def send_notification(self, event):
         await self.send(text_data=json.dumps({
             'message': event['message'],
-            'type': event.get('type', 'info'),
+            'type': event.get('notification_type', 'info'),
         })) 
\ No newline at end of file
@@ -101,6 +101,32 @@ def send_realtime_notification(user_id, message, type='info'):
         {
             'type': 'send_notification',
             'message': message,
-            'type': type,
+            'notification_type': type,
         }
-    ) 
\ No newline at end of file
+    ) 
+
+
+def send_realtime_notifications(notifications):
+    """
+    Batched send_realtime_notification: one INSERT for all (user_id, message, type)
+    tuples, then one channel message per notification.
+    """
+    notifications = list(notifications)
+    if not notifications:
+        return 0
+    Notification.objects.bulk_create([
+        Notification(user_id=user_id, message=message, type=type)
+        for user_id, message, type in notifications
+    ])
+    channel_layer = get_channel_layer()
+    for user_id, message, type in notifications:
+        async_to_sync(channel_layer.group_send)(
+            f'user_{user_id}',
+            {
+                # 'type' names the consumer handler; the notification's own type travels separately
+                'type': 'send_notification',
+                'message': message,
+                'notification_type': type,
+            }
+        )
+    return len(notifications)
@@ -1,5 +1,19 @@
 from django.contrib import admin
-from .models import Payment
+from .models import Payment, ScheduledJob, ScheduledJobRun
 
 # Register your models here.
 admin.site.register(Payment)
+
+
+@admin.register(ScheduledJob)
+class ScheduledJobAdmin(admin.ModelAdmin):
+    list_display = ['name', 'schedule', 'enabled', 'next_run_at', 'last_started_at', 'last_duration', 'last_status', 'locked_by']
+    list_filter = ['enabled', 'last_status']
+    readonly_fields = ['next_run_at', 'locked_by', 'locked_until', 'last_started_at', 'last_duration', 'last_status']
+
+
+@admin.register(ScheduledJobRun)
+class ScheduledJobRunAdmin(admin.ModelAdmin):
+    list_display = ['job', 'status', 'started_at', 'duration', 'node']
+    list_filter = ['status', 'job']
+    readonly_fields = ['job', 'node', 'status', 'started_at', 'finished_at', 'duration', 'result', 'error']
@@ -0,0 +1,59 @@
+"""
+Built-in periodic jobs hosted by the in-process scheduler.
+Schedules are cron expressions in TIME_ZONE and can be overridden per job
+with SCHEDULER_SCHEDULES.
+"""
+from payments import tasks
+from payments.scheduler import prune_history, register
+
+
+@register('payment_reminders', '0 9 * * *')
+def payment_reminders():
+    return tasks.send_payment_reminders()
+
+
+@register('payment_expiry_notifications', '0 8 * * *')
+def payment_expiry_notifications():
+    return tasks.send_payment_expiry_notifications()
+
+
+@register('monthly_payment_reminders', '0 9 1 * *')
+def monthly_payment_reminders():
+    return tasks.send_monthly_payment_reminders()
+
+
+@register('expire_pending_payments', '*/5 * * * *')
+def expire_pending_payments():
+    from events.services import PaymentExpiryService
+    return PaymentExpiryService.expire_overdue()
+
+
+@register('process_paymongo_webhooks', '* * * * *')
+def process_paymongo_webhooks():
+    from events.services import PayMongoWebhookService
+    return PayMongoWebhookService.drain_pending()
+
+
+@register('stop_expired_attendance_sessions', '* * * * *')
+def stop_expired_attendance_sessions():
+    from events.services import AttendanceStateService
+    return AttendanceStateService.stop_expired_sessions()
+
+
+@register('issue_attendance_certificates', '* * * * *')
+def issue_attendance_certificates():
+    from events.services import AttendanceStateService
+    return AttendanceStateService.issue_pending_certificates()
+
+
+@register('membership_renewals', '0 7 * * *')
+def membership_renewals():
+    from accounts.services import MembershipRenewalService
+    stats = MembershipRenewalService.expire_memberships()
+    stats['reminders'] = MembershipRenewalService.send_expiry_reminders()
+    return stats
+
+
+@register('prune_scheduler_history', '30 3 * * *')
+def prune_scheduler_history():
+    return prune_history()
@@ -0,0 +1,96 @@
+"""
+Management command to run the in-process periodic job scheduler
+Usage: python manage.py run_scheduler [--once] [--run JOB] [--list]
+
+Runs as a long-lived process. Several nodes may run it at once; each due job
+is claimed by exactly one of them through its ScheduledJob lock row.
+"""
+import time
+from django.core.management.base import BaseCommand, CommandError
+from django.db import close_old_connections
+from payments.scheduler import Scheduler
+
+
+class Command(BaseCommand):
+    help = 'Run periodic jobs (reminders, payment expiry, webhooks, attendance auto-stop)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Run the jobs that are due now and exit',
+        )
+        parser.add_argument(
+            '--run',
+            action='append',
+            default=[],
+            metavar='JOB',
+            help='Run this job immediately regardless of its schedule (repeatable; implies --once)',
+        )
+        parser.add_argument(
+            '--list',
+            action='store_true',
+            help='List registered jobs with their schedules and last runs, then exit',
+        )
+        parser.add_argument(
+            '--max-sleep',
+            type=int,
+            default=60,
+            help='Longest pause between checks in seconds (default: 60)',
+        )
+
+    def handle(self, *args, **options):
+        scheduler = Scheduler()
+        unknown = set(options['run']) - set(scheduler.jobs)
+        if unknown:
+            raise CommandError(f"Unknown job(s): {', '.join(sorted(unknown))}")
+        scheduler.sync()
+
+        if options['list']:
+            self._list(scheduler)
+            return
+
+        self._warn_if_process_local()
+        once = options['once'] or bool(options['run'])
+        if not once:
+            self.stdout.write(f"⏱️  Scheduler {scheduler.node} running {len(scheduler.jobs)} job(s)")
+        while True:
+            for run in scheduler.run_pending(force=options['run']):
+                self._report(run)
+            if once:
+                return
+            close_old_connections()
+            time.sleep(max(1, scheduler.seconds_until_due(ceiling=options['max_sleep'])))
+
+    def _warn_if_process_local(self):
+        from django.conf import settings
+
+        local = []
+        if settings.CACHES['default']['BACKEND'].endswith('LocMemCache'):
+            local.append('cache')
+        if settings.CHANNEL_LAYERS['default']['BACKEND'].endswith('InMemoryChannelLayer'):
+            local.append('channel layer')
+        if local:
+            self.stdout.write(self.style.WARNING(
+                f"⚠️  The {' and '.join(local)} are local to this process: cache updates and websocket pushes "
+                "made by jobs will not reach the web workers. Set REDIS_URL to share them."
+            ))
+
+    def _report(self, run):
+        message = f"{run.job.name} finished in {run.duration:.2f}s"
+        if run.status == 'success':
+            suffix = f": {run.result}" if run.result else ''
+            self.stdout.write(self.style.SUCCESS(f"✅ {message}{suffix}"))
+        else:
+            self.stdout.write(self.style.ERROR(f"❌ {message} with an error: {run.error.strip().splitlines()[-1]}"))
+
+    def _list(self, scheduler):
+        from payments.models import ScheduledJob
+
+        for row in ScheduledJob.objects.filter(name__in=scheduler.jobs):
+            last = (
+                f"last {row.last_status} at {row.last_started_at:%Y-%m-%d %H:%M} ({row.last_duration:.2f}s)"
+                if row.last_started_at and row.last_duration is not None else 'never run'
+            )
+            state = '' if row.enabled else ' [disabled]'
+            self.stdout.write(f"📋 {row.name}{state}: '{row.schedule}', next {row.next_run_at:%Y-%m-%d %H:%M}, {last}")
@@ -0,0 +1,41 @@
+"""
+Management command to send payment reminder emails
+Usage: python manage.py send_payment_reminders [--job pending|expiring|monthly|all]
+
+Each job selects its recipients with one query and sends over one mail connection.
+"""
+import time
+from django.core.management.base import BaseCommand
+from payments import tasks
+
+
+JOBS = {
+    'pending': ('pending payment reminders', tasks.send_payment_reminders),
+    'expiring': ('payment expiry notifications', tasks.send_payment_expiry_notifications),
+    'monthly': ('monthly payment reminders', tasks.send_monthly_payment_reminders),
+}
+
+
+class Command(BaseCommand):
+    help = 'Send pending, expiring and monthly payment reminder emails'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--job',
+            choices=[*JOBS, 'all'],
+            default='all',
+            help='Which reminders to send (default: all)',
+        )
+
+    def handle(self, *args, **options):
+        jobs = JOBS if options['job'] == 'all' else {options['job']: JOBS[options['job']]}
+        total = 0
+        started = time.perf_counter()
+        for label, job in jobs.values():
+            job_started = time.perf_counter()
+            sent = job()
+            total += sent
+            self.stdout.write(f"📧 Sent {sent} {label} in {time.perf_counter() - job_started:.2f}s")
+        self.stdout.write(self.style.SUCCESS(
+            f"✅ Sent {total} reminder(s) in {time.perf_counter() - started:.2f}s"
+        ))
@@ -99,3 +99,53 @@ class Payment(models.Model):
         if not self.expiry_date:
             self.expiry_date = timezone.now() + timedelta(days=7)
         super().save(*args, **kwargs)
+
+
+class ScheduledJob(models.Model):
+    """
+    One row per periodic job run by the in-process scheduler.
+    The row doubles as the job's cluster-wide lock: a node claims a due run
+    with a single conditional UPDATE, so each schedule slot runs on one node.
+    """
+    name = models.CharField(max_length=100, unique=True)
+    schedule = models.CharField(max_length=100, help_text="Cron expression: minute hour day month weekday")
+    enabled = models.BooleanField(default=True)
+    next_run_at = models.DateTimeField(null=True, blank=True)
+    locked_by = models.CharField(max_length=255, blank=True)
+    locked_until = models.DateTimeField(null=True, blank=True)
+    last_started_at = models.DateTimeField(null=True, blank=True)
+    last_duration = models.FloatField(null=True, blank=True, help_text="Seconds")
+    last_status = models.CharField(max_length=20, blank=True)
+
+    class Meta:
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} ({self.schedule})"
+
+
+class ScheduledJobRun(models.Model):
+    """Run history for a scheduled job, with its duration and outcome"""
+    STATUS_CHOICES = [
+        ('running', 'Running'),
+        ('success', 'Success'),
+        ('failed', 'Failed'),
+    ]
+
+    job = models.ForeignKey(ScheduledJob, on_delete=models.CASCADE, related_name='runs')
+    node = models.CharField(max_length=255, blank=True)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='running')
+    started_at = models.DateTimeField()
+    finished_at = models.DateTimeField(null=True, blank=True)
+    duration = models.FloatField(null=True, blank=True, help_text="Seconds")
+    result = models.TextField(blank=True)
+    error = models.TextField(blank=True)
+
+    class Meta:
+        ordering = ['-started_at']
+        indexes = [
+            models.Index(fields=["job", "started_at"]),
+        ]
+
+    def __str__(self):
+        return f"{self.job.name} @ {self.started_at:%Y-%m-%d %H:%M} - {self.get_status_display()}"
@@ -0,0 +1,269 @@
+"""
+In-process periodic job scheduler.
+Jobs are plain callables registered with a cron expression and run by the
+run_scheduler management command. Any number of nodes may run that command:
+each job's ScheduledJob row is its lock, and a due run is claimed with one
+conditional UPDATE that also advances next_run_at, so every schedule slot
+runs on exactly one node. Slots missed while no scheduler was running
+collapse into a single catch-up run. Every run is recorded in
+ScheduledJobRun with its duration and result.
+"""
+import json
+import logging
+import os
+import socket
+import time
+import traceback
+from datetime import datetime, timedelta
+from django.conf import settings
+from django.db.models import Q
+from django.utils import timezone
+
+logger = logging.getLogger(__name__)
+
+
+class CronSchedule:
+    """
+    Five-field cron expression (minute hour day month weekday), evaluated in
+    TIME_ZONE. Supports *, lists, ranges and steps; weekday 0 and 7 are Sunday.
+    """
+
+    FIELDS = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 7))
+
+    def __init__(self, expression):
+        parts = expression.split()
+        if len(parts) != 5:
+            raise ValueError(f"Cron expression needs 5 fields, got {expression!r}")
+        self.expression = expression
+        self.minutes, self.hours, self.days, self.months, weekdays = (
+            self._parse(part, low, high) for part, (low, high) in zip(parts, self.FIELDS)
+        )
+        self.weekdays = frozenset(day % 7 for day in weekdays)
+        self.any_day = parts[2] == '*'
+        self.any_weekday = parts[4] == '*'
+
+    @staticmethod
+    def _parse(field, low, high):
+        values = set()
+        for part in field.split(','):
+            span, _, step = part.partition('/')
+            step = int(step) if step else 1
+            if span == '*':
+                start, end = low, high
+            elif '-' in span:
+                start, end = (int(value) for value in span.split('-', 1))
+            else:
+                start = int(span)
+                end = high if step > 1 else start
+            if step < 1 or start < low or end > high or start > end:
+                raise ValueError(f"Invalid cron field {field!r}")
+            values.update(range(start, end + 1, step))
+        return frozenset(values)
+
+    def _day_matches(self, moment):
+        day = moment.day in self.days
+        weekday = (moment.weekday() + 1) % 7 in self.weekdays
+        # Cron semantics: when both fields are restricted, either may match
+        if self.any_day or self.any_weekday:
+            return day and weekday
+        return day or weekday
+
+    def next_after(self, moment):
+        """First matching minute strictly after moment (aware datetime)"""
+        local = timezone.localtime(moment).replace(tzinfo=None, second=0, microsecond=0)
+        candidate = local + timedelta(minutes=1)
+        limit = local + timedelta(days=366 * 5)
+        while candidate <= limit:
+            if candidate.month not in self.months:
+                month = candidate.month % 12 + 1
+                candidate = datetime(candidate.year + (month == 1), month, 1)
+            elif not self._day_matches(candidate):
+                candidate = datetime(candidate.year, candidate.month, candidate.day) + timedelta(days=1)
+            elif candidate.hour not in self.hours:
+                candidate = candidate.replace(minute=0) + timedelta(hours=1)
+            elif candidate.minute not in self.minutes:
+                candidate += timedelta(minutes=1)
+            else:
+                return timezone.make_aware(candidate)
+        raise ValueError(f"Cron expression {self.expression!r} never matches")
+
+    def __str__(self):
+        return self.expression
+
+
+class Job:
+    """A registered periodic job"""
+
+    def __init__(self, name, func, schedule, lock_ttl=None):
+        self.name = name
+        self.func = func
+        self.schedule = CronSchedule(schedule)
+        self.lock_ttl = lock_ttl
+
+
+_registry = {}
+
+
+def register(name, schedule, lock_ttl=None):
+    """
+    Decorator registering a callable as a periodic job.
+    SCHEDULER_SCHEDULES may override the schedule, or disable it with None.
+    """
+    def decorator(func):
+        _registry[name] = (func, schedule, lock_ttl)
+        return func
+    return decorator
+
+
+def get_jobs():
+    """Registered jobs with settings overrides applied, keyed by name"""
+    from payments import jobs  # noqa: F401  registers the built-in jobs
+
+    overrides = getattr(settings, 'SCHEDULER_SCHEDULES', {})
+    registered = {}
+    for name, (func, schedule, lock_ttl) in _registry.items():
+        schedule = overrides.get(name, schedule)
+        if schedule:
+            registered[name] = Job(name, func, schedule, lock_ttl)
+    return registered
+
+
+def _describe(result):
+    if result is None:
+        return ''
+    try:
+        return json.dumps(result, default=str)
+    except (TypeError, ValueError):
+        return repr(result)
+
+
+class Scheduler:
+    """Claim and run due jobs, recording each run"""
+
+    def __init__(self, jobs=None, node=None):
+        self.jobs = jobs if jobs is not None else get_jobs()
+        self.node = node or f"{socket.gethostname()}:{os.getpid()}"
+
+    def sync(self, now=None):
+        """
+        Create a ScheduledJob row for every job and reschedule rows whose
+        cron expression changed.
+        """
+        from payments.models import ScheduledJob
+
+        now = now or timezone.now()
+        existing = {
+            job.name: job for job in ScheduledJob.objects.filter(name__in=self.jobs)
+        }
+        for name, job in self.jobs.items():
+            row = existing.get(name)
+            if row is None:
+                ScheduledJob.objects.get_or_create(
+                    name=name,
+                    defaults={
+                        'schedule': job.schedule.expression,
+                        'next_run_at': job.schedule.next_after(now),
+                    },
+                )
+            elif row.schedule != job.schedule.expression or row.next_run_at is None:
+                ScheduledJob.objects.filter(pk=row.pk).update(
+                    schedule=job.schedule.expression,
+                    next_run_at=job.schedule.next_after(now),
+                )
+
+    def claim(self, job, now, force=False):
+        """
+        Take the job's lock for its due run.
+
+        Returns:
+            True if this node won the run
+        """
+        from payments.models import ScheduledJob
+
+        ttl = job.lock_ttl or settings.SCHEDULER_LOCK_TTL
+        claimable = ScheduledJob.objects.filter(name=job.name, enabled=True).filter(
+            Q(locked_until__isnull=True) | Q(locked_until__lte=now)
+        )
+        if not force:
+            claimable = claimable.filter(next_run_at__lte=now)
+        return claimable.update(
+            locked_by=self.node,
+            locked_until=now + timedelta(seconds=ttl),
+            next_run_at=job.schedule.next_after(now),
+            last_started_at=now,
+        ) == 1
+
+    def run(self, job, now=None):
+        """
+        Run a claimed job and release its lock.
+
+        Returns:
+            The ScheduledJobRun row
+        """
+        from payments.models import ScheduledJob, ScheduledJobRun
+
+        now = now or timezone.now()
+        run = ScheduledJobRun.objects.create(
+            job=ScheduledJob.objects.get(name=job.name), node=self.node, started_at=now
+        )
+        started = time.perf_counter()
+        try:
+            run.result = _describe(job.func())
+            run.status = 'success'
+        except Exception as exc:
+            logger.error(f"Scheduled job {job.name} failed: {exc}")
+            run.status = 'failed'
+            run.error = traceback.format_exc()
+        run.duration = time.perf_counter() - started
+        run.finished_at = timezone.now()
+        run.save(update_fields=['status', 'result', 'error', 'duration', 'finished_at'])
+
+        ScheduledJob.objects.filter(name=job.name, locked_by=self.node).update(
+            locked_by='',
+            locked_until=None,
+            last_duration=run.duration,
+            last_status=run.status,
+        )
+        return run
+
+    def run_pending(self, now=None, force=()):
+        """
+        Run every due job this node can claim; jobs named in force run now
+        regardless of their schedule (but never alongside another node).
+
+        Returns:
+            List of ScheduledJobRun rows
+        """
+        now = now or timezone.now()
+        runs = []
+        for name, job in self.jobs.items():
+            if self.claim(job, now, force=name in force):
+                runs.append(self.run(job, now))
+        return runs
+
+    def seconds_until_due(self, now=None, ceiling=60):
+        """Seconds until the earliest next run, capped at ceiling"""
+        from payments.models import ScheduledJob
+
+        now = now or timezone.now()
+        next_run = (
+            ScheduledJob.objects.filter(name__in=self.jobs, enabled=True)
+            .exclude(next_run_at__isnull=True)
+            .order_by('next_run_at')
+            .values_list('next_run_at', flat=True)
+            .first()
+        )
+        if next_run is None:
+            return ceiling
+        return max(0, min(ceiling, (next_run - now).total_seconds()))
+
+
+def prune_history(now=None):
+    """Delete run history older than SCHEDULER_HISTORY_DAYS"""
+    from payments.models import ScheduledJobRun
+
+    now = now or timezone.now()
+    deleted, _ = ScheduledJobRun.objects.filter(
+        started_at__lt=now - timedelta(days=settings.SCHEDULER_HISTORY_DAYS)
+    ).delete()
+    return deleted
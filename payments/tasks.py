@@ -1,64 +1,99 @@
-from django.core.mail import send_mail
+"""
+Payment reminder jobs.
+Recipients are selected with one query per job, and the mails go out through
+a single reused mail connection in batches of REMINDER_BATCH_SIZE.
+Each job returns the number of messages sent.
+"""
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
+from django.db.models import Exists, OuterRef
 from django.utils import timezone
 from datetime import timedelta
 from .models import Payment
 from accounts.models import User
 
-def send_payment_reminders():
+
+def send_batched_mail(messages, batch_size=None):
+    """
+    Send (subject, body, recipient) tuples over one mail connection.
+    Delivery failures are swallowed like send_mail(fail_silently=True).
+
+    Returns:
+        Number of messages sent
+    """
+    batch_size = batch_size or settings.REMINDER_BATCH_SIZE
+    connection = get_connection(fail_silently=True)
+    sent = 0
+    batch = []
+    connection.open()
+    try:
+        for subject, body, recipient in messages:
+            batch.append(EmailMessage(subject, body, settings.DEFAULT_FROM_EMAIL, [recipient], connection=connection))
+            if len(batch) >= batch_size:
+                sent += connection.send_messages(batch) or 0
+                batch = []
+        if batch:
+            sent += connection.send_messages(batch) or 0
+    finally:
+        connection.close()
+    return sent
+
+
+def send_payment_reminders(now=None):
     # Get users with pending payments
+    now = now or timezone.now()
     pending_payments = Payment.objects.filter(
         status='pending',
-        date__lte=timezone.now() - timedelta(days=3)  # Remind after 3 days
-    ).select_related('user')
+        date__lte=now - timedelta(days=3)  # Remind after 3 days
+    ).exclude(user__email='').values_list('user__email', 'amount')
 
-    for payment in pending_payments:
-        # Send reminder to user
-        send_mail(
+    return send_batched_mail(
+        (
             'Payment Reminder',
-            f'Your payment of {payment.amount} is still pending. Please submit your payment proof soon.',
-            settings.DEFAULT_FROM_EMAIL,
-            [payment.user.email],
-            fail_silently=True,
+            f'Your payment of {amount} is still pending. Please submit your payment proof soon.',
+            email,
         )
+        for email, amount in pending_payments.iterator()
+    )
 
-def send_payment_expiry_notifications():
+
+def send_payment_expiry_notifications(now=None):
     # Get payments expiring in 24 hours
+    now = now or timezone.now()
     expiring_payments = Payment.objects.filter(
         status='pending',
-        expiry_date__lte=timezone.now() + timedelta(days=1),
-        expiry_date__gt=timezone.now()
-    ).select_related('user')
+        expiry_date__lte=now + timedelta(days=1),
+        expiry_date__gt=now
+    ).exclude(user__email='').values_list('user__email', 'amount')
 
-    for payment in expiring_payments:
-        # Send expiry notification to user
-        send_mail(
+    return send_batched_mail(
+        (
             'Payment Expiring Soon',
-            f'Your payment of {payment.amount} will expire in 24 hours. Please submit your payment proof soon.',
-            settings.DEFAULT_FROM_EMAIL,
-            [payment.user.email],
-            fail_silently=True,
+            f'Your payment of {amount} will expire in 24 hours. Please submit your payment proof soon.',
+            email,
         )
+        for email, amount in expiring_payments.iterator()
+    )
+
 
-def send_monthly_payment_reminders():
-    # Get all active users
-    active_users = User.objects.filter(is_active=True)
-    
-    for user in active_users:
-        # Check if user has any payments in the last month
-        last_month = timezone.now() - timedelta(days=30)
-        recent_payments = Payment.objects.filter(
-            user=user,
-            date__gte=last_month,
-            status='verified'
-        ).exists()
-        
-        if not recent_payments:
-            # Send monthly reminder
-            send_mail(
-                'Monthly Payment Reminder',
-                'This is a reminder to submit your monthly payment.',
-                settings.DEFAULT_FROM_EMAIL,
-                [user.email],
-                fail_silently=True,
-            ) 
\ No newline at end of file
+def send_monthly_payment_reminders(now=None):
+    # Active users without a verified payment in the last month, in one anti-join
+    now = now or timezone.now()
+    last_month = now - timedelta(days=30)
+    recent_payment = Payment.objects.filter(
+        user=OuterRef('pk'),
+        date__gte=last_month,
+        status='verified'
+    )
+    emails = User.objects.filter(is_active=True).exclude(email='').filter(
+        ~Exists(recent_payment)
+    ).values_list('email', flat=True)
+
+    return send_batched_mail(
+        (
+            'Monthly Payment Reminder',
+            'This is a reminder to submit your monthly payment.',
+            email,
+        )
+        for email in emails.iterator()
+    )
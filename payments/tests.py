@@ -1,4 +1,5 @@
 from django.test import TestCase, Client
+from django.core import mail
 from django.urls import reverse
 from django.core.files.uploadedfile import SimpleUploadedFile
 from django.utils import timezone
@@ -359,3 +360,215 @@ class TeacherPaymentManagementTests(TestCase):
         self.assertEqual(summary['pending_count'], 1)
         self.assertEqual(summary['rejected_count'], 1)
         self.assertEqual(summary['total_verified_amount'], Decimal('800.00'))
+
+
+class PaymentReminderTasksTest(TestCase):
+    """Batched reminder jobs select recipients in one query and share one connection"""
+
+    def setUp(self):
+        self.paid = User.objects.create_user(
+            username='paid_scout', email='paid@test.com', password='testpass123', rank='scout',
+            registration_status='active', is_active=True
+        )
+        self.unpaid = User.objects.create_user(
+            username='unpaid_scout', email='unpaid@test.com', password='testpass123', rank='scout',
+            registration_status='active', is_active=True
+        )
+        Payment.objects.create(user=self.paid, amount=Decimal('500.00'), status='verified')
+        self.stale = Payment.objects.create(user=self.unpaid, amount=Decimal('250.00'), status='pending')
+        Payment.objects.filter(pk=self.stale.pk).update(
+            date=timezone.now() - timezone.timedelta(days=5),
+            expiry_date=timezone.now() + timezone.timedelta(hours=12),
+        )
+        mail.outbox = []
+
+    def test_pending_and_expiring_reminders(self):
+        from payments import tasks
+        self.assertEqual(tasks.send_payment_reminders(), 1)
+        self.assertEqual(tasks.send_payment_expiry_notifications(), 1)
+        self.assertEqual([m.to for m in mail.outbox], [['unpaid@test.com'], ['unpaid@test.com']])
+        self.assertIn('250.00', mail.outbox[0].body)
+
+    def test_monthly_reminder_skips_recent_verified_payers(self):
+        from payments import tasks
+        with self.assertNumQueries(1):
+            sent = tasks.send_monthly_payment_reminders()
+        self.assertEqual(sent, 1)
+        self.assertEqual(mail.outbox[0].to, ['unpaid@test.com'])
+
+    def test_batches_share_one_connection(self):
+        from payments import tasks
+        messages = [('Subject', 'Body', f'user{i}@test.com') for i in range(5)]
+        with patch('payments.tasks.get_connection', wraps=tasks.get_connection) as get_connection:
+            sent = tasks.send_batched_mail(messages, batch_size=2)
+        self.assertEqual(sent, 5)
+        self.assertEqual(get_connection.call_count, 1)
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_command_reports_counts(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('send_payment_reminders', '--job', 'pending', stdout=out)
+        self.assertIn('Sent 1 pending payment reminders', out.getvalue())
+
+
+class SchedulerTest(TestCase):
+    """Cron parsing, single-node claims and run history for the job scheduler"""
+
+    def setUp(self):
+        from payments.scheduler import Job
+        self.calls = []
+        self.job = Job('test_job', lambda: self.calls.append(1) or {'sent': len(self.calls)}, '*/15 * * * *')
+        self.now = timezone.now().replace(minute=7, second=0, microsecond=0)
+
+    def test_cron_next_after(self):
+        from datetime import datetime
+        from payments.scheduler import CronSchedule
+        start = timezone.make_aware(datetime(2025, 1, 31, 23, 59))
+        self.assertEqual(CronSchedule('*/15 * * * *').next_after(start), timezone.make_aware(datetime(2025, 2, 1, 0, 0)))
+        self.assertEqual(CronSchedule('0 9 1 * *').next_after(start), timezone.make_aware(datetime(2025, 2, 1, 9, 0)))
+        # 2025-02-01 is a Saturday; weekday 1 is Monday
+        self.assertEqual(CronSchedule('30 8 * * 1-5').next_after(start), timezone.make_aware(datetime(2025, 2, 3, 8, 30)))
+        self.assertEqual(CronSchedule('0 0 * * 7').next_after(start), timezone.make_aware(datetime(2025, 2, 2, 0, 0)))
+        with self.assertRaises(ValueError):
+            CronSchedule('61 * * * *')
+
+    def test_due_job_runs_on_exactly_one_node(self):
+        from payments.models import ScheduledJob, ScheduledJobRun
+        from payments.scheduler import Scheduler
+        first = Scheduler({'test_job': self.job}, node='node-a')
+        second = Scheduler({'test_job': self.job}, node='node-b')
+        first.sync(self.now)
+        due = self.now.replace(minute=15)
+
+        self.assertEqual(len(first.run_pending(due)), 1)
+        self.assertEqual(second.run_pending(due), [])
+        self.assertEqual(self.calls, [1])
+
+        row = ScheduledJob.objects.get(name='test_job')
+        self.assertEqual(row.next_run_at, self.now.replace(minute=30))
+        self.assertEqual(row.last_status, 'success')
+        self.assertEqual(row.locked_by, '')
+        run = ScheduledJobRun.objects.get()
+        self.assertEqual((run.node, run.status, run.result), ('node-a', 'success', '{"sent": 1}'))
+        self.assertIsNotNone(run.duration)
+
+    def test_held_lock_blocks_forced_run_until_expiry(self):
+        from payments.models import ScheduledJob
+        from payments.scheduler import Scheduler
+        scheduler = Scheduler({'test_job': self.job}, node='node-b')
+        scheduler.sync(self.now)
+        ScheduledJob.objects.filter(name='test_job').update(
+            locked_by='node-a', locked_until=self.now + timezone.timedelta(minutes=5)
+        )
+        self.assertEqual(scheduler.run_pending(self.now, force={'test_job'}), [])
+        later = self.now + timezone.timedelta(minutes=6)
+        self.assertEqual(len(scheduler.run_pending(later, force={'test_job'})), 1)
+
+    def test_failed_run_is_recorded(self):
+        from payments.models import ScheduledJob
+        from payments.scheduler import Job, Scheduler
+
+        def broken():
+            raise RuntimeError('boom')
+
+        scheduler = Scheduler({'broken': Job('broken', broken, '* * * * *')}, node='node-a')
+        scheduler.sync(self.now)
+        [run] = scheduler.run_pending(self.now + timezone.timedelta(minutes=1))
+        self.assertEqual(run.status, 'failed')
+        self.assertIn('RuntimeError: boom', run.error)
+        self.assertEqual(ScheduledJob.objects.get(name='broken').last_status, 'failed')
+
+    def test_command_runs_named_job(self):
+        from io import StringIO
+        from django.core.management import call_command
+        from payments.models import ScheduledJob
+        out = StringIO()
+        call_command('run_scheduler', '--run', 'stop_expired_attendance_sessions', stdout=out)
+        self.assertIn('stop_expired_attendance_sessions finished', out.getvalue())
+        self.assertTrue(ScheduledJob.objects.filter(name='payment_reminders').exists())
+
+    def test_command_warns_about_process_local_backends(self):
+        from io import StringIO
+        from django.core.management import call_command
+        out = StringIO()
+        call_command('run_scheduler', '--once', stdout=out)
+        self.assertIn('REDIS_URL', out.getvalue())
+        redis = {'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache', 'LOCATION': 'redis://x'}}
+        layer = {'default': {'BACKEND': 'channels_redis.core.RedisChannelLayer'}}
+        out = StringIO()
+        with self.settings(CACHES=redis, CHANNEL_LAYERS=layer):
+            call_command('run_scheduler', '--once', stdout=out)
+        self.assertNotIn('REDIS_URL', out.getvalue())
+
+
+class SystemConfigFeeChangeTest(TestCase):
+    """Changing the registration fee reprices outstanding registrations set-wise"""
+
+    def setUp(self):
+        User.objects.create_user(
+            username='fee_admin', email='fee_admin@test.com', password='testpass123', rank='admin', is_active=True
+        )
+        self.partial = User.objects.create_user(
+            username='partial_scout', email='partial@test.com', password='testpass123', rank='scout',
+            registration_status='partial_payment', registration_amount_required=Decimal('500.00'),
+            registration_total_paid=Decimal('300.00'),
+        )
+        self.verified = User.objects.create_user(
+            username='verified_scout', email='verified@test.com', password='testpass123', rank='scout',
+            registration_status='payment_verified', is_active=True,
+            registration_amount_required=Decimal('500.00'), registration_total_paid=Decimal('500.00'),
+        )
+        self.client.login(email='fee_admin@test.com', password='testpass123')
+
+    def test_fee_change_reprices_outstanding_scouts(self):
+        response = self.client.post(reverse('payments:system_config_manage'), {'registration_fee': '300.00'})
+        self.assertEqual(response.status_code, 302)
+        self.partial.refresh_from_db()
+        self.assertEqual(self.partial.registration_amount_required, Decimal('300.00'))
+        self.assertEqual(self.partial.registration_status, 'payment_verified')
+        self.assertTrue(self.partial.is_active)
+        self.verified.refresh_from_db()
+        self.assertEqual(self.verified.registration_amount_required, Decimal('500.00'))
+
+    def test_fee_change_reprices_or_voids_open_payments(self):
+        from accounts.models import RegistrationPayment
+        from notifications.models import Notification
+        pending = User.objects.create_user(
+            username='pending_scout', email='pending@test.com', password='testpass123', rank='scout',
+            registration_status='pending_payment', registration_amount_required=Decimal('500.00'),
+        )
+        checkout = RegistrationPayment.objects.create(
+            user=pending, amount=Decimal('500.00'), paymongo_source_id='src_old', status='pending'
+        )
+        placeholder = RegistrationPayment.objects.create(user=self.partial, amount=Decimal('500.00'), status='pending')
+        receipt = RegistrationPayment.objects.create(
+            user=self.partial, amount=Decimal('200.00'), payment_method='manual', status='pending'
+        )
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('payments:system_config_manage'), {'registration_fee': '700.00'})
+
+        checkout.refresh_from_db()
+        placeholder.refresh_from_db()
+        receipt.refresh_from_db()
+        self.assertEqual(checkout.status, 'expired')
+        self.assertEqual((placeholder.status, placeholder.amount), ('pending', Decimal('700.00')))
+        self.assertEqual((receipt.status, receipt.amount), ('pending', Decimal('200.00')))
+        # Only the scout whose payment link was cancelled had anything change
+        self.assertEqual(list(Notification.objects.values_list('user_id', flat=True)), [pending.id])
+
+    def test_fee_change_notifies_settled_scouts_and_voids_their_placeholders(self):
+        from accounts.models import RegistrationPayment
+        from notifications.models import Notification
+        placeholder = RegistrationPayment.objects.create(user=self.partial, amount=Decimal('500.00'), status='pending')
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse('payments:system_config_manage'), {'registration_fee': '300.00'})
+
+        placeholder.refresh_from_db()
+        self.assertEqual(placeholder.status, 'expired')
+        notification = Notification.objects.get()
+        self.assertEqual(notification.user_id, self.partial.id)
+        self.assertIn('Registration Payment Verified', notification.message)
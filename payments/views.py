@@ -353,14 +353,28 @@ def system_config_manage(request):
     from .forms import SystemConfigurationForm
     
     config = SystemConfiguration.get_config()
+    previous_fee = config.registration_fee
     
     if request.method == 'POST':
         form = SystemConfigurationForm(request.POST, request.FILES, instance=config)
         if form.is_valid():
-            config = form.save(commit=False)
-            config.updated_by = request.user
-            config.save()
+            from django.db import transaction
+            with transaction.atomic():
+                config = form.save(commit=False)
+                config.updated_by = request.user
+                config.save()
+                repriced = None
+                if config.registration_fee != previous_fee:
+                    # Reprice scouts who still owe and their open payments; verified members keep their status
+                    from accounts.services import RegistrationFeeService
+                    repriced = RegistrationFeeService.apply_fee_change(config.registration_fee)
             messages.success(request, 'System QR code updated successfully.')
+            if repriced and repriced['scouts']:
+                messages.info(
+                    request,
+                    f"Registration fee applied to {repriced['scouts']} scout(s) with outstanding registration payments "
+                    f"({repriced['voided']} payment link(s) cancelled, {repriced['payments']} pending payment(s) repriced)."
+                )
             return redirect('payments:system_config_manage')
     else:
         form = SystemConfigurationForm(instance=config)
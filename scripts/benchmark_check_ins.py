@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+"""
+Load benchmark for attendance check-ins.
+
+Creates a throwaway event with N registered scouts, starts its attendance
+session and fires every scout's mark_my_attendance request from a pool of
+concurrent clients, then reports throughput and latency percentiles.
+Run from project root against a development database:
+
+    python scripts/benchmark_check_ins.py --scouts 1000 --concurrency 16
+"""
+import argparse
+import os
+import sys
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+import django
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'boyscout_system.settings')
+django.setup()
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection
+from django.test import Client
+from django.urls import reverse
+from django.utils import timezone
+
+from accounts.models import User
+from events.models import Attendance, AttendanceSession, Event, EventRegistration
+
+
+def setup_event(scouts, prefix):
+    admin = User.objects.create(
+        username=f'{prefix}admin', email=f'{prefix}admin@bench.local', rank='admin',
+        password=make_password(None), is_active=True,
+    )
+    event = Event.objects.create(
+        title=f'Check-in benchmark {prefix}', description='Benchmark', date=timezone.localdate(),
+        time=timezone.localtime().time(), location='Benchmark', created_by=admin,
+    )
+    # Skip User.save(): usernames are already unique and passwords unusable
+    User.objects.bulk_create([
+        User(username=f'{prefix}{i}', email=f'{prefix}{i}@bench.local', rank='scout',
+             password=make_password(None), is_active=True)
+        for i in range(scouts)
+    ])
+    users = list(User.objects.filter(username__startswith=prefix, rank='scout'))
+    EventRegistration.objects.bulk_create([
+        EventRegistration(event=event, user=user, payment_status='not_required', amount_required=0)
+        for user in users
+    ])
+    session = AttendanceSession.objects.create(event=event)
+    session.start(admin)
+    return admin, event, users
+
+
+def make_clients(users):
+    clients = []
+    for user in users:
+        client = Client(SERVER_NAME='localhost')
+        client.force_login(user)
+        clients.append(client)
+    return clients
+
+
+def check_in(client, url):
+    started = time.perf_counter()
+    try:
+        response = client.post(url)
+        ok = response.status_code == 200
+    except Exception:
+        ok = False
+    finally:
+        connection.close()
+    return ok, time.perf_counter() - started
+
+
+def percentile(values, pct):
+    index = min(len(values) - 1, int(round(pct / 100 * (len(values) - 1))))
+    return values[index]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--scouts', type=int, default=500, help='Number of scouts checking in')
+    parser.add_argument('--concurrency', type=int, default=16, help='Concurrent clients')
+    parser.add_argument('--keep', action='store_true', help='Keep the benchmark event and users afterwards')
+    args = parser.parse_args()
+
+    prefix = f'bench_{uuid.uuid4().hex[:8]}_'
+    print(f'Setting up {args.scouts} scouts...')
+    admin, event, users = setup_event(args.scouts, prefix)
+    try:
+        clients = make_clients(users)
+        url = reverse('events:mark_my_attendance', kwargs={'event_id': event.id})
+
+        print(f'Checking in with {args.concurrency} concurrent clients...')
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=args.concurrency) as executor:
+            results = list(executor.map(lambda client: check_in(client, url), clients))
+        elapsed = time.perf_counter() - started
+
+        latencies = sorted(latency * 1000 for ok, latency in results)
+        failures = sum(1 for ok, latency in results if not ok)
+        recorded = Attendance.objects.filter(event=event).count()
+
+        print(f'Requests:   {len(results)} ({failures} failed), {recorded} attendance rows recorded')
+        print(f'Wall time:  {elapsed:.2f}s ({len(results) / elapsed:.1f} check-ins/s)')
+        print(f'Latency ms: p50 {percentile(latencies, 50):.1f}  p95 {percentile(latencies, 95):.1f}  '
+              f'p99 {percentile(latencies, 99):.1f}  max {latencies[-1]:.1f}')
+    finally:
+        if not args.keep:
+            event.delete()
+            User.objects.filter(username__startswith=prefix).delete()
+
+
+if __name__ == '__main__':
+    main()